@@ -6,12 +6,14 @@ import { SafeAreaProvider } from 'react-native-safe-area-context';
 import { store } from './src/store';
 import RootNavigator from './src/navigation';
 import { setupPlayer } from './src/services/audioService';
+import { startQueueSync } from './src/services/queueService';
 import { setBackendUrl } from './src/store/settingsSlice';
 
 export default function App() {
   useEffect(() => {
     setupPlayer();
     syncBackendWithDiscovery();
+    const stopQueueSync = startQueueSync();
 
     // Keep-alive ping every 10 minutes to prevent Render sleep
     const keepAlive = setInterval(async () => {
@@ -27,7 +29,10 @@ export default function App() {
       }
     }, 10 * 60 * 1000);
 
-    return () => clearInterval(keepAlive);
+    return () => {
+      clearInterval(keepAlive);
+      stopQueueSync();
+    };
   }, []);
 
   const syncBackendWithDiscovery = async () => {
@@ -0,0 +1,265 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+
+# Endpoint classes by path prefix (first match wins); unlisted paths are never limited
+ENDPOINT_CLASSES = (
+    ("/stream-info", "interactive"),
+    ("/stream/health", "diagnostic"),
+    ("/stream", "interactive"),
+    ("/test-youtube", "diagnostic"),
+    ("/test", "diagnostic"),
+    ("/extractor/stats", "diagnostic"),
+    ("/instances", "diagnostic"),
+    ("/resolve", "batch"),
+    ("/warmup", "batch"),
+    ("/queue", "batch"),
+    ("/match", "batch"),
+    ("/proxy-image", "images"),
+    ("/search", "browse"),
+    ("/home", "browse"),
+    ("/trending", "browse"),
+    ("/playlist", "browse"),
+    ("/album", "browse"),
+    ("/artist", "browse"),
+)
+# Extraction gate priority per class, lower goes first
+PRIORITIES = {"interactive": 0, "browse": 1, "batch": 2, "images": 2, "diagnostic": 3}
+# Work started outside a request (prefetch loop, home prewarm) queues like batch work
+BACKGROUND_PRIORITY = 2
+
+
+def _limit(name: str, default: str) -> Tuple[float, float]:
+    """RATE_LIMIT_<CLASS>="rate/burst": tokens per second per client, bucket size."""
+    rate, burst = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split("/")
+    return float(rate), float(burst)
+
+
+# Batch buckets are charged per track, so they're sized in tracks
+RATE_LIMITS = {
+    "interactive": _limit("interactive", "5/30"),
+    "browse": _limit("browse", "5/30"),
+    "images": _limit("images", "50/300"),
+    "batch": _limit("batch", "2/100"),
+    "diagnostic": _limit("diagnostic", "0.1/3"),
+}
+RATE_LIMIT_CLIENTS = int(os.getenv("RATE_LIMIT_CLIENTS", "10000"))
+# Each address's own bucket is this many times a device's, so several devices
+# behind one NAT get along while a rotated X-Device-Id gains nothing
+RATE_LIMIT_ADDRESS_FACTOR = float(os.getenv("RATE_LIMIT_ADDRESS_FACTOR", "4"))
+# Proxies in front of the app that append the peer address to X-Forwarded-For
+# (1 behind Render's router, 0 when uvicorn is reached directly)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+EXTRACTION_CONCURRENCY = int(os.getenv("EXTRACTION_CONCURRENCY", "8"))
+# How long each priority may queue for an extraction slot before it's shed
+EXTRACTION_QUEUE_WAIT = {0: 15.0, 1: 8.0, 2: 4.0, 3: 0.0}
+# Beyond this many waiters, anything below interactive priority is shed at once
+EXTRACTION_QUEUE_MAX = int(os.getenv("EXTRACTION_QUEUE_MAX", "32"))
+
+_priority: ContextVar[int] = ContextVar("vortex_priority", default=BACKGROUND_PRIORITY)
+
+
+def client_ip(request: Request) -> str:
+    """The caller's address as seen by the outermost trusted proxy.
+
+    Only the last TRUSTED_PROXY_HOPS entries of X-Forwarded-For were written
+    by our proxies; anything left of them came from the client and is ignored.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if TRUSTED_PROXY_HOPS <= 0:
+        return peer
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    return hops[-TRUSTED_PROXY_HOPS] if len(hops) >= TRUSTED_PROXY_HOPS else peer
+
+
+def device_id(request: Request) -> str:
+    """The app's X-Device-Id, or ?device= where it can't set headers (<audio>)."""
+    return (request.headers.get("x-device-id") or request.query_params.get("device") or "")[:64]
+
+
+def client_key(request: Request) -> str:
+    """Address, narrowed to the device when it sent one."""
+    ip, device = client_ip(request), device_id(request)
+    return f"{ip}/{device}" if device else ip
+
+
+def endpoint_class(path: str) -> Optional[str]:
+    for prefix, name in ENDPOINT_CLASSES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return name
+    return None
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def set_priority(priority: int):
+    """Priority of the work this request starts (inherited by the tasks it spawns)."""
+    return _priority.set(priority)
+
+
+def reset_priority(token):
+    _priority.reset(token)
+
+
+class Overloaded(Exception):
+    """Raised when work is shed; `retry_after` is a hint in seconds, `priority` what was shed."""
+
+    def __init__(self, message: str, retry_after: float, priority: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.priority = priority
+
+
+class RateLimiter:
+    """Token buckets per (address, endpoint class) and per device under it, refilled continuously.
+
+    A request has to fit in both its address's bucket (RATE_LIMIT_ADDRESS_FACTOR
+    times the class limit) and its device's, so one device can't starve the
+    others on its network and inventing device ids doesn't raise the address's
+    limit. Requests without a device id (image URLs, other clients) are only
+    charged to their address. Only the most recently seen RATE_LIMIT_CLIENTS buckets are kept; a
+    forgotten one simply starts again full.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS, max_clients: int = RATE_LIMIT_CLIENTS,
+                 address_factor: float = RATE_LIMIT_ADDRESS_FACTOR):
+        self.limits = limits
+        self.max_clients = max_clients
+        self.address_factor = address_factor
+        self._buckets: "OrderedDict[tuple, list]" = OrderedDict()
+        self.admitted: Dict[str, int] = {}
+        self.limited: Dict[str, int] = {}
+
+    def _bucket(self, key: tuple, rate: float, burst: float, now: float) -> list:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def take(self, address: str, device: str, cls: str, cost: float = 1.0) -> float:
+        """Spend `cost` tokens; 0 if admitted, else seconds until they'd be available."""
+        rate, burst = self.limits[cls]
+        now = time.monotonic()
+        shared_rate, shared_burst = rate * self.address_factor, burst * self.address_factor
+        buckets = [(self._bucket((address, cls), shared_rate, shared_burst, now), shared_rate)]
+        if device:
+            buckets.append((self._bucket((address, device, cls), rate, burst, now), rate))
+        if all(bucket[0] >= cost for bucket, _ in buckets):
+            for bucket, _ in buckets:
+                bucket[0] -= cost
+            self.admitted[cls] = self.admitted.get(cls, 0) + 1
+            return 0.0
+        self.limited[cls] = self.limited.get(cls, 0) + 1
+        return max((cost - bucket[0]) / r if r > 0 else 60.0 for bucket, r in buckets if bucket[0] < cost)
+
+    def stats(self) -> dict:
+        return {
+            "limits": {cls: {"rate": rate, "burst": burst} for cls, (rate, burst) in self.limits.items()},
+            "address_factor": self.address_factor,
+            "buckets": len(self._buckets),
+            "admitted": dict(self.admitted),
+            "limited": dict(self.limited),
+        }
+
+
+class PriorityGate:
+    """At most `limit` concurrent holders; freed slots go to the lowest priority value waiting.
+
+    A waiter that can't get a slot within its priority's wait budget (or
+    arrives at a full queue with less than interactive priority) gets
+    Overloaded instead of piling on.
+    """
+
+    def __init__(self, limit: int = EXTRACTION_CONCURRENCY, max_waiting: int = EXTRACTION_QUEUE_MAX):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_use = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        # Smoothed time a slot is held, for Retry-After estimates
+        self._hold = 2.0
+        self.granted = 0
+        self.shed: Dict[int, int] = {}
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> float:
+        """Rough time until a new arrival would get a slot."""
+        return max(1.0, min(30.0, self._hold * (self.waiting + 1) / max(1, self.limit)))
+
+    def _shed(self, priority: int, message: str):
+        self.shed[priority] = self.shed.get(priority, 0) + 1
+        raise Overloaded(message, self.retry_after(), priority)
+
+    async def acquire(self, priority: int):
+        if self.in_use < self.limit and not self.waiting:
+            self.in_use += 1
+            self.granted += 1
+            return
+        wait = EXTRACTION_QUEUE_WAIT.get(priority, 0.0)
+        if wait <= 0 or (priority > 0 and self.waiting >= self.max_waiting):
+            self._shed(priority, "extraction capacity exhausted")
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            # The slot is handed over by release() (in_use already counts us)
+            await asyncio.wait_for(fut, timeout=wait)
+        except asyncio.TimeoutError:
+            self._shed(priority, f"no extraction slot within {wait:.0f}s")
+        except asyncio.CancelledError:
+            # Cancelled right after being handed a slot: pass it on
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+        self.granted += 1
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        await self.acquire(current_priority() if priority is None else priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._hold = 0.8 * self._hold + 0.2 * (time.monotonic() - start)
+            self.release()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "granted": self.granted,
+            "shed": {str(p): n for p, n in self.shed.items()},
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+rate_limiter = RateLimiter()
+extraction_gate = PriorityGate()
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import heapq
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("VortexMusic")
+
+RESOLVE_CONCURRENCY = int(os.getenv("RESOLVE_CONCURRENCY", "4"))
+RESOLVE_TRACK_TIMEOUT = float(os.getenv("RESOLVE_TRACK_TIMEOUT", "25"))
+RESOLVE_MAX_TRACKS = int(os.getenv("RESOLVE_MAX_TRACKS", "50"))
+
+
+async def resolve_batch(items: List[Any], resolve: Callable[[Any], Awaitable[Optional[dict]]],
+                        key: Callable[[Any], str], priority: Callable[[Any, int], int] = lambda item, i: i,
+                        concurrency: int = RESOLVE_CONCURRENCY,
+                        timeout: float = RESOLVE_TRACK_TIMEOUT) -> AsyncIterator[dict]:
+    """Resolve `items` with a sliding window, yielding each result as it finishes.
+
+    Unlike fixed chunks, a slow item only occupies one of the `concurrency`
+    slots; the next item (lowest priority value first) starts as soon as
+    any slot frees up. Duplicate keys are resolved once. Closing the
+    iterator early (client went away) cancels the remaining work.
+    """
+    heap = []
+    seen = set()
+    for i, item in enumerate(items):
+        k = key(item)
+        if k in seen:
+            continue
+        seen.add(k)
+        heapq.heappush(heap, (priority(item, i), i, item))
+
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def worker():
+        while heap:
+            _, _, item = heapq.heappop(heap)
+            k = key(item)
+            start = time.time()
+            try:
+                result = await asyncio.wait_for(resolve(item), timeout)
+                out = {"id": k, "ok": result is not None, "result": result}
+                if result is None:
+                    out["error"] = "No robust stream available"
+            except asyncio.TimeoutError:
+                out = {"id": k, "ok": False, "error": "timeout"}
+            except Exception as e:
+                logger.warning(f"Batch resolve failed for {k}: {str(e)}")
+                out = {"id": k, "ok": False, "error": str(e) or type(e).__name__}
+            out["elapsed_ms"] = round((time.time() - start) * 1000)
+            await results.put(out)
+
+    total = len(heap)
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, min(concurrency, total)))]
+    try:
+        for _ in range(total):
+            yield await results.get()
+    finally:
+        for w in workers:
+            w.cancel()
+
+
+def encode_result(result: dict, sse: bool = False) -> str:
+    """One streamed record: an NDJSON line or an SSE `data:` event."""
+    body = json.dumps(result, separators=(",", ":"))
+    return f"event: track\ndata: {body}\n\n" if sse else body + "\n"
@@ -0,0 +1,284 @@
+"""Offline load test for the backend against local upstream stand-ins.
+
+Run from backend/:
+
+    python -m bench.run --profile realistic --concurrency 16 --requests 300
+    python -m bench.run --json before.json
+    python -m bench.run --compare before.json
+
+The app runs as a real uvicorn subprocess pointed at bench/stubs.py
+(recorded Saavn/Deezer/Piped/Invidious/CDN responses with the latency and
+failure profile from bench/profiles.json), with a throwaway in-memory cache
+backend and disk cache directories, so runs are repeatable and comparable
+across commits.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from bench.stubs import CDN_FILE_BYTES, UpstreamStubs, load_profile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("search", "home", "stream-info", "stream")
+SEARCH_QUERIES = [
+    "arijit singh", "kesariya", "tum hi ho", "heeriye", "chaleya", "satranga", "apna bana le",
+    "o maahi", "pehle bhi main", "jhoome jo pathaan", "raataan lambiyan", "kahani suno",
+    "tere vaaste", "jubin nautiyal", "shreya ghoshal", "romantic hindi", "punjabi hits", "lofi",
+    "bollywood 2023", "sad songs",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted `values`."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def rss_kb(pid: int) -> Dict[str, int]:
+    """Current and peak resident memory of `pid` (Linux /proc)."""
+    usage = {"rss_kb": 0, "peak_rss_kb": 0}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rss_kb"] = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    usage["peak_rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def track_ids(count: int) -> List[dict]:
+    """`count` distinct tracks, alternating YouTube-style ids and Saavn pids."""
+    tracks = []
+    for n in range(count):
+        if n % 2:
+            tracks.append({"id": f"saavn_bench{n:05d}"})
+        else:
+            tracks.append({"id": f"bench{n:06d}"[:11]})
+    return tracks
+
+
+def build_requests(scenario: str, args, rng: random.Random) -> Callable[[int], dict]:
+    """Request factory for one scenario: n -> {method, url, params, headers}."""
+    tracks = track_ids(args.ids)
+
+    if scenario == "search":
+        return lambda n: {"url": "/search", "params": {"q": SEARCH_QUERIES[n % len(SEARCH_QUERIES)]}}
+    if scenario == "home":
+        return lambda n: {"url": "/home"}
+    if scenario == "stream-info":
+        return lambda n: {"url": "/stream-info", "params": {"id": tracks[n % len(tracks)]["id"]}}
+
+    def stream(n):
+        start = rng.randrange(0, max(1, args.file_bytes - args.range_bytes))
+        return {
+            "url": "/stream",
+            "params": {"id": tracks[n % len(tracks)]["id"]},
+            "headers": {"Range": f"bytes={start}-{start + args.range_bytes - 1}"},
+        }
+    return stream
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: str, args, pid: int) -> dict:
+    make = build_requests(scenario, args, random.Random(args.seed))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    body_bytes = 0
+    counter = iter(range(args.requests))
+
+    async def worker():
+        nonlocal body_bytes
+        for n in counter:
+            req = make(n)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(
+                    req.get("method", "GET"), req["url"], params=req.get("params"), headers=req.get("headers")
+                )
+                body_bytes += len(resp.content)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mb_per_s": round(body_bytes / elapsed / 1e6, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        **rss_kb(pid),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(stubs: UpstreamStubs, port: int, workdir: str, extra_env: Dict[str, str]) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        **stubs.env(),
+        "CACHE_BACKEND": "memory",
+        "SEGMENT_CACHE_DIR": os.path.join(workdir, "segments"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "images"),
+        "INSTANCE_PROBE_INTERVAL": "0",
+        # Every load-test request comes from one client; measure the backend, not its rate limits
+        **{f"RATE_LIMIT_{cls}": "1000000/1000000" for cls in ("INTERACTIVE", "BROWSE", "IMAGES", "BATCH", "DIAGNOSTIC")},
+        **extra_env,
+    }
+    # The backend logs every upstream call at INFO; keep that out of the report
+    log = open(os.path.join(workdir, "backend.log"), "wb")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with {proc.returncode}")
+        try:
+            if (await client.get("/ping")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("backend did not become ready")
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    print(f"\nprofile={report['profile']} concurrency={report['concurrency']} "
+          f"requests={report['requests']} revision={report['revision']}")
+    header = f"{'scenario':<12} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report["scenarios"].items():
+        print(f"{name:<12} {r['throughput_rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} "
+              f"{r['errors']:>7} {r['rss_kb'] / 1024:>8.1f}")
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        if base:
+            def delta(key):
+                return f"{(r[key] - base[key]) / base[key] * 100:+.1f}%" if base[key] else "n/a"
+            print(f"{'  vs base':<12} {delta('throughput_rps'):>8} {delta('p50_ms'):>9} {delta('p95_ms'):>9} "
+                  f"{delta('p99_ms'):>9} {r['errors'] - base['errors']:>+7} {delta('rss_kb'):>8}")
+    memory = report["memory"]
+    print(f"\nbackend memory: start {memory['start_rss_kb'] / 1024:.1f} MB, "
+          f"end {memory['rss_kb'] / 1024:.1f} MB, peak {memory['peak_rss_kb'] / 1024:.1f} MB")
+    print(f"upstream requests: {report['upstream_hits']}")
+
+
+async def main(args):
+    profile = load_profile(args.profile)
+    stubs = UpstreamStubs(profile, seed=args.seed)
+    await stubs.start()
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    workdir = tempfile.mkdtemp(prefix="vortex-bench-")
+    port = args.port or free_port()
+    proc = start_app(stubs, port, workdir, extra_env)
+    print(f"backend log: {os.path.join(workdir, 'backend.log')}")
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits,
+                                     timeout=args.timeout) as client:
+            await wait_ready(client, proc)
+            start_memory = rss_kb(proc.pid)
+            report = {
+                "revision": git_revision(),
+                "profile": args.profile,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "ids": args.ids,
+                "env": extra_env,
+                "scenarios": {},
+            }
+            for scenario in args.scenarios:
+                print(f"running {scenario} ...", flush=True)
+                report["scenarios"][scenario] = await run_scenario(client, scenario, args, proc.pid)
+            report["memory"] = {"start_rss_kb": start_memory["rss_kb"], **rss_kb(proc.pid)}
+            report["upstream_hits"] = dict(stubs.hits)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        await stubs.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline backend benchmark against recorded upstream fixtures.")
+    parser.add_argument("--profile", default="fast",
+                        help="profile name from bench/profiles.json, or a path to a profile JSON file")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda v: [s for s in v.split(",") if s], help=f"comma list of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--ids", type=int, default=50, help="distinct tracks for stream-info/stream")
+    parser.add_argument("--range-bytes", type=int, default=256 * 1024, help="size of each ranged /stream read")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra backend environment, e.g. --env EXTRACTION_MODE=race")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="baseline report (from --json) to diff against")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.file_bytes = CDN_FILE_BYTES
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
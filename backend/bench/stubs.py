@@ -0,0 +1,295 @@
+import os
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+from typing import Dict, Optional
+
+from aiohttp import web
+from Crypto.Cipher import DES
+
+from saavn_crypto import SAAVN_DES_KEY
+from stream_proxy import RangeNotSatisfiable, parse_range, resolve_range
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles.json")
+# Size of every stand-in audio file on the CDN
+CDN_FILE_BYTES = int(os.getenv("BENCH_CDN_FILE_BYTES", str(4 * 1024 * 1024)))
+CDN_CHUNK_SIZE = 64 * 1024
+
+_ENC_RE = re.compile(r"\{ENC:([^}]+)\}")
+_CONTENT_TYPES = {".mp4": "audio/mp4", ".m4a": "audio/mp4", ".webm": "audio/webm", ".mp3": "audio/mpeg",
+                  ".jpg": "image/jpeg"}
+
+
+def load_profile(name: str) -> Dict[str, dict]:
+    """Latency/failure settings per service from profiles.json, or a JSON file path."""
+    path = name if name.endswith(".json") and os.path.exists(name) else PROFILES_PATH
+    with open(path) as f:
+        data = json.load(f)
+    return data if path == name else data[name]
+
+
+def _encrypt(url: str) -> str:
+    pad = DES.block_size - len(url) % DES.block_size
+    blob = DES.new(SAAVN_DES_KEY, DES.MODE_ECB).encrypt(url.encode() + bytes([pad]) * pad)
+    return base64.b64encode(blob).decode()
+
+
+class UpstreamStubs:
+    """Local stand-ins for Saavn, Deezer, Piped, Invidious and the media CDN.
+
+    Responses are the recorded fixtures in bench/fixtures with their
+    placeholders filled in ({CDN}, {ID}, {EXPIRE}, {LISTID}, {ENC:url}),
+    so every URL the backend follows leads back here. Each service gets
+    the latency, jitter, failure and bandwidth settings of the active
+    profile; `hits` counts requests per service.
+    """
+
+    def __init__(self, profile: Dict[str, dict], seed: int = 1):
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.hits: Dict[str, int] = {}
+        self.base_url = ""
+        self._fixtures: Dict[str, str] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._audio = hashlib.shake_256(b"vortex-bench").digest(CDN_FILE_BYTES)
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points the backend at these stubs."""
+        return {
+            "SAAVN_API_URL": f"{self.base_url}/saavn/api.php",
+            "DEEZER_API_URL": f"{self.base_url}/deezer",
+            "PIPED_INSTANCES": f"{self.base_url}/piped",
+            "INVIDIOUS_INSTANCES": f"{self.base_url}/invidious",
+            # Everything else would reach the real YouTube/YouTube Music/SoundCloud
+            "EXTRACTION_METHODS": "Piped,Invidious",
+            "SEARCH_PROVIDERS": "saavn,deezer",
+        }
+
+    def fixture(self, name: str, **values) -> str:
+        text = self._fixtures.get(name)
+        if text is None:
+            with open(os.path.join(FIXTURES_DIR, f"{name}.json")) as f:
+                text = self._fixtures[name] = f.read()
+        values = {"CDN": f"{self.base_url}/cdn", "EXPIRE": str(int(time.time()) + 6 * 3600), **values}
+        for key, value in values.items():
+            text = text.replace("{" + key + "}", value)
+        return _ENC_RE.sub(lambda m: _encrypt(m.group(1)), text)
+
+    async def _behave(self, service: str) -> Optional[web.Response]:
+        """Apply the profile's delay; a failure response if this request should fail."""
+        self.hits[service] = self.hits.get(service, 0) + 1
+        conf = self.profile.get(service) or self.profile.get("default") or {}
+        delay = conf.get("latency_ms", 0) + self.random.uniform(0, conf.get("jitter_ms", 0))
+        if self.random.random() < conf.get("timeout_rate", 0):
+            await asyncio.sleep(conf.get("timeout_ms", 10000) / 1000)
+            return web.Response(status=504)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.random.random() < conf.get("failure_rate", 0):
+            return web.Response(status=conf.get("failure_status", 502))
+        return None
+
+    def _json(self, name: str, **values) -> web.Response:
+        return web.Response(text=self.fixture(name, **values), content_type="application/json")
+
+    async def saavn(self, request: web.Request) -> web.StreamResponse:
+        failed = await self._behave("saavn")
+        if failed:
+            return failed
+        call = request.query.get("__call")
+        if call == "autocomplete.get":
+            return self._json("saavn_autocomplete")
+        if call == "content.getCharts":
+            return self._json("saavn_charts")
+        if call == "playlist.getDetails":
+            return self._json("saavn_playlist", LISTID=request.query.get("listid", ""))
+        if call in ("content.getAlbumDetails", "artist.getArtistPageDetails"):
+            # Albums and artist pages reuse the recorded playlist's songs
+            songs = json.loads(self.fixture("saavn_playlist", LISTID=""))["songs"]
+            if call == "content.getAlbumDetails":
+                return web.json_response({"albumid": request.query.get("albumid"), "title": "Bench Album",
+                                          "primary_artists": "Arijit Singh", "year": "2023", "songs": songs})
+            return web.json_response({"artistId": request.query.get("artistId"), "name": "Arijit Singh",
+                                      "topSongs": {"songs": songs, "total": len(songs)}})
+        if call == "song.getDetails":
+            # Answer for any pid, cycling through the recorded songs
+            recorded = json.loads(self.fixture("saavn_song_details"))["songs"]
+            pids = [p for p in request.query.get("pids", "").split(",") if p]
+            songs = {}
+            for pid in pids:
+                song = dict(recorded[int(hashlib.md5(pid.encode()).hexdigest(), 16) % len(recorded)])
+                song["id"] = pid
+                songs[pid] = song
+            return web.json_response(songs)
+        return web.json_response({"error": f"unknown call {call}"}, status=400)
+
+    async def deezer(self, request: web.Request) -> web.StreamResponse:
+        return await self._behave("deezer") or self._json("deezer_search")
+
+    async def piped(self, request: web.Request) -> web.StreamResponse:
+        return await self._behave("piped") or self._json("piped_streams", ID=request.match_info["id"])
+
+    async def invidious(self, request: web.Request) -> web.StreamResponse:
+        return await self._behave("invidious") or self._json("invidious_video", ID=request.match_info["id"])
+
+    async def healthcheck(self, request: web.Request) -> web.StreamResponse:
+        return web.json_response({})
+
+    async def cdn(self, request: web.Request) -> web.StreamResponse:
+        failed = await self._behave("cdn")
+        if failed:
+            return failed
+        name = request.match_info["path"]
+        content_type = _CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        size = len(self._audio)
+        status, start, end = 200, 0, size - 1
+        rng = parse_range(request.headers.get("Range"))
+        if rng:
+            try:
+                start, end = resolve_range(rng, size)
+            except RangeNotSatisfiable:
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+            status = 206
+        headers = {"Accept-Ranges": "bytes", "Content-Type": content_type, "Content-Length": str(end - start + 1)}
+        if status == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        resp = web.StreamResponse(status=status, headers=headers)
+        await resp.prepare(request)
+        if request.method == "HEAD":
+            return resp
+
+        conf = self.profile.get("cdn") or self.profile.get("default") or {}
+        bandwidth = conf.get("bandwidth_kbps", 0) * 1000 / 8
+        pos = start
+        while pos <= end:
+            chunk = self._audio[pos:min(pos + CDN_CHUNK_SIZE, end + 1)]
+            await resp.write(chunk)
+            pos += len(chunk)
+            if bandwidth:
+                await asyncio.sleep(len(chunk) / bandwidth)
+        return resp
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/saavn/api.php", self.saavn)
+        app.router.add_get("/deezer/search", self.deezer)
+        app.router.add_get("/piped/streams/{id}", self.piped)
+        app.router.add_get("/piped/healthcheck", self.healthcheck)
+        app.router.add_get("/invidious/api/v1/videos/{id}", self.invidious)
+        app.router.add_get("/invidious/api/v1/stats", self.healthcheck)
+        app.router.add_get("/cdn/{path:.+}", self.cdn)  # also answers HEAD
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class RespStub:
+    """In-memory stand-in for a Redis server, enough for RedisBackend.
+
+    Speaks RESP2 over TCP and supports AUTH, SELECT, PING, GET, SET (with
+    EX/PX), DEL and FLUSHDB, with per-database expiry. `commands` counts
+    requests per command name.
+    """
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.commands: Dict[str, int] = {}
+        self._dbs: Dict[int, Dict[bytes, tuple]] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.url = ""
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[list]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.strip().split()  # inline command (redis-cli style)
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value: Optional[bytes]) -> bytes:
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _execute(self, session: dict, args: list) -> bytes:
+        name = args[0].decode().upper()
+        self.commands[name] = self.commands.get(name, 0) + 1
+        if name == "AUTH":
+            if self.password is None or args[-1].decode() != self.password:
+                return b"-WRONGPASS invalid username-password pair\r\n"
+            session["authed"] = True
+            return b"+OK\r\n"
+        if not session["authed"]:
+            return b"-NOAUTH Authentication required.\r\n"
+        data = self._dbs.setdefault(session["db"], {})
+        now = time.time()
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name == "SELECT":
+            session["db"] = int(args[1])
+            return b"+OK\r\n"
+        if name == "GET":
+            entry = data.get(args[1])
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                del data[args[1]]
+                entry = None
+            return self._bulk(entry[0] if entry else None)
+        if name == "SET":
+            expiry = None
+            options = [a.decode().upper() for a in args[3:]]
+            for i, option in enumerate(options[:-1]):
+                if option == "PX":
+                    expiry = now + int(options[i + 1]) / 1000
+                elif option == "EX":
+                    expiry = now + int(options[i + 1])
+            data[args[1]] = (args[2], expiry)
+            return b"+OK\r\n"
+        if name == "DEL":
+            return b":%d\r\n" % sum(1 for key in args[1:] if data.pop(key, None) is not None)
+        if name == "FLUSHDB":
+            data.clear()
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = {"authed": self.password is None, "db": 0}
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if not args:
+                    break
+                writer.write(self._execute(session, args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ""
+        self.url = f"redis://{auth}{host}:{port}/0"
+        return self.url
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+import urllib.parse
+from typing import Any, Optional
+
+logger = logging.getLogger("VortexMusic")
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_SQLITE_PATH = os.getenv(
+    "CACHE_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "vortex_cache.db"),
+)
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+
+
+class CacheBackend:
+    """Shared key/value store behind the in-process caches.
+
+    Values are JSON-serialisable objects with a TTL. Backend failures are
+    logged and treated as misses so a broken cache never breaks a request.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = await self._get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache backend {self.name} get failed: {str(e)}")
+            return None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        try:
+            await self._set(key, json.dumps(value, default=str), ttl)
+            self.writes += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache backend {self.name} set failed: {str(e)}")
+
+    async def delete(self, key: str):
+        try:
+            await self._delete(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cache backend {self.name} delete failed: {str(e)}")
+
+    async def purge_expired(self) -> int:
+        return 0
+
+    async def run_purge_loop(self, interval: float = 300.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.purge_expired()
+                if removed:
+                    logger.info(f"Cache backend {self.name} purged {removed} entries")
+            except Exception as e:
+                logger.warning(f"Cache backend {self.name} purge failed: {str(e)}")
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+    async def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def _set(self, key: str, raw: str, ttl: float):
+        raise NotImplementedError
+
+    async def _delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Process-local backend, equivalent to the old module-level dicts."""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._data = {}
+
+    async def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._data[key]
+            return None
+        return entry[0]
+
+    async def _set(self, key, raw, ttl):
+        self._data[key] = (raw, time.time() + ttl)
+
+    async def _delete(self, key):
+        self._data.pop(key, None)
+
+    async def purge_expired(self):
+        now = time.time()
+        expired = [k for k, v in self._data.items() if v[1] <= now]
+        for k in expired:
+            del self._data[k]
+        return len(expired)
+
+
+class SQLiteBackend(CacheBackend):
+    """File-backed backend shared by every uvicorn worker on the host.
+
+    WAL mode lets workers read while another writes; each thread of the
+    default executor keeps its own connection.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Open eagerly so a bad path fails at startup, not on the first request
+        self._conn()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expiry REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def _get_sync(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expiry > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_sync(self, key, raw, ttl):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expiry) VALUES (?, ?, ?)",
+            (key, raw, time.time() + ttl),
+        )
+
+    def _delete_sync(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _purge_sync(self):
+        return self._conn().execute("DELETE FROM cache WHERE expiry <= ?", (time.time(),)).rowcount
+
+    async def _get(self, key):
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def _set(self, key, raw, ttl):
+        await asyncio.to_thread(self._set_sync, key, raw, ttl)
+
+    async def _delete(self, key):
+        await asyncio.to_thread(self._delete_sync, key)
+
+    async def purge_expired(self):
+        return await asyncio.to_thread(self._purge_sync)
+
+
+class RedisBackend(CacheBackend):
+    """Minimal RESP client (GET/SET PX/DEL) for Redis or any protocol-compatible server."""
+
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_REDIS_URL):
+        super().__init__()
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), timeout=2.0
+        )
+        try:
+            if self.password:
+                await asyncio.wait_for(self._roundtrip("AUTH", self.password), timeout=2.0)
+            if self.db:
+                await asyncio.wait_for(self._roundtrip("SELECT", str(self.db)), timeout=2.0)
+        except Exception:
+            # Never leave an unauthenticated (or wrong-db) connection behind for the next command
+            self._writer.close()
+            self._reader, self._writer = None, None
+            raise
+
+    async def _roundtrip(self, *args):
+        payload = f"*{len(args)}\r\n".encode()
+        for arg in args:
+            data = arg.encode() if isinstance(arg, str) else arg
+            payload += b"$%d\r\n%s\r\n" % (len(data), data)
+        self._writer.write(payload)
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RuntimeError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if prefix == b"*":
+            return [await self._read_reply() for _ in range(int(body))]
+        raise RuntimeError(f"Unexpected RESP reply: {line!r}")
+
+    async def _command(self, *args):
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                await self._connect()
+            try:
+                return await asyncio.wait_for(self._roundtrip(*args), timeout=2.0)
+            except Exception:
+                # Drop the connection so the next command reconnects cleanly
+                self._writer.close()
+                self._writer = None
+                raise
+
+    async def _get(self, key):
+        return await self._command("GET", key)
+
+    async def _set(self, key, raw, ttl):
+        await self._command("SET", key, raw, "PX", str(int(ttl * 1000)))
+
+    async def _delete(self, key):
+        await self._command("DEL", key)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def create_backend(kind: str = CACHE_BACKEND) -> CacheBackend:
+    """Build the configured backend, falling back to memory if it can't start."""
+    try:
+        if kind == "sqlite":
+            return SQLiteBackend()
+        if kind == "redis":
+            return RedisBackend()
+    except Exception as e:
+        logger.warning(f"Cache backend {kind} unavailable, using memory: {str(e)}")
+    return MemoryBackend()
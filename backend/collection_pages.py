@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache_backends import CacheBackend
+
+logger = logging.getLogger("VortexMusic")
+
+# Raw playlist/album/artist listings change slowly (charts refresh a few times a day)
+COLLECTION_TTL = float(os.getenv("COLLECTION_TTL", "1800"))
+COLLECTION_PAGE_SIZE = int(os.getenv("COLLECTION_PAGE_SIZE", "25"))
+COLLECTION_MAX_PAGE_SIZE = 100
+COLLECTION_MEMORY_ENTRIES = int(os.getenv("COLLECTION_MEMORY_ENTRIES", "200"))
+# Formatted pages, per collection version, base URL, offset and size
+COLLECTION_PAGE_ENTRIES = int(os.getenv("COLLECTION_PAGE_ENTRIES", "1000"))
+
+Fetcher = Callable[[str], Awaitable[Optional[dict]]]
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(f"o:{offset}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """Offset from a cursor returned as `next_cursor`; ValueError if it isn't one."""
+    if not cursor:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        tag, offset = raw.split(":", 1)
+        if tag != "o" or int(offset) < 0:
+            raise ValueError
+        return int(offset)
+    except Exception:
+        raise ValueError("invalid cursor") from None
+
+
+class CollectionPages:
+    """Playlists, albums and artist top tracks served a page at a time.
+
+    Each collection is fetched once (concurrent requests share the fetch)
+    and its raw song list kept in memory and the cache backend for
+    COLLECTION_TTL. Songs are only formatted when a page containing them
+    is asked for, and formatted pages are kept per base URL, so paging
+    through a 300 song chart costs one upstream call and one format pass
+    per page.
+    """
+
+    def __init__(self, fetchers: Dict[str, Fetcher], format_page: Callable[[List[dict], str], List[dict]],
+                 backend: Optional[CacheBackend] = None):
+        self.fetchers = fetchers
+        self.format_page = format_page
+        self.backend = backend
+        self._collections: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self._pages: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.fetches = 0
+        self.hits = 0
+        self.page_hits = 0
+        self.page_misses = 0
+
+    @staticmethod
+    def _version(meta: dict, songs: List[dict]) -> str:
+        listing = json.dumps(meta, sort_keys=True, default=str) + "|".join(str(s.get("id")) for s in songs)
+        return hashlib.sha1(listing.encode()).hexdigest()[:16]
+
+    def _remember(self, key, entry: dict):
+        self._collections[key] = entry
+        self._collections.move_to_end(key)
+        while len(self._collections) > COLLECTION_MEMORY_ENTRIES:
+            self._collections.popitem(last=False)
+
+    async def collection(self, kind: str, collection_id: str) -> Optional[dict]:
+        """{"meta", "songs" (raw), "version", "fetched_at"}, or None if upstream has nothing."""
+        key = (kind, collection_id)
+        entry = self._collections.get(key)
+        if entry is not None and time.time() - entry["fetched_at"] < COLLECTION_TTL:
+            self._collections.move_to_end(key)
+            self.hits += 1
+            return entry
+        if self.backend is not None:
+            stored = await self.backend.get(f"collection:{kind}:{collection_id}")
+            if stored and time.time() - stored["fetched_at"] < COLLECTION_TTL:
+                self._remember(key, stored)
+                self.hits += 1
+                return stored
+
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch(kind, collection_id))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(self, kind: str, collection_id: str) -> Optional[dict]:
+        self.fetches += 1
+        data = await self.fetchers[kind](collection_id)
+        if not data or not data.get("songs"):
+            return None
+        songs = [s for s in data.pop("songs") if isinstance(s, dict)]
+        entry = {"meta": data, "songs": songs, "version": self._version(data, songs), "fetched_at": time.time()}
+        self._remember((kind, collection_id), entry)
+        if self.backend is not None:
+            await self.backend.set(f"collection:{kind}:{collection_id}", entry, COLLECTION_TTL)
+        return entry
+
+    def etag(self, entry: dict, base_url: str, offset: int, limit: int, *variant) -> str:
+        tag = "|".join(str(part) for part in (entry["version"], base_url, offset, limit, *variant))
+        return '"' + hashlib.sha1(tag.encode()).hexdigest() + '"'
+
+    def items(self, entry: dict, base_url: str, offset: int, limit: int) -> List[dict]:
+        """The formatted songs of one page, formatting only what isn't cached yet."""
+        key = (entry["version"], base_url, offset, limit)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            self.page_hits += 1
+            return page
+        self.page_misses += 1
+        page = self.format_page(entry["songs"][offset:offset + limit], base_url)
+        self._pages[key] = page
+        while len(self._pages) > COLLECTION_PAGE_ENTRIES:
+            self._pages.popitem(last=False)
+        return page
+
+    def stats(self) -> dict:
+        return {
+            "collections": len(self._collections),
+            "pages": len(self._pages),
+            "fetches": self.fetches,
+            "hits": self.hits,
+            "page_hits": self.page_hits,
+            "page_misses": self.page_misses,
+            "ttl": COLLECTION_TTL,
+        }
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger("VortexMusic")
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a backend's queue is full; callers should fail fast."""
+
+
+class _Backend:
+    def __init__(self, name: str, executor: Executor, max_workers: int, max_queue: int, kind: str):
+        self.name = name
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.total_time = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": max(0, self.in_flight - self.max_workers),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+            "avg_time": round(self.total_time / self.completed, 3) if self.completed else None,
+        }
+
+
+class BlockingExecutor:
+    """Bounded pools for blocking library calls (yt-dlp, pytubefix, ytmusicapi, ...).
+
+    Every backend gets its own pool so a burst of slow yt-dlp extractions
+    can't starve quick ytmusic lookups, and none of them run on the event
+    loop. A timeout hands control back to the caller immediately; a call
+    that already started keeps its worker until it returns, which is why
+    the pools are bounded and over-long queues are rejected outright.
+    """
+
+    def __init__(self):
+        self._backends: Dict[str, _Backend] = {}
+
+    def register(self, name: str, max_workers: int, kind: str = "thread", max_queue: int = 32):
+        if kind == "process":
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"blocking-{name}")
+        self._backends[name] = _Backend(name, executor, max_workers, max_queue, kind)
+
+    async def run(self, name: str, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        backend = self._backends[name]
+        if backend.in_flight >= backend.max_workers + backend.max_queue:
+            backend.rejected += 1
+            raise ExecutorSaturated(f"{name} executor queue is full")
+
+        loop = asyncio.get_running_loop()
+        backend.in_flight += 1
+        backend.submitted += 1
+        start = time.time()
+        cfut = backend.executor.submit(partial(fn, *args, **kwargs))
+
+        def _release():
+            backend.in_flight -= 1
+
+        def _done(f):
+            # Runs in the worker (or pool manager) thread once the call really ends
+            try:
+                loop.call_soon_threadsafe(_release)
+            except RuntimeError:
+                pass
+
+        cfut.add_done_callback(_done)
+        fut = asyncio.wrap_future(cfut, loop=loop)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(fut), timeout=timeout)
+        except asyncio.TimeoutError:
+            backend.timed_out += 1
+            # Drops the call if it hasn't started; a running one finishes in its worker
+            fut.cancel()
+            raise
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception:
+            backend.failed += 1
+            raise
+        backend.completed += 1
+        backend.total_time += time.time() - start
+        return result
+
+    def stats(self) -> dict:
+        return {name: b.stats() for name, b in self._backends.items()}
+
+    def shutdown(self):
+        for b in self._backends.values():
+            b.executor.shutdown(wait=False, cancel_futures=True)
+
+
+blocking = BlockingExecutor()
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from cache_backends import CacheBackend
+
+logger = logging.getLogger("VortexMusic")
+
+HOME_REFRESH_INTERVAL = float(os.getenv("HOME_REFRESH_INTERVAL", "900"))
+# Last good snapshot survives restarts for this long
+HOME_SNAPSHOT_TTL = 24 * 3600.0
+
+
+class HomeSnapshot:
+    """Prebuilt /home payload, rebuilt in the background on a schedule.
+
+    Payloads embed the request base URL (thumbnail proxy links), so one
+    snapshot is kept per base URL seen. A failed rebuild keeps serving the
+    last good snapshot.
+    """
+
+    def __init__(self, build: Callable[[str], Awaitable[dict]], backend: Optional[CacheBackend] = None,
+                 after_refresh: Optional[Callable[[dict], Awaitable[None]]] = None):
+        self.build = build
+        self.backend = backend
+        self.after_refresh = after_refresh
+        self._snapshots: Dict[str, dict] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._tasks = set()
+        self.builds = 0
+        self.failures = 0
+
+    @staticmethod
+    def _etag(payload: dict) -> str:
+        body = json.dumps({k: v for k, v in payload.items() if k != "generated_at"}, sort_keys=True, default=str)
+        return '"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+
+    def _backend_key(self, base_url: str) -> str:
+        return f"home:{hashlib.sha1(base_url.encode()).hexdigest()}"
+
+    async def get(self, base_url: str) -> dict:
+        snapshot = self._snapshots.get(base_url)
+        if snapshot is not None:
+            return snapshot
+        if self.backend is not None:
+            stored = await self.backend.get(self._backend_key(base_url))
+            if stored:
+                self._snapshots[base_url] = stored
+                if time.time() - stored["built_at"] > HOME_REFRESH_INTERVAL:
+                    asyncio.ensure_future(self.refresh(base_url))
+                return stored
+        return await self.refresh(base_url)
+
+    async def refresh(self, base_url: str) -> dict:
+        """Rebuild one snapshot; concurrent callers share the build."""
+        fut = self._inflight.get(base_url)
+        if fut is None:
+            fut = asyncio.ensure_future(self._rebuild(base_url))
+            self._inflight[base_url] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(base_url, None))
+        return await asyncio.shield(fut)
+
+    async def _rebuild(self, base_url: str) -> dict:
+        start = time.time()
+        try:
+            payload = await self.build(base_url)
+        except Exception as e:
+            payload = None
+            logger.warning(f"Home snapshot build failed: {str(e)}")
+        previous = self._snapshots.get(base_url)
+        if not payload or not payload.get("trending"):
+            self.failures += 1
+            if previous is not None:
+                return previous
+            # Nothing better to serve yet; don't cache an empty page
+            return {"payload": payload or {"trending": [], "recently_played": []}, "etag": None, "built_at": 0}
+
+        self.builds += 1
+        snapshot = {"payload": payload, "etag": self._etag(payload), "built_at": time.time()}
+        self._snapshots[base_url] = snapshot
+        logger.info(f"Home snapshot rebuilt for {base_url} in {time.time() - start:.2f}s")
+        if self.backend is not None:
+            await self.backend.set(self._backend_key(base_url), snapshot, HOME_SNAPSHOT_TTL)
+        if self.after_refresh is not None:
+            # e.g. pre-warming stream extraction; never delays the snapshot itself
+            task = asyncio.ensure_future(self.after_refresh(payload))
+            self._tasks.add(task)
+            task.add_done_callback(self._hook_done)
+        return snapshot
+
+    def _hook_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Home snapshot post-refresh hook failed: {str(task.exception())}")
+
+    async def run_refresh_loop(self, interval: float = HOME_REFRESH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            for base_url in list(self._snapshots):
+                await self.refresh(base_url)
+
+    def stats(self) -> dict:
+        return {
+            "snapshots": {
+                base: {"etag": s["etag"], "age": round(time.time() - s["built_at"], 1)}
+                for base, s in self._snapshots.items()
+            },
+            "builds": self.builds,
+            "failures": self.failures,
+            "refresh_interval": HOME_REFRESH_INTERVAL,
+        }
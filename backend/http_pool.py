@@ -0,0 +1,226 @@
+import os
+import time
+import logging
+from typing import Dict, Optional
+
+import httpx
+import aiohttp
+
+from metrics import upstream_seconds
+from tracing import start_span
+
+logger = logging.getLogger("VortexMusic")
+
+try:
+    import h2  # noqa: F401  (enables httpx HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Pool tuning (override via environment)
+MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+STREAM_POOL_LIMIT = int(os.getenv("STREAM_POOL_LIMIT", "200"))
+STREAM_POOL_LIMIT_PER_HOST = int(os.getenv("STREAM_POOL_LIMIT_PER_HOST", "50"))
+DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+
+def _span_url(url) -> str:
+    """URL without its query string, which carries signatures and client ids."""
+    return f"{url.scheme}://{url.host}{url.path}"
+
+
+class _UpstreamStats:
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "errors": self.errors,
+            "connections_opened": self.connections_opened,
+            "connections_reused": self.connections_reused,
+        }
+
+
+class _PooledClient(httpx.AsyncClient):
+    """AsyncClient that also closes out metrics and spans of requests that raise
+    (timeouts, connect errors), which never reach the response hook."""
+
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = upstream
+
+    async def send(self, request: httpx.Request, **kwargs) -> httpx.Response:
+        try:
+            return await super().send(request, **kwargs)
+        except Exception as e:
+            start = request.extensions.get("vortex_start")
+            if start is not None:
+                upstream_seconds.observe(time.perf_counter() - start, pool=self.upstream, status="error")
+            span = request.extensions.get("vortex_span")
+            if span is not None:
+                span.end(e)
+            raise
+
+
+class HTTPPool:
+    """Keep-alive connection pools shared by every upstream call.
+
+    One httpx client per upstream (Saavn, Deezer, Piped, ...) so a slow host
+    can't exhaust the connections of another, plus a single aiohttp session
+    for long-lived audio proxying.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._stats: Dict[str, _UpstreamStats] = {}
+        self.started_at = time.time()
+
+    def _stats_for(self, upstream: str) -> _UpstreamStats:
+        if upstream not in self._stats:
+            self._stats[upstream] = _UpstreamStats()
+        return self._stats[upstream]
+
+    def client(self, upstream: str = "default") -> httpx.AsyncClient:
+        """Return the pooled client for an upstream, creating it on first use."""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            stats = self._stats_for(upstream)
+
+            def tracer():
+                # httpcore events for one request: a request that sends its headers
+                # without having connected first went out on a pooled connection
+                connected = False
+
+                async def trace(event_name, info):
+                    nonlocal connected
+                    if event_name == "connection.connect_tcp.complete":
+                        connected = True
+                        stats.connections_opened += 1
+                    elif event_name.endswith(".send_request_headers.started") and not connected:
+                        stats.connections_reused += 1
+                return trace
+
+            async def on_request(request):
+                stats.requests += 1
+                request.extensions["trace"] = tracer()
+                request.extensions["vortex_start"] = time.perf_counter()
+                if upstream != "otlp":  # don't trace the trace exporter
+                    request.extensions["vortex_span"] = start_span(
+                        f"{request.method} {request.url.host}", "client", pool=upstream,
+                        **{"http.method": request.method, "http.url": _span_url(request.url)}
+                    )
+
+            async def on_response(response):
+                stats.responses += 1
+                if response.status_code >= 500:
+                    stats.errors += 1
+                start = response.request.extensions.get("vortex_start")
+                if start is not None:
+                    upstream_seconds.observe(time.perf_counter() - start, pool=upstream, status=response.status_code)
+                span = response.request.extensions.get("vortex_span")
+                if span is not None:
+                    span.set(**{"http.status_code": response.status_code})
+                    span.end(f"HTTP {response.status_code}" if response.status_code >= 500 else None)
+
+            client = _PooledClient(
+                upstream,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                event_hooks={"request": [on_request], "response": [on_response]},
+            )
+            self._clients[upstream] = client
+        return client
+
+    def session(self) -> aiohttp.ClientSession:
+        """Shared aiohttp session used for streaming audio bytes."""
+        if self._session is None or self._session.closed:
+            stats = self._stats_for("stream")
+
+            async def on_request_start(session, ctx, params):
+                stats.requests += 1
+                ctx.start = time.perf_counter()
+                ctx.span = start_span(
+                    f"{params.method} {params.url.host}", "client", pool="stream",
+                    **{"http.method": params.method, "http.url": _span_url(params.url)}
+                )
+
+            async def on_request_end(session, ctx, params):
+                stats.responses += 1
+                upstream_seconds.observe(time.perf_counter() - ctx.start, pool="stream", status=params.response.status)
+                ctx.span.set(**{"http.status_code": params.response.status})
+                ctx.span.end(f"HTTP {params.response.status}" if params.response.status >= 500 else None)
+
+            async def on_request_exception(session, ctx, params):
+                stats.errors += 1
+                upstream_seconds.observe(time.perf_counter() - ctx.start, pool="stream", status="error")
+                ctx.span.end(params.exception)
+
+            async def on_connection_create_end(session, ctx, params):
+                stats.connections_opened += 1
+
+            async def on_connection_reuseconn(session, ctx, params):
+                stats.connections_reused += 1
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(on_request_start)
+            trace_config.on_request_end.append(on_request_end)
+            trace_config.on_request_exception.append(on_request_exception)
+            trace_config.on_connection_create_end.append(on_connection_create_end)
+            trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+            connector = aiohttp.TCPConnector(
+                limit=STREAM_POOL_LIMIT,
+                limit_per_host=STREAM_POOL_LIMIT_PER_HOST,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                use_dns_cache=True,
+                keepalive_timeout=KEEPALIVE_EXPIRY,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=30),
+                trace_configs=[trace_config],
+            )
+        return self._session
+
+    def stats(self) -> dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "uptime": time.time() - self.started_at,
+            "limits": {
+                "max_connections": MAX_CONNECTIONS,
+                "max_keepalive": MAX_KEEPALIVE,
+                "keepalive_expiry": KEEPALIVE_EXPIRY,
+                "stream_limit": STREAM_POOL_LIMIT,
+                "stream_limit_per_host": STREAM_POOL_LIMIT_PER_HOST,
+                "dns_cache_ttl": DNS_CACHE_TTL,
+            },
+            "upstreams": {name: s.as_dict() for name, s in self._stats.items()},
+        }
+
+    async def close(self):
+        """Drain and close every pool. Called on application shutdown."""
+        for name, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing {name} pool: {str(e)}")
+        self._clients.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_pool = HTTPPool()
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from fastapi import Response
+from fastapi.responses import FileResponse
+
+from http_pool import http_pool
+from executors import blocking
+from stream_proxy import USER_AGENT
+
+logger = logging.getLogger("VortexMusic")
+
+try:
+    from PIL import Image, features
+except ImportError:  # resizing/transcoding is optional; originals are still cached
+    Image = None
+
+IMAGE_CACHE_DIR = os.getenv(
+    "IMAGE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "images"),
+)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", "8"))
+# Refuse to cache anything bigger than this (not album art)
+IMAGE_MAX_SOURCE_BYTES = int(os.getenv("IMAGE_MAX_SOURCE_BYTES", str(15 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = 2048
+IMAGE_CACHE_CONTROL = "public, max-age=604800, stale-while-revalidate=86400"
+IMAGE_FETCH_TIMEOUT = 10.0
+
+# format param -> (Pillow encoder, content type)
+IMAGE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+
+class ImageFetchError(Exception):
+    pass
+
+
+def _can_encode(fmt: str) -> bool:
+    if Image is None:
+        return False
+    if fmt == "avif":
+        try:
+            return bool(features.check("avif"))
+        except Exception:
+            return False
+    return fmt in IMAGE_FORMATS
+
+
+def negotiate_format(fmt: Optional[str], accept: Optional[str]) -> Optional[str]:
+    """Resolve the requested output format; `auto` picks the best one the client accepts."""
+    if not fmt:
+        return None
+    fmt = fmt.lower()
+    if fmt == "auto":
+        accept = accept or ""
+        for candidate in ("avif", "webp"):
+            if f"image/{candidate}" in accept and _can_encode(candidate):
+                return candidate
+        return None
+    return fmt if _can_encode(fmt) else None
+
+
+def _render_variant(source: str, target: str, width: Optional[int], height: Optional[int], fmt: Optional[str]):
+    """Runs in the image worker pool: downscale (never upscale) and re-encode."""
+    with Image.open(source) as img:
+        encoder = IMAGE_FORMATS[fmt][0] if fmt else (img.format or "JPEG")
+        if width or height:
+            box = (width or IMAGE_MAX_DIMENSION, height or IMAGE_MAX_DIMENSION)
+            if width and height:
+                # Cover-crop to the requested aspect, like the thumbnails we replace
+                scale = max(width / img.width, height / img.height)
+                if scale < 1:
+                    img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                                     Image.LANCZOS)
+                left = max(0, (img.width - width) // 2)
+                top = max(0, (img.height - height) // 2)
+                img = img.crop((left, top, left + min(width, img.width), top + min(height, img.height)))
+            else:
+                img.thumbnail(box, Image.LANCZOS)
+        if encoder == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        tmp = target + ".part"
+        img.save(tmp, encoder, quality=80)
+    os.replace(tmp, target)
+
+
+class ImageCache:
+    """Disk cache for proxied artwork: originals plus resized/re-encoded variants.
+
+    Originals are streamed from upstream straight to disk, one fetch per
+    URL no matter how many lists render it at once, and at most
+    IMAGE_FETCH_CONCURRENCY fetches in total. Everything is served from
+    disk with a long Cache-Control and a content-derived ETag.
+    """
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+                 max_fetches: int = IMAGE_FETCH_CONCURRENCY):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._fetch_slots = asyncio.Semaphore(max_fetches)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # file name -> [size, last_access]
+        self._files: Dict[str, list] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.variants_built = 0
+        self.not_modified = 0
+        self.fetch_errors = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        blocking.register("images", max_workers=int(os.getenv("IMAGE_WORKERS", "2")))
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            if name.endswith(".json"):
+                continue
+            st = os.stat(path)
+            self._files[name] = [st.st_size, st.st_mtime]
+            self._bytes += st.st_size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _track(self, name: str):
+        size = os.path.getsize(self._path(name))
+        old = self._files.get(name)
+        self._bytes += size - (old[0] if old else 0)
+        self._files[name] = [size, time.time()]
+        self._evict()
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        for name, (size, _) in sorted(self._files.items(), key=lambda kv: kv[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            if name in self._inflight:
+                continue
+            for path in (self._path(name), self._path(name) + ".json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del self._files[name]
+            self._bytes -= size
+            self.evictions += 1
+
+    def _meta(self, name: str) -> Optional[dict]:
+        if name not in self._files:
+            return None
+        try:
+            with open(self._path(name) + ".json") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._files[name][1] = time.time()
+        return meta
+
+    async def _fetch(self, url: str, name: str) -> dict:
+        """Single-flight download of the original straight to disk."""
+        fut = self._inflight.get(name)
+        if fut is None:
+            fut = asyncio.ensure_future(self._download(url, name))
+            self._inflight[name] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(name, None))
+        return await asyncio.shield(fut)
+
+    async def _download(self, url: str, name: str) -> dict:
+        headers = {
+            "User-Agent": USER_AGENT,
+            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+            "Referer": "https://www.youtube.com/",
+        }
+        path = self._path(name)
+        tmp = path + ".part"
+        digest = hashlib.sha1()
+        size = 0
+        async with self._fetch_slots:
+            try:
+                timeout = aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT)
+                async with http_pool.session().get(url, headers=headers, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        raise ImageFetchError(f"upstream returned {resp.status}")
+                    content_type = resp.headers.get("Content-Type", "image/jpeg").split(";")[0]
+                    if not content_type.startswith("image/"):
+                        raise ImageFetchError(f"not an image ({content_type})")
+                    with open(tmp, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(64 * 1024):
+                            size += len(chunk)
+                            if size > IMAGE_MAX_SOURCE_BYTES:
+                                raise ImageFetchError("image too large")
+                            digest.update(chunk)
+                            f.write(chunk)
+            except (aiohttp.ClientError, TimeoutError, ImageFetchError) as e:
+                self.fetch_errors += 1
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise ImageFetchError(str(e) or type(e).__name__)
+
+        meta = {"url": url, "content_type": content_type, "hash": digest.hexdigest()[:20], "size": size}
+        with open(path + ".json", "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+        self._track(name)
+        return meta
+
+    async def _variant(self, source_name: str, meta: dict, width: Optional[int], height: Optional[int],
+                       fmt: Optional[str]) -> Tuple[str, dict]:
+        ext = fmt or "src"
+        name = f"{source_name}_{width or 0}x{height or 0}.{ext}"
+        vmeta = self._meta(name)
+        if vmeta is not None and vmeta.get("hash") == meta["hash"]:
+            return name, vmeta
+
+        fut = self._inflight.get(name)
+        if fut is None:
+            async def build():
+                await blocking.run("images", _render_variant, self._path(source_name), self._path(name),
+                                   width, height, fmt, timeout=15.0)
+                built = {
+                    "url": meta["url"],
+                    "content_type": IMAGE_FORMATS[fmt][1] if fmt else meta["content_type"],
+                    "hash": meta["hash"],
+                }
+                with open(self._path(name) + ".json", "w") as f:
+                    json.dump(built, f)
+                self._track(name)
+                self.variants_built += 1
+                return built
+
+            fut = asyncio.ensure_future(build())
+            self._inflight[name] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(name, None))
+        return name, await asyncio.shield(fut)
+
+    async def serve(self, url: str, width: Optional[int] = None, height: Optional[int] = None,
+                    fmt: Optional[str] = None, accept: Optional[str] = None,
+                    if_none_match: Optional[str] = None, head: bool = False) -> Response:
+        """Cached (and possibly resized) image response; raises ImageFetchError on upstream failures."""
+        width = min(width, IMAGE_MAX_DIMENSION) if width and width > 0 else None
+        height = min(height, IMAGE_MAX_DIMENSION) if height and height > 0 else None
+        negotiated = (fmt or "").lower() == "auto"
+        fmt = negotiate_format(fmt, accept)
+
+        source_name = hashlib.sha1(url.encode()).hexdigest()
+        meta = self._meta(source_name)
+        if meta is None:
+            self.misses += 1
+            meta = await self._fetch(url, source_name)
+        else:
+            self.hits += 1
+
+        name = source_name
+        if Image is not None and (width or height or fmt) and meta["content_type"] != "image/svg+xml":
+            try:
+                name, meta = await self._variant(source_name, meta, width, height, fmt)
+            except Exception as e:
+                # Corrupt or exotic source: the original is still better than nothing
+                logger.warning(f"Image variant failed for {url}: {str(e)}")
+                name = source_name
+
+        etag = f'"{meta["hash"]}-{name.partition("_")[2] or "orig"}"'
+        headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+        if negotiated:
+            headers["Vary"] = "Accept"
+        if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        if head:
+            headers["Content-Length"] = str(self._files[name][0])
+            return Response(status_code=200, headers=headers, media_type=meta["content_type"])
+        return FileResponse(self._path(name), media_type=meta["content_type"], headers=headers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "files": len(self._files),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "misses": self.misses,
+            "variants_built": self.variants_built,
+            "not_modified": self.not_modified,
+            "fetch_errors": self.fetch_errors,
+            "evictions": self.evictions,
+            "fetching": len(self._inflight),
+            "resize": Image is not None,
+        }
+
+
+image_cache = ImageCache()
@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("VortexMusic")
+
+INSTANCE_FAILURE_THRESHOLD = int(os.getenv("INSTANCE_FAILURE_THRESHOLD", "3"))
+INSTANCE_COOLDOWN = float(os.getenv("INSTANCE_COOLDOWN", "60"))
+INSTANCE_MAX_COOLDOWN = float(os.getenv("INSTANCE_MAX_COOLDOWN", "900"))
+INSTANCE_EXPLORE_RATE = float(os.getenv("INSTANCE_EXPLORE_RATE", "0.1"))
+INSTANCE_EWMA_ALPHA = 0.3
+# Latency assumed for instances we have never measured
+DEFAULT_LATENCY = 1.0
+
+
+class InstanceHealth:
+    def __init__(self, url: str):
+        self.url = url
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma_latency: Optional[float] = None
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.cooldown = INSTANCE_COOLDOWN
+        self.trial_started = 0.0
+        self.last_error: Optional[str] = None
+        self.last_used = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace smoothing so one early failure doesn't bury a fresh instance
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self) -> float:
+        latency = self.ewma_latency if self.ewma_latency is not None else DEFAULT_LATENCY
+        return self.success_rate / max(latency, 0.05)
+
+    def available(self, now: float) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open":
+            # Let a single trial request through; a trial that never reported
+            # back (cancelled race loser) frees the slot after a while.
+            return now - self.trial_started > 30.0
+        return False
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "state": self.state,
+            "score": round(self.score, 3),
+            "success_rate": round(self.success_rate, 3),
+            "ewma_latency": round(self.ewma_latency, 3) if self.ewma_latency is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in": max(0.0, round(self.opened_at + self.cooldown - time.time(), 1)) if self.state == "open" else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+class InstancePool:
+    """Health-scored routing over a list of interchangeable public instances.
+
+    Tracks success rate and EWMA latency per instance, opens a circuit after
+    repeated failures (half-open trial after a backoff cooldown) and routes to
+    the best scoring instance, exploring the others now and then.
+    """
+
+    def __init__(self, name: str, seeds: List[str]):
+        self.name = name
+        self.instances: Dict[str, InstanceHealth] = {url: InstanceHealth(url) for url in seeds}
+
+    def candidates(self, n: int = 1) -> List[str]:
+        """Up to `n` instances to try, best first."""
+        now = time.time()
+        usable = [h for h in self.instances.values() if h.available(now)]
+        if not usable:
+            # Everything is tripped; try whatever recovers soonest
+            usable = sorted(self.instances.values(), key=lambda h: h.opened_at + h.cooldown)[:1]
+        ranked = sorted(usable, key=lambda h: h.score, reverse=True)
+        if len(ranked) > 1 and random.random() < INSTANCE_EXPLORE_RATE:
+            explore = random.choice(ranked[1:])
+            ranked.remove(explore)
+            ranked.insert(0, explore)
+        picked = ranked[:n]
+        for h in picked:
+            h.last_used = now
+            if h.state == "half_open":
+                h.trial_started = now
+        return [h.url for h in picked]
+
+    def pick(self) -> Optional[str]:
+        picked = self.candidates(1)
+        return picked[0] if picked else None
+
+    def record_success(self, url: str, latency: float):
+        h = self.instances.get(url)
+        if h is None:
+            return
+        h.successes += 1
+        h.consecutive_failures = 0
+        h.ewma_latency = latency if h.ewma_latency is None else (
+            INSTANCE_EWMA_ALPHA * latency + (1 - INSTANCE_EWMA_ALPHA) * h.ewma_latency
+        )
+        if h.state != "closed":
+            logger.info(f"{self.name} instance {url} recovered")
+        h.state = "closed"
+        h.cooldown = INSTANCE_COOLDOWN
+
+    def record_failure(self, url: str, error: str = None):
+        h = self.instances.get(url)
+        if h is None:
+            return
+        h.failures += 1
+        h.consecutive_failures += 1
+        h.last_error = error
+        if h.state == "half_open":
+            # Trial failed: back off harder before the next one
+            h.cooldown = min(h.cooldown * 2, INSTANCE_MAX_COOLDOWN)
+            self._open(h)
+        elif h.state == "closed" and h.consecutive_failures >= INSTANCE_FAILURE_THRESHOLD:
+            self._open(h)
+
+    def _open(self, h: InstanceHealth):
+        h.state = "open"
+        h.opened_at = time.time()
+        h.trial_started = 0.0
+        logger.warning(f"{self.name} instance {h.url} circuit open for {h.cooldown:.0f}s ({h.last_error})")
+
+    async def probe_all(self, probe: Callable[[str], Awaitable[bool]]):
+        async def run(url):
+            start = time.time()
+            try:
+                ok = await probe(url)
+            except Exception as e:
+                self.record_failure(url, f"probe: {str(e)}")
+                return
+            if ok:
+                self.record_success(url, time.time() - start)
+            else:
+                self.record_failure(url, "probe failed")
+
+        await asyncio.gather(*(run(url) for url in self.instances))
+
+    async def run_probe_loop(self, probe: Callable[[str], Awaitable[bool]], interval: float):
+        while True:
+            try:
+                await self.probe_all(probe)
+            except Exception as e:
+                logger.warning(f"{self.name} probe loop error: {str(e)}")
+            await asyncio.sleep(interval)
+
+    def scoreboard(self) -> List[dict]:
+        return sorted((h.as_dict() for h in self.instances.values()), key=lambda d: d["score"], reverse=True)
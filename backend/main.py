@@ -1,54 +1,96 @@
-from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
 import yt_dlp
 import asyncio
 import logging
-import random
 import requests
 import re
+import json
+import math
 import time
-import httpx
+import os
 import urllib.parse
+import functools
+from collections import deque
 from typing import List, Optional, Dict
-import aiohttp
 from youtubesearchpython import VideosSearch
 from ytmusicapi import YTMusic
-import base64
-from Crypto.Cipher import DES
+from contextlib import asynccontextmanager
+from http_pool import http_pool
+from stream_cache import StreamCache
+from cache_backends import create_backend
+from instance_health import InstancePool
+from executors import blocking
+from stream_proxy import media_type_for, stream_proxy, UpstreamError
+from segment_cache import segment_cache
+from search_cache import SearchCache
+from admission import (
+    PRIORITIES, Overloaded, client_ip, client_key, current_priority, device_id, endpoint_class, extraction_gate,
+    rate_limiter, reset_priority, set_priority
+)
+from collection_pages import COLLECTION_MAX_PAGE_SIZE, COLLECTION_PAGE_SIZE, CollectionPages, decode_cursor, encode_cursor
+from search_ranking import (
+    SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, SEARCH_PROVIDER_RESULTS, SEARCH_PROVIDERS, as_they_arrive, gather_within,
+    merge_results
+)
+from home_snapshot import HomeSnapshot
+from image_cache import image_cache, ImageFetchError
+from batch_resolver import RESOLVE_MAX_TRACKS, encode_result, resolve_batch
+from prefetch import PREFETCH_MAX_TRACKS, PrefetchScheduler
+from track_matcher import MATCH_CANDIDATES, TrackMatcher
+from saavn_meta import SAAVN_API_URL, SaavnMetadata
+from soundcloud import SoundCloudClient
+from metrics import extraction_seconds, http_request_seconds, registry, requests_shed, run_loop_lag_monitor
+import saavn_crypto
+import tracing
+from transcode import CODECS, TRANSCODE_CODEC, ThroughputTracker, TranscodeBusy, parse_quality, transcoder
+from saavn_crypto import best_available, decrypt_many, decrypt_saavn_url, mark_unavailable
 
 ytmusic = YTMusic()
 
+# Blocking libraries never run on the event loop; each gets its own bounded pool.
+# YTDLP_PROCESS_POOL=1 moves yt-dlp extraction into worker processes.
+blocking.register("ytmusic", max_workers=int(os.getenv("YTMUSIC_WORKERS", "4")))
+blocking.register("search", max_workers=int(os.getenv("YT_SEARCH_WORKERS", "4")))
+blocking.register("pytubefix", max_workers=int(os.getenv("PYTUBEFIX_WORKERS", "2")))
+blocking.register(
+    "yt-dlp",
+    max_workers=int(os.getenv("YTDLP_WORKERS", "2")),
+    kind="process" if os.getenv("YTDLP_PROCESS_POOL") == "1" else "thread"
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("VortexMusic")
 
-# Global cache for SoundCloud Client ID
-SC_CID_CACHE = {"cid": None, "expiry": 0.0}
+# Shared cache backend (sqlite/redis/memory, see CACHE_BACKEND) behind the in-process caches
+cache_backend = create_backend()
+
+# SoundCloud fallback (client id kept fresh in the background)
+soundcloud = SoundCloudClient(backend=cache_backend)
 
-# Global stream cache: {video_id: {"url": str, "bitrate": int, "expiry": float}}
-STREAM_CACHE = {}
+# Global stream cache: {video_id: {"url": str, "bitrate": int, "duration": int, "method": str}}
+# Bounded LRU, expires with the signed URL's `expire=` parameter.
+STREAM_CACHE = StreamCache(backend=cache_backend)
 
 def get_cached_stream(video_id: str):
-    cached = STREAM_CACHE.get(video_id)
-    if cached and cached['expiry'] > time.time():
-        return cached['data']
-    return None
+    return STREAM_CACHE.get(video_id)
 
 def set_cached_stream(video_id: str, data: dict):
-    STREAM_CACHE[video_id] = {
-        'data': data,
-        'expiry': time.time() + 1800  # 30 minute cache
-    }
+    STREAM_CACHE.set(video_id, data)
 
 def cleanup_cache():
     """Remove expired entries from the cache."""
-    current_time = time.time()
-    expired_keys = [k for k, v in STREAM_CACHE.items() if v['expiry'] <= current_time]
-    for k in expired_keys:
-        del STREAM_CACHE[k]
+    STREAM_CACHE.purge_expired()
 
-INVIDIOUS_INSTANCES = [
+def instance_list(env: str, default: List[str]) -> List[str]:
+    """Comma-separated override for an instance list (used to point at local stand-ins)."""
+    value = os.getenv(env)
+    return [i.strip().rstrip('/') for i in value.split(',') if i.strip()] if value else default
+
+INVIDIOUS_INSTANCES = instance_list("INVIDIOUS_INSTANCES", [
     "https://inv.nadeko.net",
     "https://inv.tux.pizza",
     "https://iv.melmac.space",
@@ -59,15 +101,15 @@ INVIDIOUS_INSTANCES = [
     "https://iv.datura.network",
     "https://invidious.lunar.icu",
     "https://invidious.flokinet.to"
-]
+])
 
-PIPED_INSTANCES = [
+PIPED_INSTANCES = instance_list("PIPED_INSTANCES", [
     "https://pipedapi.kavin.rocks",
     "https://piped-api.garudalinux.org",
     "https://api.piped.victr.me",
     "https://pipedapi.leptons.xyz",
     "https://piped-api.lunar.icu"
-]
+])
 
 LAVALINK_NODES = [
     {"host": "lavalink-4.oops.moe", "port": 443, "password": "youshallnotpass", "secure": True},
@@ -75,21 +117,37 @@ LAVALINK_NODES = [
     {"host": "lava1.free-lavalink.com", "port": 443, "password": "free-lavalink", "secure": True}
 ]
 
-def decrypt_saavn_url(enc_url: str):
-    """Decrypt Saavn encrypted media URLs."""
-    try:
-        if not enc_url: return None
-        # DES key for Saavn is exactly 8 bytes
-        des = DES.new(b"38343635", DES.MODE_ECB) 
-        cipher_text = base64.b64decode(enc_url)
-        dec_text = des.decrypt(cipher_text)
-        url = dec_text.decode('utf-8', errors='ignore').split('\x00')[0]
-        # Upgrade to 320kbps if possible
-        url = url.replace("_96.mp4", "_320.mp4").replace("_160.mp4", "_320.mp4")
-        return url
-    except Exception as e:
-        logger.warning(f"Saavn decryption error: {str(e)}")
-        return None
+# The static lists only seed the health-scored pools used for routing
+piped_pool = InstancePool("piped", PIPED_INSTANCES)
+invidious_pool = InstancePool("invidious", INVIDIOUS_INSTANCES)
+lavalink_pool = InstancePool("lavalink", [
+    f"{'https' if n['secure'] else 'http'}://{n['host']}:{n['port']}" for n in LAVALINK_NODES
+])
+LAVALINK_PASSWORDS = {
+    f"{'https' if n['secure'] else 'http'}://{n['host']}:{n['port']}": n['password'] for n in LAVALINK_NODES
+}
+
+# Per-instance timeout, so one dead instance leaves time to try another
+INSTANCE_TIMEOUT = float(os.getenv("INSTANCE_TIMEOUT", "3.5"))
+# Background health probes, 0 disables them
+INSTANCE_PROBE_INTERVAL = float(os.getenv("INSTANCE_PROBE_INTERVAL", "0"))
+
+async def probe_piped(instance: str) -> bool:
+    resp = await http_pool.client("piped").get(f"{instance}/healthcheck", timeout=INSTANCE_TIMEOUT)
+    return resp.status_code == 200
+
+async def probe_invidious(instance: str) -> bool:
+    resp = await http_pool.client("invidious").get(f"{instance}/api/v1/stats", timeout=INSTANCE_TIMEOUT)
+    return resp.status_code == 200
+
+async def probe_lavalink(node: str) -> bool:
+    resp = await http_pool.client("lavalink").get(
+        f"{node}/version", headers={"Authorization": LAVALINK_PASSWORDS.get(node, "")}, timeout=INSTANCE_TIMEOUT
+    )
+    return resp.status_code == 200
+
+# Saavn song objects by pid (batched song.getDetails), seeded by search/playlist results
+saavn_meta = SaavnMetadata(decrypt_saavn_url, backend=cache_backend)
 
 def proxy_thumbnail(url: str, base_url: str = None) -> str:
     """Internal proxy router for maximum reliability."""
@@ -108,19 +166,195 @@ def proxy_thumbnail(url: str, base_url: str = None) -> str:
     
     return f"https://wsrv.nl/?url={encoded_url}&w=500&h=500&fit=cover&n=-1"
 
-app = FastAPI(title="Vortex Music Backend")
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the shared pools so the first request doesn't pay for setup
+    http_pool.session()
+    expiry_task = asyncio.create_task(STREAM_CACHE.run_expiry_loop())
+    purge_task = asyncio.create_task(cache_backend.run_purge_loop())
+    home_task = asyncio.create_task(home_snapshot.run_refresh_loop())
+    prefetch_task = asyncio.create_task(prefetcher.run())
+    sc_task = asyncio.create_task(soundcloud.run_refresh_loop()) if "SoundCloud" in EXTRACTION_METHODS else None
+    lag_task = asyncio.create_task(run_loop_lag_monitor())
+    trace_task = asyncio.create_task(tracing.exporter.run_export_loop(lambda: http_pool.client("otlp")))
+    probe_tasks = []
+    if INSTANCE_PROBE_INTERVAL > 0:
+        probe_tasks = [
+            asyncio.create_task(piped_pool.run_probe_loop(probe_piped, INSTANCE_PROBE_INTERVAL)),
+            asyncio.create_task(invidious_pool.run_probe_loop(probe_invidious, INSTANCE_PROBE_INTERVAL)),
+            asyncio.create_task(lavalink_pool.run_probe_loop(probe_lavalink, INSTANCE_PROBE_INTERVAL)),
+        ]
+    yield
+    blocking.shutdown()
+    expiry_task.cancel()
+    purge_task.cancel()
+    home_task.cancel()
+    prefetch_task.cancel()
+    if sc_task:
+        sc_task.cancel()
+    lag_task.cancel()
+    for t in probe_tasks:
+        t.cancel()
+    # Last spans go out before the pools close
+    trace_task.cancel()
+    await asyncio.gather(trace_task, return_exceptions=True)
+    await http_pool.close()
+    await cache_backend.close()
+
+app = FastAPI(title="Vortex Music Backend", lifespan=lifespan)
+
+def shed_response(cls: str, reason: str, status: int, detail: str, retry_after: float) -> JSONResponse:
+    requests_shed.inc(endpoint_class=cls, reason=reason)
+    return JSONResponse(
+        status_code=status, content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Per-address and per-device token buckets per endpoint class; tags the request's extraction priority."""
+    cls = endpoint_class(request.url.path)
+    if cls is None or request.method == "OPTIONS":
+        return await call_next(request)
+    wait = rate_limiter.take(client_ip(request), device_id(request), cls)
+    if wait:
+        return shed_response(cls, "rate_limited", 429, "Too many requests", wait)
+    token = set_priority(PRIORITIES[cls])
+    try:
+        return await call_next(request)
+    finally:
+        reset_priority(token)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    return shed_response(endpoint_class(request.url.path) or "other", "overloaded", 503, str(exc), exc.retry_after)
+
+def charge_tracks(request: Request, count: int):
+    """Batch endpoints pay one token per track (the request itself already paid one)."""
+    wait = rate_limiter.take(client_ip(request), device_id(request), "batch", max(0, count - 1))
+    if wait:
+        requests_shed.inc(endpoint_class="batch", reason="rate_limited")
+        raise HTTPException(status_code=429, detail="Too many tracks requested",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template, not the raw path, so ids don't explode the label set
+        route = request.scope.get("route")
+        http_request_seconds.observe(
+            time.perf_counter() - start,
+            method=request.method, path=getattr(route, "path", "unmatched"), status=status
+        )
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Server span per request (joining the caller's `traceparent`), id echoed in X-Trace-Id."""
+    span = tracing.start_span(
+        f"{request.method} {request.url.path}", "server", traceparent=request.headers.get("traceparent"),
+        **{"http.method": request.method, "http.target": request.url.path}
+    )
+    with tracing.activate(span):
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.name = f"{request.method} {route.path}"
+            span.set(**{"http.route": route.path})
+        span.set(**{"http.status_code": response.status_code})
+        if response.status_code >= 500:
+            span.error(f"HTTP {response.status_code}")
+        response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+# Added last so it's outermost: 429s and 503s from admission control need CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Total-Count", "X-Search-Providers", "Retry-After"],
 )
 
+def collect_cache_counters(outcome: str):
+    """hits/misses of every cache layer, read from their own counters."""
+    def collect():
+        segment_hits = segment_cache.full_hits + segment_cache.partial_hits
+        search_totals = {"hits": 0, "misses": 0}
+        for counters in search_cache.stats_by_provider.values():
+            search_totals["hits"] += counters["hits"] + counters["stale"] + counters["prefix"]
+            search_totals["misses"] += counters["misses"]
+        values = {
+            "stream": (STREAM_CACHE.hits, STREAM_CACHE.misses),
+            "segment": (segment_hits, segment_cache.misses),
+            "search": (search_totals["hits"], search_totals["misses"]),
+            "image": (image_cache.hits, image_cache.misses),
+            "match": (matcher.hits, matcher.misses),
+            "saavn_meta": (saavn_meta.hits, saavn_meta.misses),
+        }
+        for cache, (hits, misses) in values.items():
+            yield {"cache": cache}, hits if outcome == "hit" else misses
+    return collect
+
+registry.collector("vortex_cache_hits_total", "counter", "Cache lookups answered from cache.", collect_cache_counters("hit"))
+registry.collector("vortex_cache_misses_total", "counter", "Cache lookups that went upstream.", collect_cache_counters("miss"))
+registry.collector(
+    "vortex_stream_bytes_total", "counter", "Audio bytes sent to clients per source.",
+    lambda: (({"source": name}, s.bytes_served) for name, s in stream_proxy._stats.items())
+)
+registry.collector(
+    "vortex_segment_cache_bytes_total", "counter", "Audio bytes served by origin (cache or upstream).",
+    lambda: [({"origin": "cache"}, segment_cache.bytes_from_cache), ({"origin": "upstream"}, segment_cache.bytes_from_upstream)]
+)
+registry.collector(
+    "vortex_active_streams", "gauge", "Audio responses currently streaming per source.",
+    lambda: (({"source": name}, s.active) for name, s in stream_proxy._stats.items())
+)
+registry.collector(
+    "vortex_extraction_slots", "gauge", "Extraction gate slots in use and requests waiting for one.",
+    lambda: [({"state": "in_use"}, extraction_gate.in_use), ({"state": "waiting"}, extraction_gate.waiting)]
+)
+registry.collector(
+    "vortex_executor_in_flight", "gauge", "Blocking calls running or queued per pool.",
+    lambda: (({"pool": name}, s["in_flight"]) for name, s in blocking.stats().items())
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of request, extraction, upstream, cache and loop metrics."""
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
     cleanup_cache()
-    return {"status": "healthy", "ver": "v1.1.0-final-fix", "cache_size": len(STREAM_CACHE)}
+    return {
+        "status": "healthy",
+        "ver": "v1.1.0-final-fix",
+        "cache_size": len(STREAM_CACHE),
+        "stream_cache": STREAM_CACHE.stats(),
+        "cache_backend": cache_backend.stats(),
+        "executors": blocking.stats(),
+        "streams": stream_proxy.stats(),
+        "segment_cache": segment_cache.stats(),
+        "search_cache": search_cache.stats(),
+        "home": home_snapshot.stats(),
+        "collections": collections.stats(),
+        "images": image_cache.stats(),
+        "prefetch": prefetcher.stats(),
+        "matcher": matcher.stats(),
+        "saavn_meta": saavn_meta.stats(),
+        "saavn_crypto": saavn_crypto.stats(),
+        "soundcloud": soundcloud.stats(),
+        "transcode": {**transcoder.stats(), "throughput": client_throughput.stats()},
+        "tracing": tracing.exporter.stats(),
+        "admission": {"rate_limits": rate_limiter.stats(), "extraction": extraction_gate.stats()},
+        "pools": http_pool.stats()
+    }
 
 @app.get("/version")
 async def get_version():
@@ -131,36 +365,44 @@ async def ping():
     """Keep-alive endpoint for third-party services like cron-job.org"""
     return {"status": "pong", "timestamp": time.time()}
 
+PLACEHOLDER_IMAGE = "https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500"
+
 @app.get("/proxy-image")
-async def proxy_image(url: str = Query(...)):
-    """Internal image proxy to bypass blocking."""
+async def proxy_image(
+    request: Request,
+    url: str = Query(...),
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    format: Optional[str] = None
+):
+    """Internal image proxy to bypass blocking; w/h/format serve resized variants (format=auto negotiates)."""
     try:
         if not url or not url.startswith('http'):
-            return Response(status_code=302, headers={"Location": "https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500"})
-            
-        async with httpx.AsyncClient(follow_redirects=True, timeout=10.0) as client:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, Gecko) Chrome/120.0.0.0 Safari/537.36",
-                "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-                "Referer": "https://www.youtube.com/"
-            }
-            # Try with GET directly since some sites block HEAD
-            resp = await client.get(url, headers=headers)
-            if resp.status_code == 200:
-                content_type = resp.headers.get("Content-Type", "image/jpeg")
-                return Response(content=resp.content, media_type=content_type)
-            else:
-                logger.warning(f"Image proxy failed for {url} with status {resp.status_code}")
-                # Fallback to a valid placeholder
-                return Response(status_code=302, headers={"Location": "https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500"})
+            return Response(status_code=302, headers={"Location": PLACEHOLDER_IMAGE})
+        return await image_cache.serve(
+            url, w, h, format,
+            accept=request.headers.get("accept"),
+            if_none_match=request.headers.get("if-none-match"),
+            head=request.method == "HEAD"
+        )
+    except ImageFetchError as e:
+        logger.warning(f"Image proxy failed for {url}: {str(e)}")
+        # Fallback to a valid placeholder
+        return Response(status_code=302, headers={"Location": PLACEHOLDER_IMAGE})
     except Exception as e:
         logger.error(f"Image proxy error: {str(e)}")
-        return Response(status_code=302, headers={"Location": "https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500"})
+        return Response(status_code=302, headers={"Location": PLACEHOLDER_IMAGE})
 
 @app.head("/proxy-image")
-async def proxy_image_head(url: str = Query(...)):
+async def proxy_image_head(
+    request: Request,
+    url: str = Query(...),
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    format: Optional[str] = None
+):
     """Handle HEAD requests for proxy-image."""
-    return Response(status_code=200)
+    return await proxy_image(request, url, w, h, format)
 
 YDL_OPTIONS = {
     'format': 'bestaudio/best',
@@ -179,9 +421,10 @@ YDL_OPTIONS = {
 
 class SaavnAPI:
     """Helper for JioSaavn Internal API lookup."""
-    BASE_URL = "https://www.jiosaavn.com/api.php"
+    BASE_URL = SAAVN_API_URL
     @staticmethod
     def _format_song(song, base_url: str = None):
+        saavn_meta.seed(song)
         # Upgrade image to 500x500. Support 'image' or 'thumbnail' keys.
         image_data = song.get('image') or song.get('thumbnail')
         image = ""
@@ -226,46 +469,103 @@ class SaavnAPI:
             'includeMetaTags': '1',
             'query': query
         }
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(self.BASE_URL, params=params, timeout=10.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                songs = data.get('songs', {}).get('data', [])
-                return [self._format_song(s, base_url) for s in songs]
+        client = http_pool.client("saavn")
+        resp = await client.get(self.BASE_URL, params=params, timeout=10.0)
+        if resp.status_code == 200:
+            data = resp.json()
+            songs = data.get('songs', {}).get('data', [])
+            return [self._format_song(s, base_url) for s in songs]
         return []
 
-    async def get_charts(self, base_url: str = None):
-        # Fetch Weekly Top 15 as home content
+    async def get_chart_list(self):
+        """Raw list of current Saavn charts (id, title, image, ...)."""
         params = {
             '__call': 'content.getCharts',
             '_format': 'json',
             '_marker': '0',
             'cc': 'in',
         }
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(self.BASE_URL, params=params, timeout=10.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                # Return first chart
-                if data:
-                    chart_id = data[0].get('id')
-                    return await self.get_playlist(chart_id, base_url)
+        client = http_pool.client("saavn")
+        resp = await client.get(self.BASE_URL, params=params, timeout=10.0)
+        if resp.status_code == 200:
+            data = resp.json()
+            if isinstance(data, list):
+                return data
         return []
 
-    async def get_playlist(self, listid: str, base_url: str = None):
-        params = {
-            '__call': 'playlist.getDetails',
-            '_format': 'json',
-            'listid': listid
-        }
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(self.BASE_URL, params=params, timeout=10.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                songs = data.get('songs', [])
-                return [self._format_song(s, base_url) for s in songs]
+    async def get_charts(self, base_url: str = None):
+        # Fetch Weekly Top 15 as home content
+        charts = await self.get_chart_list()
+        # Return first chart
+        if charts:
+            return await self.get_playlist(charts[0].get('id'), base_url)
         return []
 
+    async def _call(self, params: dict) -> Optional[dict]:
+        client = http_pool.client("saavn")
+        resp = await client.get(self.BASE_URL, params={**params, '_format': 'json', '_marker': '0'}, timeout=10.0)
+        if resp.status_code == 200:
+            data = resp.json()
+            if isinstance(data, dict):
+                return data
+        return None
+
+    def format_songs(self, songs: List[dict], base_url: str = None) -> List[dict]:
+        formatted = [self._format_song(s, base_url) for s in songs]
+        # Ready-to-play CDN URLs for the whole batch in one decryption pass
+        for song, media_url in zip(formatted, decrypt_many([s.get('enc_url') for s in formatted])):
+            song['media_url'] = saavn_crypto.quality_candidates(media_url)[0] if media_url else None
+        return formatted
+
+    async def playlist_details(self, listid: str) -> Optional[dict]:
+        """Playlist listing with its songs still unformatted."""
+        data = await self._call({'__call': 'playlist.getDetails', 'listid': listid})
+        if not data:
+            return None
+        return {
+            'id': listid,
+            'type': 'playlist',
+            'title': data.get('listname'),
+            'subtitle': data.get('firstname'),
+            'image': data.get('image'),
+            'songs': data.get('songs') or []
+        }
+
+    async def album_details(self, albumid: str) -> Optional[dict]:
+        data = await self._call({'__call': 'content.getAlbumDetails', 'albumid': albumid})
+        if not data:
+            return None
+        return {
+            'id': albumid,
+            'type': 'album',
+            'title': data.get('title') or data.get('name'),
+            'subtitle': data.get('primary_artists'),
+            'year': data.get('year'),
+            'image': data.get('image'),
+            'songs': data.get('songs') or []
+        }
+
+    async def artist_top_songs(self, artist_id: str) -> Optional[dict]:
+        data = await self._call({
+            '__call': 'artist.getArtistPageDetails', 'artistId': artist_id,
+            'n_song': '100', 'n_album': '0', 'page': '0', 'sort_order': 'desc', 'category': ''
+        })
+        if not data:
+            return None
+        top = data.get('topSongs') or []
+        return {
+            'id': artist_id,
+            'type': 'artist',
+            'title': data.get('name'),
+            'subtitle': 'Top Songs',
+            'image': data.get('image'),
+            'songs': top.get('songs') or [] if isinstance(top, dict) else top
+        }
+
+    async def get_playlist(self, listid: str, base_url: str = None):
+        details = await self.playlist_details(listid)
+        return self.format_songs(details['songs'], base_url) if details else []
+
 saavn = SaavnAPI()
 
 def format_search_result(result, base_url: str = None):
@@ -279,52 +579,67 @@ def format_search_result(result, base_url: str = None):
         'duration': result.get('duration'),
         'url': f"https://www.youtube.com/watch?v={result.get('id')}",
     }
+
+def format_ytmusic_song(result, base_url: str = None):
+    thumbnails = result.get('thumbnails') or []
+    artists = result.get('artists') or []
+    return {
+        'id': result.get('videoId'),
+        'title': result.get('title'),
+        'artist': ", ".join(a.get('name') for a in artists if a.get('name')) or 'Unknown',
+        'thumbnail': proxy_thumbnail(thumbnails[-1].get('url') if thumbnails else None, base_url),
+        'duration': result.get('duration_seconds'),
+        'album': (result.get('album') or {}).get('name'),
+        'url': f"https://music.youtube.com/watch?v={result.get('videoId')}",
+        'source': 'YouTube Music'
+    }
+
 class AudioDBAPI:
     """Helper for TheAudioDB for artist bios and images."""
     BASE_URL = "https://www.theaudiodb.com/api/v1/json/1" # Public test key
 
     async def get_artist_info(self, name: str):
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{self.BASE_URL}/search.php", params={'s': name}, timeout=5.0)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    artists = data.get('artists')
-                    if artists:
-                        artist = artists[0]
-                        return {
-                            'bio': artist.get('strBiographyEN'),
-                            'banner': artist.get('strArtistBanner'),
-                            'fanart': artist.get('strArtistFanart'),
-                            'logo': artist.get('strArtistLogo'),
-                            'style': artist.get('strStyle'),
-                            'genre': artist.get('strGenre'),
-                            'country': artist.get('strCountry')
-                        }
+            client = http_pool.client("audiodb")
+            resp = await client.get(f"{self.BASE_URL}/search.php", params={'s': name}, timeout=5.0)
+            if resp.status_code == 200:
+                data = resp.json()
+                artists = data.get('artists')
+                if artists:
+                    artist = artists[0]
+                    return {
+                        'bio': artist.get('strBiographyEN'),
+                        'banner': artist.get('strArtistBanner'),
+                        'fanart': artist.get('strArtistFanart'),
+                        'logo': artist.get('strArtistLogo'),
+                        'style': artist.get('strStyle'),
+                        'genre': artist.get('strGenre'),
+                        'country': artist.get('strCountry')
+                    }
         except Exception as e:
             logger.warning(f"AudioDB Error: {str(e)}")
         return None
 
 class DeezerAPI:
     """Helper for Deezer Search & Metadata."""
-    BASE_URL = "https://api.deezer.com"
+    BASE_URL = os.getenv("DEEZER_API_URL", "https://api.deezer.com")
 
     async def search(self, query: str, base_url: str = None):
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{self.BASE_URL}/search", params={'q': query}, timeout=5.0)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return [{
-                        'id': str(track.get('id')),
-                        'type': 'deezer',
-                        'title': track.get('title'),
-                        'artist': track.get('artist', {}).get('name'),
-                        'thumbnail': proxy_thumbnail(track.get('album', {}).get('cover_xl') or track.get('album', {}).get('cover_medium'), base_url),
-                        'duration': track.get('duration'),
-                        'album': track.get('album', {}).get('title'),
-                        'source': 'Deezer'
-                    } for track in data.get('data', [])[:5]]
+            client = http_pool.client("deezer")
+            resp = await client.get(f"{self.BASE_URL}/search", params={'q': query, 'limit': SEARCH_PROVIDER_RESULTS}, timeout=5.0)
+            if resp.status_code == 200:
+                data = resp.json()
+                return [{
+                    'id': str(track.get('id')),
+                    'type': 'deezer',
+                    'title': track.get('title'),
+                    'artist': track.get('artist', {}).get('name'),
+                    'thumbnail': proxy_thumbnail(track.get('album', {}).get('cover_xl') or track.get('album', {}).get('cover_medium'), base_url),
+                    'duration': track.get('duration'),
+                    'album': track.get('album', {}).get('title'),
+                    'source': 'Deezer'
+                } for track in data.get('data', [])[:SEARCH_PROVIDER_RESULTS]]
         except Exception as e:
             logger.warning(f"Deezer Error: {str(e)}")
         return []
@@ -332,6 +647,85 @@ class DeezerAPI:
 saavn = SaavnAPI()
 audiodb = AudioDBAPI()
 deezer = DeezerAPI()
+search_cache = SearchCache(backend=cache_backend)
+
+collections = CollectionPages(
+    {"playlist": saavn.playlist_details, "album": saavn.album_details, "artist": saavn.artist_top_songs},
+    saavn.format_songs,
+    backend=cache_backend
+)
+
+async def collection_page(request: Request, kind: str, collection_id: str, cursor: Optional[str], limit: int,
+                          include_streams: bool):
+    """One page of a Saavn collection: listing fields, `items`, `next_cursor`.
+
+    Answers 304 when If-None-Match carries the page's ETag. With
+    `include_streams` the first page also gets each song's resolved
+    stream info under `stream` (what /stream-info would return).
+    """
+    try:
+        offset = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    base_url = str(request.base_url)
+    try:
+        entry = await collections.collection(kind, collection_id)
+    except Exception as e:
+        logger.warning(f"Saavn {kind} {collection_id} failed: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Could not load {kind}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"{kind.capitalize()} not found")
+
+    with_streams = include_streams and offset == 0
+    etag = collections.etag(entry, base_url, offset, limit, with_streams)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    items = collections.items(entry, base_url, offset, limit)
+    if with_streams:
+        stream_base = base_url.replace("http://", "https://") if "onrender.com" in base_url else base_url
+        # Copies: the cached page itself stays stream-free
+        items = [dict(item) for item in items]
+        resolved = {}
+        async for result in resolve_batch(
+            items,
+            lambda t: resolve_track(stream_base, t['id'], t.get('title'), t.get('artist'), t.get('enc_url'), None,
+                                    t.get('duration')),
+            key=lambda t: t['id']
+        ):
+            resolved[result["id"]] = result.get("result")
+        for item in items:
+            item['stream'] = resolved.get(item['id'])
+
+    meta = entry["meta"]
+    total = len(entry["songs"])
+    body = {
+        **meta,
+        'image': proxy_thumbnail(meta.get('image'), base_url) if meta.get('image') else None,
+        'total': total,
+        'offset': offset,
+        'items': items,
+        'next_cursor': encode_cursor(offset + limit) if offset + limit < total else None
+    }
+    return JSONResponse(content=body, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@app.get("/playlist/{listid}")
+async def get_playlist_page(request: Request, listid: str, cursor: Optional[str] = Query(None),
+                            limit: int = Query(COLLECTION_PAGE_SIZE, ge=1, le=COLLECTION_MAX_PAGE_SIZE),
+                            include_streams: bool = Query(False)):
+    return await collection_page(request, "playlist", listid, cursor, limit, include_streams)
+
+@app.get("/album/{album_id}")
+async def get_album_page(request: Request, album_id: str, cursor: Optional[str] = Query(None),
+                         limit: int = Query(COLLECTION_PAGE_SIZE, ge=1, le=COLLECTION_MAX_PAGE_SIZE),
+                         include_streams: bool = Query(False)):
+    return await collection_page(request, "album", album_id, cursor, limit, include_streams)
+
+@app.get("/artist/{artist_id}/top-tracks")
+async def get_artist_top_tracks(request: Request, artist_id: str, cursor: Optional[str] = Query(None),
+                                limit: int = Query(COLLECTION_PAGE_SIZE, ge=1, le=COLLECTION_MAX_PAGE_SIZE),
+                                include_streams: bool = Query(False)):
+    return await collection_page(request, "artist", artist_id, cursor, limit, include_streams)
 
 @app.get("/artist/{name}")
 async def get_artist(name: str):
@@ -342,60 +736,204 @@ async def get_artist(name: str):
 
 from fastapi import Request
 
+def search_calls(q: str, base_url: str) -> dict:
+    """Cached fetch per search provider, as run by /search and /search/stream."""
+    async def fetch_ytmusic():
+        with tracing.span("ytmusic.search", query=q):
+            results = await blocking.run(
+                "ytmusic", ytmusic.search, q, filter="songs", limit=SEARCH_PROVIDER_RESULTS, timeout=8.0
+            )
+        return [format_ytmusic_song(r, base_url) for r in results if r.get('videoId')]
+
+    calls = {
+        "saavn": lambda: search_cache.get("saavn", base_url, q, lambda: saavn.search(q, base_url)),
+        "deezer": lambda: search_cache.get("deezer", base_url, q, lambda: deezer.search(q, base_url)),
+        "ytmusic": lambda: search_cache.get("ytmusic", base_url, q, fetch_ytmusic),
+    }
+    return {name: call for name, call in calls.items() if name in SEARCH_PROVIDERS}
+
+def youtube_fallback_call(q: str, base_url: str) -> dict:
+    """Plain YouTube search, only asked when no provider had anything."""
+    async def fetch_youtube():
+        yt_results = (await blocking.run("search", youtube_search, q, timeout=10.0)).get('result', [])
+        return [format_search_result(v, base_url) for v in yt_results]
+
+    if "youtube" not in SEARCH_PROVIDERS:
+        return {}
+    return {"youtube": lambda: search_cache.get("youtube", base_url, q, fetch_youtube)}
+
 @app.get("/search")
-async def search(request: Request, q: str = Query(...)):
+async def search(request: Request, response: Response, q: str = Query(...),
+                 limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+                 offset: int = Query(0, ge=0)):
+    """Saavn, Deezer and YouTube Music at once, merged, de-duplicated and ranked.
+
+    Each provider gets its own deadline; the response carries whatever was
+    ready by then (X-Search-Providers says which). YouTube is only asked
+    when none of them had anything.
+    """
     base_url = str(request.base_url)
     try:
-        # Parallel Search: Saavn + Deezer
-        results_saavn: List = []
-        results_deezer: List = []
-        
-        try:
-            # Parallel Search: Saavn + Deezer
-            results = await asyncio.gather(
-                saavn.search(q, base_url),
-                deezer.search(q, base_url),
-                return_exceptions=True
-            )
-            results_saavn = results[0] if not isinstance(results[0], Exception) else []
-            results_deezer = results[1] if not isinstance(results[1], Exception) else []
-            # Handle potential exceptions from gather
-            if isinstance(results_saavn, Exception): results_saavn = []
-            if isinstance(results_deezer, Exception): results_deezer = []
-        except Exception as ge:
-            logger.warning(f"Gather error: {str(ge)}")
-
-        # Merge results, prioritizing Saavn for Indian content (first 10), then Deezer
-        final_merged = []
-        if isinstance(results_saavn, list):
-            final_merged.extend(results_saavn[:10])
-        if isinstance(results_deezer, list):
-            final_merged.extend(results_deezer)
-            
-        if final_merged:
-            return final_merged
-            
-        # Fallback: YouTube Search
-        search_engine = VideosSearch(q, limit=15)
-        yt_results = search_engine.result().get('result', [])
-        return [format_search_result(v, base_url) for v in yt_results]
+        by_provider, status = await gather_within(search_calls(q, base_url))
+        if not any(by_provider.values()):
+            fallback, fallback_status = await gather_within(youtube_fallback_call(q, base_url))
+            by_provider.update(fallback)
+            status.update(fallback_status)
+
+        merged = merge_results(q, by_provider)
+        response.headers["X-Total-Count"] = str(len(merged))
+        response.headers["X-Search-Providers"] = ",".join(f"{name}={state}" for name, state in status.items())
+        return merged[offset:offset + limit]
     except Exception as e:
         logger.error(f"Search Error: {str(e)}")
         return []
 
+# Newest /search/stream per client; a newer query stops the older one
+live_searches: Dict[str, asyncio.Event] = {}
+
+@app.get("/search/stream")
+async def search_stream(request: Request, q: str = Query(...),
+                        limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT)):
+    """Type-ahead search as NDJSON, one line per provider as it answers.
+
+    Every line carries the merged ranking so far, so the client can just
+    replace its list: {"provider", "status", "pending", "results"}, then a
+    final {"done": true, "total", "results"}. The stream ends early when
+    the client goes away or starts a newer search (same X-Device-Id/IP).
+    """
+    base_url = str(request.base_url)
+    key = client_key(request)
+    previous = live_searches.get(key)
+    if previous is not None:
+        previous.set()
+    superseded = asyncio.Event()
+    live_searches[key] = superseded
+
+    def line(payload: dict) -> bytes:
+        return (json.dumps(payload, default=str) + "\n").encode()
+
+    async def events():
+        by_provider: Dict[str, List[dict]] = {}
+        calls = search_calls(q, base_url)
+        pending = set(calls)
+        try:
+            async for name, results, status in as_they_arrive(calls, stop=superseded):
+                pending.discard(name)
+                by_provider[name] = results
+                yield line({"provider": name, "status": status, "pending": sorted(pending),
+                            "results": merge_results(q, by_provider)[:limit]})
+            if superseded.is_set():
+                return
+            if not any(by_provider.values()):
+                async for name, results, status in as_they_arrive(youtube_fallback_call(q, base_url), stop=superseded):
+                    by_provider[name] = results
+                    yield line({"provider": name, "status": status, "pending": [],
+                                "results": merge_results(q, by_provider)[:limit]})
+                if superseded.is_set():
+                    return
+            merged = merge_results(q, by_provider)
+            yield line({"done": True, "total": len(merged), "results": merged[:limit]})
+        finally:
+            if live_searches.get(key) is superseded:
+                live_searches.pop(key, None)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+
+HOME_CHART_COUNT = int(os.getenv("HOME_CHART_COUNT", "4"))
+# Number of charted YouTube tracks to pre-extract after each refresh (0 = off)
+HOME_PREWARM = int(os.getenv("HOME_PREWARM", "0"))
+
+async def build_home_payload(base_url: str) -> dict:
+    """Build the /home payload from the top Saavn charts, YouTube as fallback."""
+    charts = []
+    try:
+        chart_list = (await saavn.get_chart_list())[:HOME_CHART_COUNT]
+        playlists = await asyncio.gather(
+            *(saavn.get_playlist(c.get('id'), base_url) for c in chart_list),
+            return_exceptions=True
+        )
+        for chart, songs in zip(chart_list, playlists):
+            if isinstance(songs, list) and songs:
+                charts.append({
+                    'id': chart.get('id'),
+                    'title': chart.get('title') or chart.get('listname'),
+                    'image': proxy_thumbnail(chart.get('image'), base_url),
+                    'songs': songs
+                })
+    except Exception as e:
+        logger.warning(f"Chart fetch failed: {str(e)}")
+
+    # 1. Freshest Saavn chart (usually updated daily)
+    trending_songs = charts[0]['songs'] if charts and len(charts[0]['songs']) > 5 else []
+    if not trending_songs:
+        # 2. Fallback: Specific YT Music search for "2024 hits"
+        yt_results = (await blocking.run("search", youtube_search, "popular music 2025 hits india", timeout=10.0)).get('result', [])
+        trending_songs = [format_search_result(v, base_url) for v in yt_results]
+
+    return {
+        "trending": trending_songs,
+        "recently_played": trending_songs[:4],
+        "charts": charts,
+        "generated_at": time.time()
+    }
+
+async def prewarm_home(payload: dict):
+    """Map charted catalog tracks to YouTube and pre-extract charted YouTube streams."""
+    songs = [s for chart in payload.get('charts', []) for s in chart.get('songs', [])]
+    await backfill_matches(songs or payload.get('trending', []))
+    if HOME_PREWARM <= 0:
+        return
+    ids = [s['id'] for s in payload.get('trending', []) if s.get('id') and len(str(s['id'])) == 11 and not s.get('type')]
+    sem = asyncio.Semaphore(2)
+
+    async def warm(vid):
+        async with sem:
+            try:
+                await extractor.get_audio_stream(vid)
+            except Exception as e:
+                logger.warning(f"Prewarm failed for {vid}: {str(e)}")
+
+    await asyncio.gather(*(warm(vid) for vid in ids[:HOME_PREWARM]))
+
+async def search_songs(query: str):
+    with tracing.span("ytmusic.search", query=query):
+        return await blocking.run(
+            "ytmusic", ytmusic.search, query, filter="songs", limit=MATCH_CANDIDATES, timeout=6.0
+        )
+
+matcher = TrackMatcher(search_songs, backend=cache_backend)
+
+async def backfill_matches(tracks: List[dict]) -> dict:
+    """Map every Saavn/Deezer track in `tracks` to YouTube ahead of time."""
+    summary = {"matched": 0, "unmatched": 0}
+    async for result in resolve_batch(
+        [t for t in tracks if t.get('id') and t.get('type') in ('saavn', 'deezer')],
+        lambda t: matcher.match(t['id'], t.get('title'), t.get('artist'), t.get('duration')),
+        key=lambda t: t['id'],
+        concurrency=2
+    ):
+        summary["matched" if result["result"] else "unmatched"] += 1
+    return summary
+
+home_snapshot = HomeSnapshot(build_home_payload, backend=cache_backend, after_refresh=prewarm_home)
+
+def snapshot_response(request: Request, snapshot: dict, body):
+    """JSON response carrying the snapshot ETag, or 304 if the client already has it."""
+    etag = snapshot.get("etag")
+    if etag and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    headers = {"Cache-Control": "no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return JSONResponse(content=body, headers=headers)
+
 @app.get("/trending")
 async def trending(request: Request):
     base_url = str(request.base_url)
     try:
-        # 1. Try freshest Saavn charts (usually updated daily)
-        results = await saavn.get_charts(base_url)
-        if results and len(results) > 5:
-            return results
-            
-        # 2. Fallback: Specific YT Music search for "2024 hits"
-        search_engine = VideosSearch("popular music 2025 hits india", limit=15)
-        yt_results = search_engine.result().get('result', [])
-        return [format_search_result(v, base_url) for v in yt_results]
+        snapshot = await home_snapshot.get(base_url)
+        return snapshot_response(request, snapshot, snapshot["payload"]["trending"])
     except Exception as e:
         logger.error(f"Trending Error: {str(e)}")
         # Ultimate fallback
@@ -405,36 +943,50 @@ async def trending(request: Request):
 async def home_content(request: Request):
     base_url = str(request.base_url)
     try:
-        trending_songs = await trending(request)
-        return {
-            "trending": trending_songs,
-            "recently_played": trending_songs[:4] 
-        }
+        snapshot = await home_snapshot.get(base_url)
+        return snapshot_response(request, snapshot, snapshot["payload"])
     except Exception as e:
         logger.error(f"Home Content Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Home content failed")
 
-def is_duration_match(meta_duration, stream_duration):
-    """Verify if the audio duration matches the metadata within a reasonable threshold."""
-    if not meta_duration or not stream_duration:
-        return True # Can't verify, trust but trace
-    
+# Extraction strategy: "sequential" walks the methods in order, "race" runs the
+# top EXTRACTION_RACE_WIDTH at once, "hedged" starts backups once the current
+# method is slower than its usual latency percentile.
+EXTRACTION_MODES = ("sequential", "race", "hedged")
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "sequential")
+EXTRACTION_RACE_WIDTH = int(os.getenv("EXTRACTION_RACE_WIDTH", "3"))
+EXTRACTION_HEDGE_PERCENTILE = float(os.getenv("EXTRACTION_HEDGE_PERCENTILE", "0.9"))
+EXTRACTION_HEDGE_DELAY = float(os.getenv("EXTRACTION_HEDGE_DELAY", "2.0"))
+# Comma-separated subset of extraction methods to use (all by default)
+EXTRACTION_METHODS = set(
+    m.strip() for m in os.getenv("EXTRACTION_METHODS", "Piped,Invidious,pytubefix,yt-dlp,SoundCloud").split(",")
+)
+
+def check_extraction_mode(mode: Optional[str]):
+    if mode and mode not in EXTRACTION_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(EXTRACTION_MODES)}")
+
+# Blocking extraction calls, run through `blocking` (module level so the
+# process pool can pickle them)
+def ytdlp_extract(video_id: str, opts: dict):
     try:
-        # Convert both to float
-        m_dur = float(meta_duration)
-        s_dur = float(stream_duration)
-        
-        # Threshold: 15% or 30 seconds, whichever is smaller
-        threshold = min(m_dur * 0.15, 30.0)
-        diff = abs(m_dur - s_dur)
-        
-        if diff <= threshold:
-            return True
-        logger.warning(f"Duration mismatch: Meta={m_dur}s vs Stream={s_dur}s (Diff={diff}s)")
-        return False
-    except:
-        return True
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+            return {'url': info.get('url'), 'bitrate': info.get('abr', 128), 'duration': info.get('duration')}
+    except yt_dlp.utils.DownloadError as e:
+        # yt-dlp errors carry unpicklable state; keep just the message
+        raise RuntimeError(str(e)) from None
+
+def pytubefix_extract(video_id: str):
+    from pytubefix import YouTube
+    yt = YouTube(f"https://youtube.com/watch?v={video_id}")
+    audio_stream = yt.streams.get_audio_only()
+    if audio_stream:
+        return {'url': audio_stream.url, 'bitrate': 128, 'duration': yt.length}
+    return None
 
+def youtube_search(query: str, limit: int = 15):
+    return VideosSearch(query, limit=limit).result()
 
 class RobustYouTubeExtractor:
     """Uses multiple methods to extract audio streams with maximum reliability."""
@@ -454,123 +1006,285 @@ class RobustYouTubeExtractor:
                 }
             }
         }
+        self.method_stats: Dict[str, dict] = {}
+        self.mode_stats: Dict[str, dict] = {}
 
-    async def get_audio_stream(self, video_id: str) -> Optional[Dict]:
-        """Try multiple methods with optimized fallback and timeouts."""
-        # Check cache first
-        cached = get_cached_stream(video_id)
-        if cached:
-            logger.info(f"Using cached stream for {video_id}")
-            return cached
-
-        # Define methods with priority.
+    def _methods(self, context: Optional[dict] = None):
+        # Define methods with priority. SoundCloud is a different recording, so it goes last.
         methods = [
             (self._extract_with_piped, "Piped"),
             (self._extract_with_invidious, "Invidious"),
-            (self._extract_with_soundcloud, "SoundCloud"),
             (self._extract_with_pytubefix, "pytubefix"),
-            (self._extract_with_ytdlp, "yt-dlp")
+            (self._extract_with_ytdlp, "yt-dlp"),
+            (functools.partial(self._extract_with_soundcloud, context=context), "SoundCloud")
         ]
-        
-        for method, name in methods:
+        return [m for m in methods if m[1] in EXTRACTION_METHODS]
+
+    async def get_audio_stream(self, video_id: str, mode: Optional[str] = None,
+                               context: Optional[dict] = None) -> Optional[Dict]:
+        """Try multiple methods with optimized fallback and timeouts.
+
+        `context` ({'title', 'artist', 'duration'}) enables the SoundCloud fallback.
+        """
+        # Cache hit, or join an extraction already running for this id
+        while True:
             try:
+                return await STREAM_CACHE.get_or_load(video_id, lambda: self._extract(video_id, mode, context))
+            except Overloaded as e:
+                # The shared load was started by (and queued as) lower priority work, e.g.
+                # a prefetch, and got shed: queue again under our own priority and budget
+                if e.priority is None or e.priority <= current_priority():
+                    raise
+
+    async def _extract(self, video_id: str, mode: Optional[str] = None,
+                       context: Optional[dict] = None) -> Optional[Dict]:
+        mode = mode or EXTRACTION_MODE
+        start = time.time()
+        # Shared cap on extraction work; interactive requests get freed slots first
+        async with extraction_gate.slot():
+            with tracing.span("extract", video_id=video_id, mode=mode) as span:
+                if mode == "race":
+                    result = await self._extract_racing(video_id, context)
+                elif mode == "hedged":
+                    result = await self._extract_hedged(video_id, context)
+                else:
+                    result = await self._extract_sequential(video_id, self._methods(context))
+                span.set(method=result['method'] if result else None, found=bool(result))
+
+        stats = self.mode_stats.setdefault(mode, {"requests": 0, "successes": 0, "latencies": deque(maxlen=200)})
+        stats["requests"] += 1
+        if result:
+            stats["successes"] += 1
+            stats["latencies"].append(time.time() - start)
+            self.method_stats[result['method']]["wins"] += 1
+        return result
+
+    def _stats_for(self, name: str) -> dict:
+        if name not in self.method_stats:
+            self.method_stats[name] = {
+                "attempts": 0, "successes": 0, "failures": 0, "timeouts": 0, "wins": 0,
+                "latencies": deque(maxlen=200)
+            }
+        return self.method_stats[name]
+
+    async def _attempt(self, method, name: str, video_id: str) -> Optional[Dict]:
+        """Run one method with its timeout, recording latency and outcome."""
+        stats = self._stats_for(name)
+        stats["attempts"] += 1
+        start = time.time()
+        span = tracing.start_span(f"extract.{name}", method=name, video_id=video_id)
+        try:
+            with tracing.activate(span, end=False):
                 logger.info(f"Trying extraction method: {name}")
                 # SoundCloud usually needs title/artist if video_id is not a SC slug
                 timeout_val = 6.0 if name == "SoundCloud" else 8.0
                 result = await asyncio.wait_for(method(video_id), timeout=timeout_val)
-                
+
+            if result:
+                stats["successes"] += 1
+                stats["latencies"].append(time.time() - start)
+                extraction_seconds.observe(time.time() - start, method=name, outcome="success")
+                span.set(outcome="success")
+                result['method'] = name
+                return result
+            stats["failures"] += 1
+            extraction_seconds.observe(time.time() - start, method=name, outcome="empty")
+            span.set(outcome="empty")
+        except asyncio.TimeoutError as e:
+            stats["timeouts"] += 1
+            extraction_seconds.observe(time.time() - start, method=name, outcome="timeout")
+            span.set(outcome="timeout")
+            span.error(e)
+            logger.warning(f"Method {name} timed out for {video_id}")
+        except asyncio.CancelledError:
+            # Lost a race/hedge: still worth seeing how long it had run
+            extraction_seconds.observe(time.time() - start, method=name, outcome="cancelled")
+            span.set(outcome="cancelled")
+            raise
+        except Exception as e:
+            stats["failures"] += 1
+            extraction_seconds.observe(time.time() - start, method=name, outcome="error")
+            span.set(outcome="error")
+            logger.warning(f"Method {name} failed: {str(e)}")
+        finally:
+            span.end()
+        return None
+
+    async def _extract_sequential(self, video_id: str, methods) -> Optional[Dict]:
+        for method, name in methods:
+            result = await self._attempt(method, name, video_id)
+            if result:
+                return result
+        return None
+
+    async def _extract_racing(self, video_id: str, context: Optional[dict] = None) -> Optional[Dict]:
+        """Run the top-K methods concurrently, keep the first valid result."""
+        methods = self._methods(context)
+        racers = methods[:max(1, EXTRACTION_RACE_WIDTH)]
+        tasks = [asyncio.create_task(self._attempt(m, name, video_id)) for m, name in racers]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                result = await fut
                 if result:
-                    result['method'] = name
-                    set_cached_stream(video_id, result)
                     return result
-            except asyncio.TimeoutError:
-                logger.warning(f"Method {name} timed out for {video_id}")
-            except Exception as e:
-                logger.warning(f"Method {name} failed: {str(e)}")
-                continue
-        
+        finally:
+            for t in tasks:
+                t.cancel()
+        # Every racer failed, walk the remaining methods as before
+        return await self._extract_sequential(video_id, methods[len(racers):])
+
+    def _hedge_delay(self, name: str) -> float:
+        """Latency percentile of past successes; past it we start a backup."""
+        latencies = sorted(self._stats_for(name)["latencies"])
+        if len(latencies) < 5:
+            return EXTRACTION_HEDGE_DELAY
+        idx = min(len(latencies) - 1, int(len(latencies) * EXTRACTION_HEDGE_PERCENTILE))
+        return latencies[idx]
+
+    async def _extract_hedged(self, video_id: str, context: Optional[dict] = None) -> Optional[Dict]:
+        """Start the primary method and add backups whenever it runs slow or fails."""
+        remaining = list(self._methods(context))
+        pending = set()
+        try:
+            while remaining or pending:
+                delay = None
+                if remaining:
+                    method, name = remaining.pop(0)
+                    pending.add(asyncio.create_task(self._attempt(method, name, video_id)))
+                    delay = self._hedge_delay(name)
+                done, pending = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    result = fut.result()
+                    if result:
+                        return result
+        finally:
+            for t in pending:
+                t.cancel()
         return None
 
+    def stats(self) -> dict:
+        def summary(latencies):
+            ordered = sorted(latencies)
+            if not ordered:
+                return {"p50": None, "p95": None}
+            return {
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3)
+            }
+
+        return {
+            "default_mode": EXTRACTION_MODE,
+            "race_width": EXTRACTION_RACE_WIDTH,
+            "methods": {
+                name: {**{k: v for k, v in s.items() if k != "latencies"}, **summary(s["latencies"])}
+                for name, s in self.method_stats.items()
+            },
+            "modes": {
+                mode: {"requests": s["requests"], "successes": s["successes"], **summary(s["latencies"])}
+                for mode, s in self.mode_stats.items()
+            }
+        }
+
     async def _extract_with_ytdlp(self, video_id: str):
-        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-            return {'url': info.get('url'), 'bitrate': info.get('abr', 128), 'duration': info.get('duration')}
+        return await blocking.run("yt-dlp", ytdlp_extract, video_id, self.ydl_opts)
 
     async def _extract_with_piped(self, video_id: str):
-        instance = random.choice(PIPED_INSTANCES)
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.get(f"{instance}/streams/{video_id}")
-            if resp.status_code == 200:
-                data = resp.json()
-                audio_streams = data.get('audioStreams', [])
-                if audio_streams:
-                    best = sorted(audio_streams, key=lambda x: x.get('bitrate', 0), reverse=True)[0]
-                    return {'url': best.get('url'), 'bitrate': best.get('bitrate', 128), 'duration': data.get('duration')}
+        client = http_pool.client("piped")
+        for instance in piped_pool.candidates(2):
+            start = time.time()
+            try:
+                resp = await client.get(f"{instance}/streams/{video_id}", timeout=INSTANCE_TIMEOUT)
+                if resp.status_code == 200:
+                    data = resp.json()
+                    audio_streams = data.get('audioStreams', [])
+                    if audio_streams:
+                        piped_pool.record_success(instance, time.time() - start)
+                        best = sorted(audio_streams, key=lambda x: x.get('bitrate', 0), reverse=True)[0]
+                        return {'url': best.get('url'), 'bitrate': best.get('bitrate', 128), 'duration': data.get('duration')}
+                    piped_pool.record_failure(instance, "no audio streams")
+                else:
+                    piped_pool.record_failure(instance, f"HTTP {resp.status_code}")
+            except Exception as e:
+                piped_pool.record_failure(instance, str(e) or type(e).__name__)
         return None
 
     async def _extract_with_invidious(self, video_id: str):
-        instance = random.choice(INVIDIOUS_INSTANCES)
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            resp = await client.get(f"{instance}/api/v1/videos/{video_id}")
-            if resp.status_code == 200:
-                data = resp.json()
-                adaptive_formats = data.get('adaptiveFormats', [])
-                audio_formats = [f for f in adaptive_formats if f.get('type', '').startswith('audio/')]
-                if audio_formats:
-                    best = sorted(audio_formats, key=lambda x: int(x.get('bitrate') or 0), reverse=True)[0]
-                    return {'url': best.get('url'), 'bitrate': int(best.get('bitrate', 128)), 'duration': data.get('lengthSeconds')}
-        return None
-
-    async def _get_sc_client_id(self) -> Optional[str]:
-        """Fetch a temporary SoundCloud client ID."""
-        if SC_CID_CACHE["cid"] and SC_CID_CACHE["expiry"] > time.time():
-            return SC_CID_CACHE["cid"]
-        
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                r = await client.get("https://soundcloud.com")
-                if r.status_code == 200:
-                    scripts = re.findall(r'src="([^"]+/assets/[^"]+\.js)"', r.text)
-                    for script_url in reversed(scripts):
-                        sr = await client.get(script_url)
-                        cid_match = re.search(r'client_id:"([a-zA-Z0-9]{32})"', sr.text)
-                        if cid_match:
-                            cid = cid_match.group(1)
-                            SC_CID_CACHE["cid"] = cid
-                            SC_CID_CACHE["expiry"] = time.time() + 3600
-                            return cid
-        except: pass
+        client = http_pool.client("invidious")
+        for instance in invidious_pool.candidates(2):
+            start = time.time()
+            try:
+                resp = await client.get(f"{instance}/api/v1/videos/{video_id}", timeout=INSTANCE_TIMEOUT)
+                if resp.status_code == 200:
+                    data = resp.json()
+                    adaptive_formats = data.get('adaptiveFormats', [])
+                    audio_formats = [f for f in adaptive_formats if f.get('type', '').startswith('audio/')]
+                    if audio_formats:
+                        invidious_pool.record_success(instance, time.time() - start)
+                        best = sorted(audio_formats, key=lambda x: int(x.get('bitrate') or 0), reverse=True)[0]
+                        return {'url': best.get('url'), 'bitrate': int(best.get('bitrate', 128)), 'duration': data.get('lengthSeconds')}
+                    invidious_pool.record_failure(instance, "no audio formats")
+                else:
+                    invidious_pool.record_failure(instance, f"HTTP {resp.status_code}")
+            except Exception as e:
+                invidious_pool.record_failure(instance, str(e) or type(e).__name__)
         return None
 
-    async def _extract_with_soundcloud(self, video_id: str):
-        """Search SoundCloud for fallback stream."""
-        # This needs title/artist context which is rarely available in get_audio_stream(video_id)
-        # However, for directSC requests or if we enhance the extractor later, we define it.
-        return None
+    async def _extract_with_soundcloud(self, video_id: str, context: Optional[dict] = None):
+        """Search SoundCloud for a fallback stream of the same song (needs title/artist context)."""
+        if not context or not context.get('title'):
+            return None
+        result = await soundcloud.find_stream(context['title'], context.get('artist'), context.get('duration'))
+        if result:
+            # Not this video id's own audio: cached briefly, never shared through the backend
+            result['fallback'] = True
+        return result
 
     async def _extract_with_pytubefix(self, video_id: str):
-        from pytubefix import YouTube
-        yt = YouTube(f"https://youtube.com/watch?v={video_id}")
-        audio_stream = yt.streams.get_audio_only()
-        if audio_stream:
-            return {'url': audio_stream.url, 'bitrate': 128, 'duration': yt.length}
-        return None
+        return await blocking.run("pytubefix", pytubefix_extract, video_id)
 
 extractor = RobustYouTubeExtractor()
 
-async def proxy_stream_iter(url: str, start_byte: int = 0):
-    """Generator to proxy audio bytes with range support."""
-    timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=30)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, Gecko) Chrome/120.0.0.0 Safari/537.36',
-        }
-        if start_byte > 0:
-            headers['Range'] = f'bytes={start_byte}-'
-            
-        async with session.get(url, headers=headers) as resp:
-            async for chunk in resp.content.iter_chunked(64 * 1024): # 64KB chunks
-                yield chunk
+def segment_key(yt_id: str, stream_info: dict) -> str:
+    """Segment cache key; a SoundCloud fallback is a different file than any YouTube format."""
+    if stream_info['method'] == "SoundCloud":
+        return f"sc:{yt_id}"
+    return f"yt:{yt_id}:{stream_info['bitrate']}"
+
+client_throughput = ThroughputTracker()
+
+def kbps_of(bitrate) -> Optional[float]:
+    """Extractor bitrates come in bps (Piped/Invidious) or kbps (yt-dlp, SoundCloud)."""
+    try:
+        bitrate = float(bitrate)
+    except (TypeError, ValueError):
+        return None
+    return bitrate / 1000 if bitrate > 1000 else bitrate
+
+async def deliver_audio(request: Request, key: str, url: str, source: str, media_type: str,
+                        source_kbps: Optional[float], quality: Optional[str], codec: str,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """Serve `url` as is (segment cache) or re-encoded for the client's `quality`.
+
+    quality=auto picks a bitrate from the client's measured throughput;
+    a target that isn't below the source's own bitrate, a missing ffmpeg
+    or a full transcode pool all mean the original is served.
+    """
+    client = client_key(request)
+    target = None
+    if quality and transcoder.available:
+        target = client_throughput.target_bitrate(client) if quality == "auto" else int(quality)
+        if source_kbps and target >= source_kbps:
+            target = None
+    if target:
+        try:
+            return client_throughput.meter(
+                client, await transcoder.serve(key, url, codec, target, source=source, headers=headers)
+            )
+        except TranscodeBusy as e:
+            logger.info(f"Serving original for {key}: {str(e)}")
+    return client_throughput.meter(client, await segment_cache.serve(
+        key, url, request.headers.get('range'), source=source, media_type=media_type, headers=headers
+    ))
 
 @app.get("/stream")
 async def get_stream(
@@ -579,79 +1293,95 @@ async def get_stream(
     title: Optional[str] = Query(None), 
     artist: Optional[str] = Query(None),
     duration_total: Optional[str] = Query(None),
-    enc_url: Optional[str] = Query(None)
+    enc_url: Optional[str] = Query(None),
+    mode: Optional[str] = Query(None),
+    quality: Optional[str] = Query(None, description="original (default), auto, low/medium/high/max or 64/96/160/320"),
+    codec: str = Query(TRANSCODE_CODEC, description="Transcode codec: aac or opus")
 ):
-    base_url = str(request.base_url)
-    if "onrender.com" in base_url:
-        base_url = base_url.replace("http://", "https://")
+    check_extraction_mode(mode)
+    try:
+        quality = parse_quality(quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if codec not in CODECS:
+        raise HTTPException(status_code=400, detail=f"codec must be one of {', '.join(CODECS)}")
     
     # JioSaavn Direct Decryption
     if id.startswith('saavn_') or enc_url:
-        secret_url = enc_url
-        if not secret_url:
-            try:
-                sid = id.replace('saavn_', '')
-                async with httpx.AsyncClient() as client:
-                    ds = await client.get(f"https://www.jiosaavn.com/api.php?__call=song.getDetails&pids={sid}&_format=json&_marker=0&api_version=4&ctx=web6dot0", timeout=5.0)
-                    if ds.status_code == 200:
-                        s_data = ds.json()
-                        song_obj = s_data.get(sid) or list(s_data.values())[0] if s_data else {}
-                        secret_url = song_obj.get('encrypted_media_url')
-            except: pass
-        
-        if secret_url:
-            stream_link = decrypt_saavn_url(secret_url)
+        # Decrypted URL memoized per song; pid lookups are batched with other requests
+        with tracing.span("saavn.media_url", pid=id.replace('saavn_', '')) as span:
+            stream_link = await saavn_meta.media_url(id.replace('saavn_', ''), enc_url)
             if stream_link:
+                # Best bitrate the CDN has for this song (checked once, remembered)
+                stream_link = await best_available(stream_link)
+                span.set(quality=saavn_crypto.quality_of(stream_link))
+        if stream_link:
+            for candidate in saavn_crypto.quality_candidates(stream_link, saavn_crypto.quality_of(stream_link) or 320):
                 # Proxy Saavn too for reliability
-                return StreamingResponse(proxy_stream_iter(stream_link), media_type="audio/mpeg")
+                bitrate = saavn_crypto.quality_of(candidate)
+                cache_key = f"saavn:{id.replace('saavn_', '')}:{bitrate or 'std'}"
+                try:
+                    return await deliver_audio(
+                        request, cache_key, candidate, "saavn", media_type_for(candidate, "audio/mp4"),
+                        bitrate, quality, codec
+                    )
+                except UpstreamError as e:
+                    logger.warning(f"Saavn stream failed for {id} at {bitrate}kbps: {str(e)}")
+                    mark_unavailable(candidate)
 
     # YouTube Extraction with Robust Fallback
     yt_id = id
     if (len(id) != 11 or id.startswith('saavn_')) and title and artist:
-        try:
-            search_results = ytmusic.search(f"{title} {artist}", filter="songs", limit=1)
-            if search_results:
-                yt_id = search_results[0].get('videoId')
-        except: pass
+        yt_id = await matcher.match(id.replace('saavn_', ''), title, artist, duration_total) or yt_id
 
     if yt_id:
-        stream_info = await extractor.get_audio_stream(yt_id)
-        if stream_info:
-            # Handle Range header for scrubbing
-            range_header = request.headers.get('range')
-            start_byte = 0
-            if range_header:
-                try:
-                    start_byte = int(range_header.replace('bytes=', '').split('-')[0])
-                except: pass
-
-            return StreamingResponse(
-                proxy_stream_iter(stream_info['url'], start_byte),
-                status_code=206 if range_header else 200,
-                media_type="audio/mpeg",
-                headers={
-                    "X-Stream-Source": stream_info['method'],
-                    "X-Bitrate": str(stream_info['bitrate']),
-                    "Accept-Ranges": "bytes"
-                }
-            )
+        context = {"title": title, "artist": artist, "duration": duration_total}
+        stream_info = await extractor.get_audio_stream(yt_id, mode, context)
+        # A cached signed URL can still be refused (expired, IP-bound): re-extract once
+        for attempt in range(2):
+            if not stream_info:
+                break
+            headers = {
+                "X-Stream-Source": stream_info['method'],
+                "X-Bitrate": str(stream_info['bitrate'])
+            }
+            try:
+                if stream_info.get('protocol') == 'hls':
+                    # SoundCloud HLS: hand over the playlist, segments are fetched directly
+                    return await stream_proxy.open(
+                        stream_info['url'], None, source=stream_info['method'],
+                        media_type="application/vnd.apple.mpegurl", headers=headers
+                    )
+                return await deliver_audio(
+                    request, segment_key(yt_id, stream_info), stream_info['url'], stream_info['method'],
+                    media_type_for(stream_info['url']), kbps_of(stream_info['bitrate']), quality, codec,
+                    headers=headers
+                )
+            except UpstreamError as e:
+                logger.warning(f"Upstream refused {stream_info['method']} stream for {yt_id}: {str(e)}")
+                await STREAM_CACHE.invalidate(yt_id)
+                if attempt == 0:
+                    stream_info = await extractor.get_audio_stream(yt_id, mode, context)
 
     raise HTTPException(status_code=503, detail="No robust stream available")
 
-@app.get("/stream-info")
-async def get_stream_info(
-    request: Request,
-    id: str = Query(...), 
-    title: Optional[str] = Query(None), 
-    artist: Optional[str] = Query(None),
-    duration_total: Optional[str] = Query(None),
-    enc_url: Optional[str] = Query(None)
-):
-    """Metadata-only endpoint for the frontend to get the actual stream URL and info."""
-    base_url = str(request.base_url)
-    if "onrender.com" in base_url:
-        base_url = base_url.replace("http://", "https://")
-    
+async def resolve_track(
+    base_url: str,
+    id: str,
+    title: Optional[str] = None,
+    artist: Optional[str] = None,
+    enc_url: Optional[str] = None,
+    mode: Optional[str] = None,
+    duration_total=None
+) -> Optional[dict]:
+    """Resolve one track to its playable /stream URL, warming the stream cache on the way."""
+    with tracing.span("resolve_track", track_id=id, mode=mode) as span:
+        result = await _resolve_track(base_url, id, title, artist, enc_url, mode, duration_total)
+        span.set(resolved=result is not None)
+        return result
+
+async def _resolve_track(base_url: str, id: str, title: Optional[str], artist: Optional[str],
+                         enc_url: Optional[str], mode: Optional[str], duration_total) -> Optional[dict]:
     stream_url = None
     thumbnail = None
     duration = 0
@@ -660,17 +1390,12 @@ async def get_stream_info(
     if id.startswith('saavn_') or enc_url:
         secret_url = enc_url
         if not secret_url:
-            try:
-                sid = id.replace('saavn_', '')
-                async with httpx.AsyncClient() as client:
-                    ds = await client.get(f"https://www.jiosaavn.com/api.php?__call=song.getDetails&pids={sid}&_format=json&_marker=0&api_version=4&ctx=web6dot0", timeout=5.0)
-                    if ds.status_code == 200:
-                        s_data = ds.json()
-                        song_obj = s_data.get(sid) or list(s_data.values())[0] if s_data else {}
-                        secret_url = song_obj.get('encrypted_media_url')
-                        thumbnail = song_obj.get('image') or song_obj.get('thumbnail')
-                        duration = int(song_obj.get('duration', 0))
-            except: pass
+            with tracing.span("saavn.lookup", pid=id.replace('saavn_', '')):
+                song_obj = await saavn_meta.get(id.replace('saavn_', '')) or {}
+            secret_url = song_obj.get('encrypted_media_url')
+            thumbnail = song_obj.get('image') or song_obj.get('thumbnail')
+            try: duration = int(song_obj.get('duration', 0))
+            except: duration = 0
         
         if secret_url:
             stream_url = f"{base_url.rstrip('/')}/stream?id={id}&enc_url={urllib.parse.quote(secret_url)}"
@@ -679,21 +1404,18 @@ async def get_stream_info(
     if not stream_url:
         yt_id = id
         if (len(id) != 11 or id.startswith('saavn_')) and title and artist:
-            try:
-                search_results = ytmusic.search(f"{title} {artist}", filter="songs", limit=1)
-                if search_results:
-                    yt_id = search_results[0].get('videoId')
-            except: pass
+            yt_id = await matcher.match(id.replace('saavn_', ''), title, artist, duration_total) or yt_id
 
         if yt_id:
-            stream_info = await extractor.get_audio_stream(yt_id)
+            context = {"title": title, "artist": artist, "duration": duration_total}
+            stream_info = await extractor.get_audio_stream(yt_id, mode, context)
             if stream_info:
                 stream_url = f"{base_url.rstrip('/')}/stream?id={yt_id}"
                 duration = stream_info.get('duration', 0)
                 thumbnail = f"https://img.youtube.com/vi/{yt_id}/maxresdefault.jpg"
     
     if not stream_url:
-        raise HTTPException(status_code=503, detail="No robust stream available")
+        return None
 
     # Final polish for thumbnail URL
     if thumbnail and isinstance(thumbnail, str):
@@ -706,87 +1428,257 @@ async def get_stream_info(
         "id": id
     }
 
+@app.get("/stream-info")
+async def get_stream_info(
+    request: Request,
+    id: str = Query(...), 
+    title: Optional[str] = Query(None), 
+    artist: Optional[str] = Query(None),
+    duration_total: Optional[str] = Query(None),
+    enc_url: Optional[str] = Query(None),
+    mode: Optional[str] = Query(None)
+):
+    """Metadata-only endpoint for the frontend to get the actual stream URL and info."""
+    check_extraction_mode(mode)
+    base_url = str(request.base_url)
+    if "onrender.com" in base_url:
+        base_url = base_url.replace("http://", "https://")
+
+    info = await resolve_track(base_url, id, title, artist, enc_url, mode, duration_total)
+    if not info:
+        raise HTTPException(status_code=503, detail="No robust stream available")
+    return info
+
+class ResolveTrack(BaseModel):
+    id: str
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    enc_url: Optional[str] = None
+    duration: Optional[float] = None
+    # Lower resolves first; defaults to the position in `tracks` (queue order)
+    priority: Optional[int] = None
+
+class ResolveRequest(BaseModel):
+    tracks: List[ResolveTrack]
+    mode: Optional[str] = None
+
+@app.post("/resolve")
+async def resolve_tracks(request: Request, body: ResolveRequest, format: Optional[str] = Query(None)):
+    """Resolve many tracks at once, streaming one NDJSON line (or SSE event) per track as it finishes.
+
+    Every resolved track is left in the stream cache, so the following
+    /stream call for it starts immediately.
+    """
+    check_extraction_mode(body.mode)
+    if len(body.tracks) > RESOLVE_MAX_TRACKS:
+        raise HTTPException(status_code=413, detail=f"At most {RESOLVE_MAX_TRACKS} tracks per request")
+    charge_tracks(request, len(body.tracks))
+    base_url = str(request.base_url)
+    if "onrender.com" in base_url:
+        base_url = base_url.replace("http://", "https://")
+    sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+
+    async def lines():
+        async for result in resolve_batch(
+            body.tracks,
+            lambda t: resolve_track(base_url, t.id, t.title, t.artist, t.enc_url, body.mode, t.duration),
+            key=lambda t: t.id,
+            priority=lambda t, i: i if t.priority is None else t.priority
+        ):
+            yield encode_result(result, sse)
+
+    return StreamingResponse(
+        lines(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/warmup")
-async def warmup(ids: str = Query(...)):
-    """Pre-extract multiple IDs to warm up the cache."""
-    id_list = ids.split(',')
+async def warmup(request: Request, ids: str = Query(...)):
+    """Pre-extract multiple IDs to warm up the cache (superseded by POST /resolve)."""
+    video_ids = [vid for vid in ids.split(',') if vid]
+    if len(video_ids) > RESOLVE_MAX_TRACKS:
+        raise HTTPException(status_code=413, detail=f"At most {RESOLVE_MAX_TRACKS} ids per request")
+    charge_tracks(request, len(video_ids))
     warmed = []
-    
-    async def task(vid):
-        try:
-            res = await extractor.get_audio_stream(vid)
-            if res: warmed.append(vid)
-        except: pass
-
-    # Run up to 5 warmups in parallel to avoid overwhelming
-    chunks = [id_list[i:i + 5] for i in range(0, len(id_list), 5)]
-    for chunk in chunks:
-        await asyncio.gather(*(task(vid) for vid in chunk))
+    async for result in resolve_batch(
+        video_ids,
+        lambda vid: extractor.get_audio_stream(vid),
+        key=lambda vid: vid
+    ):
+        if result["ok"]:
+            warmed.append(result["id"])
     
     return {"warmed": warmed, "count": len(warmed)}
 
+# First bytes of each queued YouTube track to pre-buffer into the segment cache (0 = off)
+PREFETCH_PREBUFFER_BYTES = int(os.getenv("PREFETCH_PREBUFFER_BYTES", "0"))
+
+async def prefetch_track(base_url: str, track: dict, refresh: bool) -> Optional[float]:
+    """Resolve (and optionally pre-buffer) one queued track; returns when its stream URL expires."""
+    info = await resolve_track(
+        base_url, track["id"], track.get("title"), track.get("artist"), track.get("enc_url"),
+        duration_total=track.get("duration")
+    )
+    if not info:
+        raise RuntimeError("No robust stream available")
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(info["stream_url"]).query)
+    if "enc_url" in query:
+        # Saavn media URLs aren't time-limited
+        return None
+    yt_id = query["id"][0]
+    if refresh:
+        await STREAM_CACHE.invalidate(yt_id)
+        stream_info = await extractor.get_audio_stream(
+            yt_id, context={"title": track.get("title"), "artist": track.get("artist"), "duration": track.get("duration")}
+        )
+    else:
+        stream_info = STREAM_CACHE.get(yt_id, count=False)
+    if stream_info and PREFETCH_PREBUFFER_BYTES > 0 and stream_info.get('protocol') != 'hls':
+        await segment_cache.prefetch(segment_key(yt_id, stream_info), stream_info['url'], PREFETCH_PREBUFFER_BYTES)
+    return STREAM_CACHE.expiry(yt_id)
+
+def extractors_busy() -> bool:
+    """True while foreground extractions are using every yt-dlp worker."""
+    pool = blocking.stats().get("yt-dlp", {})
+    return pool.get("in_flight", 0) >= pool.get("max_workers", 1)
+
+prefetcher = PrefetchScheduler(prefetch_track, busy=extractors_busy)
+
+class QueueUpdate(BaseModel):
+    device_id: str
+    tracks: List[ResolveTrack]
+    # Index of the playing track in `tracks`
+    position: int = 0
+
+@app.post("/queue")
+async def update_queue(request: Request, body: QueueUpdate):
+    """Play-queue hint: the backend keeps this device's upcoming tracks resolved."""
+    if len(body.tracks) > PREFETCH_MAX_TRACKS:
+        raise HTTPException(status_code=413, detail=f"At most {PREFETCH_MAX_TRACKS} tracks per queue")
+    base_url = str(request.base_url)
+    if "onrender.com" in base_url:
+        base_url = base_url.replace("http://", "https://")
+    window = prefetcher.update(
+        body.device_id, base_url, [t.dict(exclude_none=True) for t in body.tracks], body.position
+    )
+    return {"prefetching": window}
+
+@app.delete("/queue/{device_id}")
+async def clear_queue(device_id: str):
+    prefetcher.forget(device_id)
+    return {"status": "ok"}
+
+class BackfillRequest(BaseModel):
+    tracks: List[ResolveTrack] = []
+    # Saavn playlist/chart ids whose songs should be mapped too
+    playlist_ids: List[str] = []
+
+@app.post("/match/backfill")
+async def backfill_track_matches(request: Request, body: BackfillRequest):
+    """Bulk-populate the catalog -> YouTube mapping for whole playlists/charts."""
+    tracks = [{**t.dict(), 'type': 'saavn' if not t.id.isdigit() else 'deezer'} for t in body.tracks]
+    playlists = await asyncio.gather(
+        *(saavn.get_playlist(pid, str(request.base_url)) for pid in body.playlist_ids),
+        return_exceptions=True
+    )
+    for songs in playlists:
+        if isinstance(songs, list):
+            tracks.extend(songs)
+    summary = await backfill_matches(tracks)
+    return {**summary, "tracks": len(tracks)}
+
 @app.get("/stream/health/{video_id}")
-async def check_stream_health(video_id: str):
-    """Check if a song is playable."""
+async def check_stream_health(
+    video_id: str,
+    mode: Optional[str] = Query(None),
+    fresh: bool = Query(False)
+):
+    """Check if a song is playable. `fresh` skips the cache to time an extraction mode."""
+    check_extraction_mode(mode)
     start_time = time.time()
     try:
-        stream_info = await extractor.get_audio_stream(video_id)
+        if fresh:
+            stream_info = await extractor._extract(video_id, mode)
+        else:
+            stream_info = await extractor.get_audio_stream(video_id, mode)
         return {
             "available": bool(stream_info),
+            "mode": mode or EXTRACTION_MODE,
             "method": stream_info.get('method') if stream_info else None,
             "response_time": time.time() - start_time,
             "bitrate": stream_info.get('bitrate') if stream_info else None
         }
+    except Overloaded:
+        raise
     except Exception as e:
         return {"available": False, "error": str(e)}
 
+@app.get("/instances")
+async def instance_scoreboard():
+    """Live health scoreboard for the Piped/Invidious/Lavalink pools."""
+    return {
+        "piped": piped_pool.scoreboard(),
+        "invidious": invidious_pool.scoreboard(),
+        "lavalink": lavalink_pool.scoreboard(),
+        "probe_interval": INSTANCE_PROBE_INTERVAL
+    }
+
+@app.get("/extractor/stats")
+async def extractor_stats():
+    """Per-method and per-mode extraction outcomes and latencies."""
+    return extractor.stats()
+
 @app.get("/test/stream/{video_id}")
 async def test_specific_method(video_id: str, method: str = Query("yt-dlp")):
     """Internal debugging endpoint."""
-    try:
-        if method == "yt-dlp": res = await extractor._extract_with_ytdlp(video_id)
-        elif method == "piped": res = await extractor._extract_with_piped(video_id)
-        elif method == "invidious": res = await extractor._extract_with_invidious(video_id)
-        elif method == "pytubefix": res = await extractor._extract_with_pytubefix(video_id)
-        else: return {"error": "Invalid method"}
-        return {"available": bool(res), "data": res}
-    except Exception as e:
-        return {"available": False, "error": str(e)}
+    # Diagnostics share the extraction cap (lowest priority, shed rather than queued)
+    async with extraction_gate.slot():
+        try:
+            if method == "yt-dlp": res = await extractor._extract_with_ytdlp(video_id)
+            elif method == "piped": res = await extractor._extract_with_piped(video_id)
+            elif method == "invidious": res = await extractor._extract_with_invidious(video_id)
+            elif method == "pytubefix": res = await extractor._extract_with_pytubefix(video_id)
+            else: return {"error": "Invalid method"}
+            return {"available": bool(res), "data": res}
+        except Exception as e:
+            return {"available": False, "error": str(e)}
 
 @app.get("/test-youtube")
 async def test_youtube_extraction(video_id: str = Query("dQw4w9WgXcQ")):
     """Diagnostic endpoint to test YouTube extraction across all methods."""
-    start_time = time.time()
-    try:
-        results = {}
-        # Test each method individually for clear diagnostics
-        methods = [
-            (extractor._extract_with_ytdlp, "yt-dlp"),
-            (extractor._extract_with_piped, "piped"),
-            (extractor._extract_with_invidious, "invidious"),
-            (extractor._extract_with_pytubefix, "pytubefix")
-        ]
+    async with extraction_gate.slot():
+        start_time = time.time()
+        try:
+            results = {}
+            # Test each method individually for clear diagnostics
+            methods = [
+                (extractor._extract_with_ytdlp, "yt-dlp"),
+                (extractor._extract_with_piped, "piped"),
+                (extractor._extract_with_invidious, "invidious"),
+                (extractor._extract_with_pytubefix, "pytubefix")
+            ]
         
-        for method_func, name in methods:
-            m_start = time.time()
-            try:
-                res = await method_func(video_id)
-                results[name] = {
-                    "success": bool(res),
-                    "time": time.time() - m_start,
-                    "data": res if res else None
-                }
-            except Exception as e:
-                results[name] = {"success": False, "error": str(e), "time": time.time() - m_start}
+            for method_func, name in methods:
+                m_start = time.time()
+                try:
+                    res = await method_func(video_id)
+                    results[name] = {
+                        "success": bool(res),
+                        "time": time.time() - m_start,
+                        "data": res if res else None
+                    }
+                except Exception as e:
+                    results[name] = {"success": False, "error": str(e), "time": time.time() - m_start}
                 
-        return {
-            "video_id": video_id,
-            "total_time": time.time() - start_time,
-            "results": results
-        }
-    except Exception as e:
-        logger.error(f"Global extraction test error: {str(e)}")
-        return {"error": str(e), "status": "failed"}
+            return {
+                "video_id": video_id,
+                "total_time": time.time() - start_time,
+                "results": results
+            }
+        except Exception as e:
+            logger.error(f"Global extraction test error: {str(e)}")
+            return {"error": str(e), "status": "failed"}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,191 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("VortexMusic")
+
+# Tracks kept resolved ahead of each device's current position
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "3"))
+# Global cap on prefetches running at once, across all devices
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Re-resolve a signed URL this long before it expires
+PREFETCH_REFRESH_MARGIN = float(os.getenv("PREFETCH_REFRESH_MARGIN", "600"))
+PREFETCH_REFRESH_INTERVAL = float(os.getenv("PREFETCH_REFRESH_INTERVAL", "60"))
+# Forget devices that haven't posted their queue for this long
+PREFETCH_DEVICE_TTL = float(os.getenv("PREFETCH_DEVICE_TTL", "3600"))
+PREFETCH_RETRY_DELAY = 300.0
+# Longest queue a device may post, and how many devices are tracked at once
+PREFETCH_MAX_TRACKS = int(os.getenv("PREFETCH_MAX_TRACKS", "500"))
+PREFETCH_MAX_DEVICES = int(os.getenv("PREFETCH_MAX_DEVICES", "1000"))
+
+# prefetch(base_url, track, refresh) -> when the resolved stream URL expires (None: never)
+PrefetchFn = Callable[[str, dict, bool], Awaitable[Optional[float]]]
+
+
+class DeviceQueue:
+    def __init__(self, base_url: str, tracks: List[dict], position: int):
+        self.base_url = base_url
+        self.tracks = tracks
+        self.position = position
+        self.updated_at = time.time()
+
+    def window(self, depth: int) -> List[Tuple[int, dict]]:
+        """(distance from the playing track, track) for the current track and the next `depth`."""
+        start = max(0, self.position)
+        return [(i - start, t) for i, t in enumerate(self.tracks[start:start + depth + 1], start)]
+
+
+class PrefetchScheduler:
+    """Keeps the next few tracks of every known play queue resolved.
+
+    Clients post their queue and position; the tracks closest to each
+    device's playing position are resolved first, at most `budget` at a
+    time, and only while `busy()` reports spare foreground capacity.
+    Resolved tracks are re-resolved shortly before their signed URL
+    expires for as long as they stay in some device's window.
+    """
+
+    def __init__(self, prefetch: PrefetchFn, depth: int = PREFETCH_DEPTH, budget: int = PREFETCH_CONCURRENCY,
+                 busy: Optional[Callable[[], bool]] = None):
+        self.prefetch = prefetch
+        self.depth = depth
+        self.budget = budget
+        self.busy = busy or (lambda: False)
+        # Least recently updated first
+        self.devices: "OrderedDict[str, DeviceQueue]" = OrderedDict()
+        # track id -> expiry of its resolved URL (None: doesn't expire)
+        self._resolved: Dict[str, Optional[float]] = {}
+        # track id -> time of the last failed attempt
+        self._failed: Dict[str, float] = {}
+        self._heap: list = []
+        self._queued = set()
+        self._running = set()
+        self._wakeup = asyncio.Event()
+        self._seq = 0
+        self.completed = 0
+        self.refreshed = 0
+        self.failures = 0
+        self.deferred = 0
+
+    def update(self, device_id: str, base_url: str, tracks: List[dict], position: int) -> List[str]:
+        """Record a device's queue and schedule its window; returns the window's track ids."""
+        # Only the window is ever looked at until the next update, so that's all that is kept
+        start = max(0, position)
+        queue = DeviceQueue(base_url, tracks[start:start + self.depth + 1], 0)
+        self.devices[device_id] = queue
+        self.devices.move_to_end(device_id)
+        while len(self.devices) > PREFETCH_MAX_DEVICES:
+            self.devices.popitem(last=False)
+        self._schedule()
+        return [t["id"] for _, t in queue.window(self.depth)]
+
+    def forget(self, device_id: str):
+        if self.devices.pop(device_id, None) is not None:
+            self._schedule()
+
+    def _due(self, track_id: str, now: float) -> Optional[bool]:
+        """None if nothing to do, else whether it's a refresh of an already resolved track."""
+        if track_id in self._queued or track_id in self._running:
+            return None
+        if track_id in self._resolved:
+            expires = self._resolved[track_id]
+            if expires is None or expires - now > PREFETCH_REFRESH_MARGIN:
+                return None
+            return True
+        if now - self._failed.get(track_id, 0) < PREFETCH_RETRY_DELAY:
+            return None
+        return False
+
+    def _schedule(self):
+        now = time.time()
+        while self.devices:
+            oldest = next(iter(self.devices.values()))
+            if now - oldest.updated_at <= PREFETCH_DEVICE_TTL:
+                break
+            self.devices.popitem(last=False)
+
+        windows = [(queue, queue.window(self.depth)) for queue in self.devices.values()]
+        wanted = {t["id"] for _, window in windows for _, t in window}
+        if any(entry[2] not in wanted for entry in self._heap):
+            # Left behind by a replaced queue or a forgotten device
+            self._heap = [entry for entry in self._heap if entry[2] in wanted]
+            heapq.heapify(self._heap)
+            self._queued = {entry[2] for entry in self._heap}
+
+        for queue, window in windows:
+            for distance, track in window:
+                refresh = self._due(track["id"], now)
+                if refresh is None:
+                    continue
+                self._seq += 1
+                heapq.heappush(self._heap, (distance, self._seq, track["id"], queue.base_url, track, refresh))
+                self._queued.add(track["id"])
+        if self._heap:
+            self._wakeup.set()
+
+    def _prune(self):
+        """Drop state for tracks that left every window."""
+        wanted = {t["id"] for q in self.devices.values() for _, t in q.window(self.depth)}
+        for track_id in list(self._resolved):
+            if track_id not in wanted:
+                del self._resolved[track_id]
+        for track_id in list(self._failed):
+            if track_id not in wanted:
+                del self._failed[track_id]
+
+    async def _worker(self):
+        while True:
+            while not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if self.busy():
+                # Foreground requests own the extractors right now
+                self.deferred += 1
+                await asyncio.sleep(0.5)
+                continue
+            _, _, track_id, base_url, track, refresh = heapq.heappop(self._heap)
+            self._queued.discard(track_id)
+            self._running.add(track_id)
+            try:
+                self._resolved[track_id] = await self.prefetch(base_url, track, refresh)
+                self._failed.pop(track_id, None)
+                if refresh:
+                    self.refreshed += 1
+                else:
+                    self.completed += 1
+            except Exception as e:
+                self.failures += 1
+                self._failed[track_id] = time.time()
+                self._resolved.pop(track_id, None)
+                logger.warning(f"Prefetch failed for {track_id}: {str(e)}")
+            finally:
+                self._running.discard(track_id)
+
+    async def run(self, interval: float = PREFETCH_REFRESH_INTERVAL):
+        workers = [asyncio.create_task(self._worker()) for _ in range(max(1, self.budget))]
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                self._prune()
+                self._schedule()
+        finally:
+            for w in workers:
+                w.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self.devices),
+            "depth": self.depth,
+            "budget": self.budget,
+            "resolved": len(self._resolved),
+            "queued": len(self._heap),
+            "running": len(self._running),
+            "completed": self.completed,
+            "refreshed": self.refreshed,
+            "failures": self.failures,
+            "deferred": self.deferred,
+        }
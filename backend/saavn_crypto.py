@@ -0,0 +1,151 @@
+import os
+import re
+import time
+import base64
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import List, Optional
+
+import aiohttp
+from Crypto.Cipher import DES
+
+from http_pool import http_pool
+from stream_proxy import USER_AGENT
+
+logger = logging.getLogger("VortexMusic")
+
+# DES key for Saavn is exactly 8 bytes
+SAAVN_DES_KEY = b"38343635"
+SAAVN_QUALITIES = (320, 160, 96)
+# Preferred bitrate; lower ones are used when a song isn't encoded at it
+SAAVN_QUALITY = int(os.getenv("SAAVN_QUALITY", "320"))
+SAAVN_AVAILABILITY_TTL = 6 * 3600.0
+SAAVN_AVAILABILITY_TIMEOUT = 2.0
+DECRYPT_MEMO_ENTRIES = 20000
+AVAILABILITY_ENTRIES = 20000
+
+_QUALITY_RE = re.compile(r"_(96|160|320)\.mp4")
+# ECB has no chaining state, so one cipher object serves every call
+_cipher = DES.new(SAAVN_DES_KEY, DES.MODE_ECB)
+_memo: "OrderedDict[str, Optional[str]]" = OrderedDict()
+# media URL -> (available, checked_at), least recently used first
+_availability: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+def _plaintext(block: bytes) -> Optional[str]:
+    pad = block[-1] if block else 0
+    if 0 < pad <= DES.block_size and block.endswith(bytes([pad]) * pad):
+        block = block[:-pad]
+    url = block.decode('utf-8', errors='ignore').split('\x00')[0]
+    return url if url.startswith('http') else None
+
+
+def decrypt_many(enc_urls: List[str]) -> List[Optional[str]]:
+    """Decrypt a batch of Saavn `encrypted_media_url`s in one cipher pass.
+
+    ECB blocks are independent, so all ciphertexts are concatenated,
+    decrypted with a single call and split back at their original
+    lengths. Results (including failures) are memoized.
+    """
+    results: List[Optional[str]] = [None] * len(enc_urls)
+    todo, blobs = [], []
+    for i, enc in enumerate(enc_urls):
+        if not enc:
+            continue
+        if enc in _memo:
+            _memo.move_to_end(enc)
+            results[i] = _memo[enc]
+            continue
+        try:
+            blob = base64.b64decode(enc)
+        except Exception as e:
+            logger.warning(f"Saavn decryption error: {str(e)}")
+            blob = b""
+        if not blob or len(blob) % DES.block_size:
+            _memo[enc] = None
+            continue
+        todo.append(i)
+        blobs.append(blob)
+
+    if blobs:
+        plain = _cipher.decrypt(b"".join(blobs))
+        offset = 0
+        for i, blob in zip(todo, blobs):
+            url = _plaintext(plain[offset:offset + len(blob)])
+            offset += len(blob)
+            _memo[enc_urls[i]] = results[i] = url
+    while len(_memo) > DECRYPT_MEMO_ENTRIES:
+        _memo.popitem(last=False)
+    return results
+
+
+def quality_of(url: str) -> Optional[int]:
+    match = _QUALITY_RE.search(url or "")
+    return int(match.group(1)) if match else None
+
+
+def with_quality(url: str, quality: int) -> str:
+    return _QUALITY_RE.sub(f"_{quality}.mp4", url)
+
+
+def quality_candidates(url: str, preferred: int = SAAVN_QUALITY) -> List[str]:
+    """`url` at the preferred bitrate, then each lower one."""
+    if quality_of(url) is None:
+        return [url]
+    return [with_quality(url, q) for q in SAAVN_QUALITIES if q <= preferred] or [url]
+
+
+def decrypt_saavn_url(enc_url: str, quality: int = SAAVN_QUALITY):
+    """Decrypt Saavn encrypted media URLs, at the preferred quality."""
+    url = decrypt_many([enc_url])[0] if enc_url else None
+    return quality_candidates(url, quality)[0] if url else None
+
+
+def _remember(url: str, ok: bool):
+    _availability[url] = (ok, time.time())
+    _availability.move_to_end(url)
+    while len(_availability) > AVAILABILITY_ENTRIES:
+        _availability.popitem(last=False)
+
+
+def mark_unavailable(url: str):
+    _remember(url, False)
+
+
+async def _available(url: str) -> bool:
+    known = _availability.get(url)
+    if known:
+        if time.time() - known[1] < SAAVN_AVAILABILITY_TTL:
+            _availability.move_to_end(url)
+            return known[0]
+        del _availability[url]
+    try:
+        timeout = aiohttp.ClientTimeout(total=SAAVN_AVAILABILITY_TIMEOUT)
+        async with http_pool.session().head(url, headers={"User-Agent": USER_AGENT}, timeout=timeout) as resp:
+            ok = resp.status in (200, 206)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        # Can't tell; let the real request find out
+        return True
+    _remember(url, ok)
+    return ok
+
+
+async def best_available(url: str, preferred: int = SAAVN_QUALITY) -> str:
+    """Highest bitrate variant of `url` (up to `preferred`) that the CDN actually has.
+
+    All candidates are checked concurrently with HEAD requests and
+    remembered, so this costs one round trip per song at most.
+    """
+    candidates = quality_candidates(url, preferred)
+    if len(candidates) == 1:
+        return candidates[0]
+    checks = await asyncio.gather(*(_available(c) for c in candidates))
+    for candidate, ok in zip(candidates, checks):
+        if ok:
+            return candidate
+    return candidates[-1]
+
+
+def stats() -> dict:
+    return {"memoized": len(_memo), "availability_checked": len(_availability)}
@@ -0,0 +1,175 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from http_pool import http_pool
+from cache_backends import CacheBackend
+
+logger = logging.getLogger("VortexMusic")
+
+SAAVN_API_URL = os.getenv("SAAVN_API_URL", "https://www.jiosaavn.com/api.php")
+# How long a lookup waits for others to join its song.getDetails call
+SAAVN_BATCH_WINDOW = float(os.getenv("SAAVN_BATCH_WINDOW", "0.02"))
+SAAVN_BATCH_MAX = int(os.getenv("SAAVN_BATCH_MAX", "20"))
+SAAVN_META_TTL = float(os.getenv("SAAVN_META_TTL", str(6 * 3600)))
+SAAVN_META_MAX_ENTRIES = 5000
+
+
+class SaavnMetadata:
+    """Song objects by pid, fetched in batched `song.getDetails` calls.
+
+    Lookups arriving within SAAVN_BATCH_WINDOW of each other share one
+    request (Saavn takes a comma-separated pid list). Songs seen in search
+    and playlist responses seed the cache, and each entry also memoizes
+    its decrypted media URL.
+    """
+
+    def __init__(self, decrypt: Callable[[str], Optional[str]], backend: Optional[CacheBackend] = None,
+                 window: float = SAAVN_BATCH_WINDOW, max_batch: int = SAAVN_BATCH_MAX):
+        self.decrypt = decrypt
+        self.backend = backend
+        self.window = window
+        self.max_batch = max_batch
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_pids = 0
+        self.errors = 0
+
+    def _store(self, pid: str, song: dict) -> dict:
+        previous = self._entries.get(pid)
+        entry = {"song": song, "fetched_at": time.time(), "media_url": None, "enc_url": None}
+        if previous and previous["enc_url"] == song.get("encrypted_media_url"):
+            entry["media_url"], entry["enc_url"] = previous["media_url"], previous["enc_url"]
+        self._entries[pid] = entry
+        self._entries.move_to_end(pid)
+        while len(self._entries) > SAAVN_META_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+        return entry
+
+    def seed(self, song: dict):
+        """Remember a song object from a search/playlist response (only useful with its media URL)."""
+        pid = song.get("id")
+        if pid and song.get("encrypted_media_url"):
+            self._store(pid, song)
+
+    def _fresh(self, pid: str) -> Optional[dict]:
+        entry = self._entries.get(pid)
+        if entry is None:
+            return None
+        if time.time() - entry["fetched_at"] > SAAVN_META_TTL:
+            del self._entries[pid]
+            return None
+        self._entries.move_to_end(pid)
+        return entry
+
+    async def get(self, pid: str) -> Optional[dict]:
+        """Raw Saavn song object for `pid`, or None if Saavn doesn't know it."""
+        entry = self._fresh(pid)
+        if entry is not None:
+            self.hits += 1
+            return entry["song"]
+        if self.backend is not None:
+            song = await self.backend.get(f"saavn:song:{pid}")
+            if song:
+                self.hits += 1
+                return self._store(pid, song)["song"]
+        self.misses += 1
+
+        fut = self._inflight.get(pid) or self._pending.get(pid)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._pending[pid] = fut
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(fut)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self._inflight.update(batch)
+            asyncio.ensure_future(self._fetch(batch))
+
+    async def _fetch(self, batch: Dict[str, asyncio.Future]):
+        pids = list(batch)
+        self.batches += 1
+        self.batched_pids += len(pids)
+        songs: Dict[str, dict] = {}
+        try:
+            params = {
+                '__call': 'song.getDetails',
+                'pids': ",".join(pids),
+                '_format': 'json',
+                '_marker': '0',
+                'api_version': '4',
+                'ctx': 'web6dot0',
+            }
+            resp = await http_pool.client("saavn").get(SAAVN_API_URL, params=params, timeout=5.0)
+            if resp.status_code == 200:
+                data = resp.json()
+                found = data.get("songs") if isinstance(data.get("songs"), list) else data.values()
+                for song in found:
+                    if isinstance(song, dict) and song.get("id"):
+                        songs[song["id"]] = song
+            else:
+                self.errors += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Saavn song.getDetails failed for {len(pids)} pids: {str(e)}")
+        for pid in pids:
+            song = songs.get(pid)
+            if song is not None:
+                self._store(pid, song)
+                if self.backend is not None:
+                    await self.backend.set(f"saavn:song:{pid}", song, SAAVN_META_TTL)
+            self._inflight.pop(pid, None)
+            fut = batch[pid]
+            if not fut.done():
+                fut.set_result(song)
+
+    async def get_many(self, pids: List[str]) -> Dict[str, Optional[dict]]:
+        songs = await asyncio.gather(*(self.get(pid) for pid in pids))
+        return dict(zip(pids, songs))
+
+    async def media_url(self, pid: str, enc_url: Optional[str] = None) -> Optional[str]:
+        """Decrypted media URL for a song, from `enc_url` if the client already has it."""
+        entry = self._fresh(pid)
+        if enc_url is None:
+            if entry is None:
+                if await self.get(pid) is None:
+                    return None
+                entry = self._fresh(pid)
+                if entry is None:
+                    return None
+            enc_url = entry["song"].get("encrypted_media_url")
+            if not enc_url:
+                return None
+        if entry is not None and entry["enc_url"] == enc_url and entry["media_url"]:
+            return entry["media_url"]
+        url = self.decrypt(enc_url)
+        if entry is not None and url and entry["song"].get("encrypted_media_url") == enc_url:
+            entry["enc_url"], entry["media_url"] = enc_url, url
+        return url
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch": round(self.batched_pids / self.batches, 2) if self.batches else 0.0,
+            "errors": self.errors,
+            "pending": len(self._pending) + len(self._inflight),
+        }
@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from cache_backends import CacheBackend
+
+logger = logging.getLogger("VortexMusic")
+
+# Fresh lifetime per provider; catalogs change slowly, YouTube results even slower
+PROVIDER_TTLS = {
+    "saavn": float(os.getenv("SEARCH_TTL_SAAVN", "600")),
+    "deezer": float(os.getenv("SEARCH_TTL_DEEZER", "900")),
+    "ytmusic": float(os.getenv("SEARCH_TTL_YTMUSIC", "1800")),
+    "youtube": float(os.getenv("SEARCH_TTL_YOUTUBE", "1800")),
+}
+# How long past its TTL an entry may still be served while it refreshes
+SEARCH_STALE_GRACE = float(os.getenv("SEARCH_STALE_GRACE", "3600"))
+# Empty result lists are often a swallowed upstream error, keep them briefly
+SEARCH_EMPTY_TTL = 60.0
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+MIN_PREFIX_LENGTH = 2
+
+
+def normalize_query(query: str) -> str:
+    """Case-, accent- and whitespace-insensitive form of a query."""
+    decomposed = unicodedata.normalize("NFKD", query or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def matches_query(item: dict, norm_query: str) -> bool:
+    """Every query word prefixes a word of the title/artist (the last one may be half-typed)."""
+    haystack = normalize_query(f"{item.get('title') or ''} {item.get('artist') or ''}").split()
+    return all(any(word.startswith(token) for word in haystack) for token in norm_query.split())
+
+
+class SearchCache:
+    """Per-provider search result cache with stale-while-revalidate.
+
+    A miss for a query still being typed ("ariji") is answered from the
+    longest cached prefix ("arij") filtered to matching results, while the
+    exact query is fetched in the background for the next keystroke.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], dict]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Future] = {}
+        self._tasks = set()
+        self.stats_by_provider: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, provider: str, outcome: str):
+        counters = self.stats_by_provider.setdefault(
+            provider, {"hits": 0, "stale": 0, "prefix": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        )
+        counters[outcome] += 1
+
+    def _ttl(self, provider: str, entry: dict) -> float:
+        return PROVIDER_TTLS.get(provider, 600.0) if entry["results"] else SEARCH_EMPTY_TTL
+
+    def _backend_key(self, key) -> str:
+        provider, base_url, norm = key
+        return f"search:{provider}:{hashlib.sha1(f'{base_url}|{norm}'.encode()).hexdigest()}"
+
+    def _lookup(self, key) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["fetched_at"] > self._ttl(key[0], entry) + SEARCH_STALE_GRACE:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, results: List[dict]) -> dict:
+        return self._insert(key, {"results": results, "fetched_at": time.time()})
+
+    def _insert(self, key, entry: dict) -> dict:
+        """Put `entry` in memory as most recently used, evicting past max_entries."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def _fetch(self, key, fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        """Single-flight fetch that stores its result in memory and the backend."""
+        fut = self._inflight.get(key)
+        if fut is None:
+            async def run():
+                try:
+                    results = await fetch()
+                except Exception:
+                    self._count(key[0], "errors")
+                    raise
+                entry = self._store(key, results or [])
+                if self.backend is not None:
+                    await self.backend.set(
+                        self._backend_key(key), entry, self._ttl(key[0], entry) + SEARCH_STALE_GRACE
+                    )
+                return entry["results"]
+
+            fut = asyncio.ensure_future(run())
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    def _refresh(self, key, fetch):
+        if key in self._inflight:
+            return
+        self._count(key[0], "refreshes")
+        task = asyncio.ensure_future(self._fetch(key, fetch))
+        self._tasks.add(task)
+
+        def _done(t):
+            self._tasks.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logger.warning(f"Search refresh failed for {key[0]}: {str(t.exception())}")
+
+        task.add_done_callback(_done)
+
+    async def get(self, provider: str, base_url: str, query: str,
+                  fetch: Callable[[], Awaitable[List[dict]]]) -> List[dict]:
+        norm = normalize_query(query)
+        key = (provider, base_url, norm)
+
+        entry = self._lookup(key)
+        if entry is None and self.backend is not None:
+            stored = await self.backend.get(self._backend_key(key))
+            if stored:
+                entry = self._insert(key, stored)
+
+        if entry is not None:
+            if time.time() - entry["fetched_at"] <= self._ttl(provider, entry):
+                self._count(provider, "hits")
+            else:
+                self._count(provider, "stale")
+                self._refresh(key, fetch)
+            return entry["results"]
+
+        # Incremental typing: answer from the closest cached prefix meanwhile
+        for cut in range(len(norm) - 1, MIN_PREFIX_LENGTH - 1, -1):
+            prefix_entry = self._lookup((provider, base_url, norm[:cut].rstrip()))
+            if prefix_entry is None:
+                continue
+            filtered = [item for item in prefix_entry["results"] if matches_query(item, norm)]
+            if filtered:
+                self._count(provider, "prefix")
+                self._refresh(key, fetch)
+                return filtered
+            break
+
+        self._count(provider, "misses")
+        return await self._fetch(key, fetch)
+
+    def stats(self) -> dict:
+        totals = {"hits": 0, "stale": 0, "prefix": 0, "misses": 0}
+        for counters in self.stats_by_provider.values():
+            for k in totals:
+                totals[k] += counters[k]
+        lookups = sum(totals.values())
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round((lookups - totals["misses"]) / lookups, 4) if lookups else 0.0,
+            "providers": self.stats_by_provider,
+        }
@@ -0,0 +1,167 @@
+import os
+import asyncio
+import logging
+from difflib import SequenceMatcher
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from search_cache import normalize_query
+from track_matcher import clean_title, is_duration_match, split_artists
+
+logger = logging.getLogger("VortexMusic")
+
+# Whatever a provider hasn't returned by its deadline is left out of this response
+# (the fetch keeps running and lands in the search cache for the next one)
+PROVIDER_DEADLINES = {
+    "saavn": float(os.getenv("SEARCH_DEADLINE_SAAVN", "2.0")),
+    "deezer": float(os.getenv("SEARCH_DEADLINE_DEEZER", "2.0")),
+    "ytmusic": float(os.getenv("SEARCH_DEADLINE_YTMUSIC", "2.5")),
+    "youtube": float(os.getenv("SEARCH_DEADLINE_YOUTUBE", "4.0")),
+}
+# Providers /search may ask (the offline bench leaves out the ones it has no stand-in for)
+SEARCH_PROVIDERS = set(
+    p.strip() for p in os.getenv("SEARCH_PROVIDERS", "saavn,deezer,ytmusic,youtube").split(",") if p.strip()
+)
+# How much a provider's own ordering is trusted
+PROVIDER_WEIGHTS = {"saavn": 1.0, "ytmusic": 0.95, "deezer": 0.85, "youtube": 0.75}
+# Which provider's copy of a duplicate is kept: the one that plays most directly
+PLAYBACK_PREFERENCE = ("saavn", "ytmusic", "youtube", "deezer")
+# Results asked of each provider, before merging
+SEARCH_PROVIDER_RESULTS = int(os.getenv("SEARCH_PROVIDER_RESULTS", "20"))
+SEARCH_DEFAULT_LIMIT = 30
+# /search/stream gives up on providers still silent after this long
+SEARCH_STREAM_TIMEOUT = float(os.getenv("SEARCH_STREAM_TIMEOUT", "10.0"))
+SEARCH_MAX_LIMIT = 100
+
+
+async def gather_within(calls: Dict[str, Callable[[], Awaitable[List[dict]]]],
+                        deadlines: Dict[str, float] = PROVIDER_DEADLINES) -> Tuple[Dict[str, List[dict]], Dict[str, str]]:
+    """Run every provider call at once, each bounded by its own deadline.
+
+    Returns the results that made it and a status per provider
+    ("ok", "timeout" or "error"). Late calls are not cancelled.
+    """
+    async def bounded(name: str, call):
+        task = asyncio.ensure_future(call())
+        # A provider that fails after its deadline shouldn't log "exception never retrieved"
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            results = await asyncio.wait_for(asyncio.shield(task), timeout=deadlines.get(name, 3.0))
+            return name, results if isinstance(results, list) else [], "ok"
+        except asyncio.TimeoutError:
+            return name, [], "timeout"
+        except Exception as e:
+            logger.warning(f"Search provider {name} failed: {str(e)}")
+            return name, [], "error"
+
+    done = await asyncio.gather(*(bounded(name, call) for name, call in calls.items()))
+    return {name: results for name, results, _ in done}, {name: status for name, _, status in done}
+
+
+async def as_they_arrive(calls: Dict[str, Callable[[], Awaitable[List[dict]]]], timeout: float = SEARCH_STREAM_TIMEOUT,
+                         stop: Optional[asyncio.Event] = None) -> AsyncIterator[Tuple[str, List[dict], str]]:
+    """Yield (provider, results, status) for each provider call the moment it finishes.
+
+    Providers still running after `timeout` are yielded as "timeout". Setting
+    `stop` (or closing the iterator) ends it early and cancels the waits; the
+    underlying search cache fetches carry on and are cached.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = {asyncio.ensure_future(call()): name for name, call in calls.items()}
+    stopper = asyncio.ensure_future(stop.wait()) if stop is not None else None
+    deadline = loop.time() + timeout
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(
+                pending | ({stopper} if stopper else set()), timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            if stopper is not None and stopper in done:
+                return
+            for task in done:
+                pending.discard(task)
+                if task.exception() is not None:
+                    logger.warning(f"Search provider {tasks[task]} failed: {str(task.exception())}")
+                    yield tasks[task], [], "error"
+                else:
+                    results = task.result()
+                    yield tasks[task], results if isinstance(results, list) else [], "ok"
+        for task in pending:
+            yield tasks[task], [], "timeout"
+    finally:
+        for task in tasks:
+            task.cancel()
+        if stopper is not None:
+            stopper.cancel()
+
+
+def relevance(norm_query: str, item: dict) -> float:
+    """0..1 match of a result's title/artist against the query."""
+    tokens = norm_query.split()
+    if not tokens:
+        return 0.0
+    title = clean_title(item.get("title") or "")
+    artist = normalize_query(item.get("artist") or "")
+    words = f"{title} {artist}".split()
+    coverage = sum(1 for t in tokens if any(w.startswith(t) for w in words)) / len(tokens)
+    closeness = max(
+        SequenceMatcher(None, norm_query, title).ratio(),
+        SequenceMatcher(None, norm_query, f"{title} {artist}").ratio(),
+    )
+    return 0.6 * coverage + 0.4 * closeness
+
+
+def _identity(item: dict) -> Tuple[str, str]:
+    artists = split_artists(item.get("artist") or "")
+    return clean_title(item.get("title") or ""), artists[0] if artists else ""
+
+
+def merge_results(query: str, by_provider: Dict[str, List[dict]]) -> List[dict]:
+    """De-duplicate results across providers and order them by relevance.
+
+    Results are the same song when their cleaned title and primary artist
+    agree and their durations match. Each group keeps the copy from the
+    most directly playable provider (missing fields filled from the
+    others) and lists every provider in `sources`. The score mixes query
+    relevance, the provider's weight and its own ranking, and a bonus for
+    songs several catalogs agree on.
+    """
+    norm_query = normalize_query(query)
+    groups: Dict[Tuple[str, str], List[dict]] = {}
+    for provider, results in by_provider.items():
+        weight = PROVIDER_WEIGHTS.get(provider, 0.7)
+        for position, item in enumerate(results or []):
+            if not item.get("id") or not item.get("title"):
+                continue
+            score = 0.6 * relevance(norm_query, item) + 0.4 * weight / (1 + 0.1 * position)
+            candidates = groups.setdefault(_identity(item), [])
+            for group in candidates:
+                if is_duration_match(group["duration"], item.get("duration"), log=False):
+                    break
+            else:
+                group = {"members": [], "duration": item.get("duration"), "score": 0.0}
+                candidates.append(group)
+            group["members"].append((provider, item))
+            group["score"] = max(group["score"], score)
+            group["duration"] = group["duration"] or item.get("duration")
+
+    merged = []
+    for candidates in groups.values():
+        for group in candidates:
+            members = sorted(
+                group["members"],
+                key=lambda m: PLAYBACK_PREFERENCE.index(m[0]) if m[0] in PLAYBACK_PREFERENCE else len(PLAYBACK_PREFERENCE)
+            )
+            best = dict(members[0][1])
+            for _, other in members[1:]:
+                for field in ("album", "duration", "thumbnail", "year"):
+                    if not best.get(field) and other.get(field):
+                        best[field] = other[field]
+            sources = list(dict.fromkeys(provider for provider, _ in members))
+            best["sources"] = sources
+            merged.append((group["score"] + 0.05 * (len(sources) - 1), best))
+
+    merged.sort(key=lambda pair: pair[0], reverse=True)
+    return [item for _, item in merged]
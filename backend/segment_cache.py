@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import asyncio
+import shutil
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows dev box): a single process owns the whole cache
+    fcntl = None
+
+from http_pool import http_pool
+from tracing import start_span
+from stream_proxy import (
+    USER_AGENT, ProxiedStreamResponse, RangeNotSatisfiable, UpstreamError, format_range,
+    parse_content_range, parse_range, resolve_range, stream_proxy,
+)
+
+logger = logging.getLogger("VortexMusic")
+
+SEGMENT_CACHE_ENABLED = os.getenv("SEGMENT_CACHE_ENABLED", "1") == "1"
+SEGMENT_CACHE_DIR = os.getenv(
+    "SEGMENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "segments"),
+)
+# Disk budget for all workers together; each worker gets an equal share
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# uvicorn --workers defaults to WEB_CONCURRENCY too
+SEGMENT_CACHE_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+READ_CHUNK_SIZE = 256 * 1024
+
+
+class CleanupStreamingResponse(StreamingResponse):
+    """Runs `cleanup` however the response ends, including before the body starts."""
+
+    def __init__(self, content, cleanup: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cleanup()
+
+
+class SegmentEntry:
+    def __init__(self, key: str, path: str, size: int, content_type: str):
+        self.key = key
+        self.path = path
+        self.size = size
+        self.content_type = content_type
+        # Sorted, non-overlapping [start, end) byte intervals present on disk
+        self.intervals: List[List[int]] = []
+        self.last_access = time.time()
+        self.readers = 0
+        self.dirty = False
+
+    @property
+    def cached_bytes(self) -> int:
+        return sum(end - start for start, end in self.intervals)
+
+    def add(self, start: int, end: int):
+        merged = []
+        for a, b in self.intervals:
+            if b < start or a > end:
+                merged.append([a, b])
+            else:
+                start, end = min(a, start), max(b, end)
+        merged.append([start, end])
+        self.intervals = sorted(merged)
+        self.dirty = True
+
+    def plan(self, start: int, end: int) -> List[Tuple[int, int, bool]]:
+        """Split inclusive [start, end] into (start, end, cached) pieces."""
+        pieces = []
+        pos = start
+        for a, b in self.intervals:
+            if b <= pos:
+                continue
+            if a > end:
+                break
+            if a > pos:
+                pieces.append((pos, a - 1, False))
+                pos = a
+            stop = min(b - 1, end)
+            pieces.append((pos, stop, True))
+            pos = stop + 1
+            if pos > end:
+                break
+        if pos <= end:
+            pieces.append((pos, end, False))
+        return pieces
+
+    def meta(self) -> dict:
+        return {
+            "key": self.key,
+            "size": self.size,
+            "content_type": self.content_type,
+            "intervals": self.intervals,
+            "last_access": self.last_access,
+        }
+
+
+class SegmentCache:
+    """Range-addressable on-disk cache of proxied audio bytes.
+
+    Each track/quality key maps to one sparse file plus a JSON sidecar of the
+    byte intervals present. Requested ranges are served from disk where
+    cached; holes are fetched with a ranged upstream request and written to
+    the file while they stream to the client. Whole tracks are evicted LRU
+    once the cache exceeds its disk budget.
+
+    The index lives in process memory, so every worker process claims its
+    own `worker-<n>` directory under `directory` (held by an flock for the
+    life of the process) and a 1/`workers` share of the budget. A restarted
+    worker picks up a free slot and whatever it still holds.
+    """
+
+    def __init__(self, directory: str = SEGMENT_CACHE_DIR, max_bytes: int = SEGMENT_CACHE_MAX_BYTES,
+                 enabled: bool = SEGMENT_CACHE_ENABLED, workers: int = SEGMENT_CACHE_WORKERS):
+        self.root = directory
+        self.directory = directory
+        self.workers = workers
+        self.max_bytes = max_bytes // workers
+        self.enabled = enabled
+        self._slot_lock = None
+        self.entries: Dict[str, SegmentEntry] = {}
+        self.full_hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.bytes_from_cache = 0
+        self.bytes_from_upstream = 0
+        self.evictions = 0
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = self._claim_slot()
+            self._load_index()
+
+    def _lock_slot(self, directory: str) -> Optional[int]:
+        """Open and flock `directory`/.lock without blocking; the fd, or None if another process has it."""
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(os.path.join(directory, ".lock"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def _claim_slot(self) -> str:
+        if fcntl is None:
+            return os.path.join(self.root, "worker-0")
+        slot = 0
+        while True:
+            directory = os.path.join(self.root, f"worker-{slot}")
+            fd = self._lock_slot(directory)
+            if fd is not None:
+                self._slot_lock = fd
+                break
+            slot += 1
+        self._sweep_slots()
+        return directory
+
+    def _sweep_slots(self):
+        """Remove unowned slots beyond the worker count (after scaling down) and pre-slot files."""
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.startswith("worker-"):
+                if os.path.isfile(path):
+                    os.remove(path)
+                continue
+            try:
+                slot = int(name[len("worker-"):])
+            except ValueError:
+                continue
+            if slot < self.workers:
+                continue
+            fd = self._lock_slot(path)
+            if fd is None:
+                continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Segment cache removed unused slot {name}")
+            finally:
+                os.close(fd)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _load_index(self):
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    meta = json.load(f)
+                path = self._path(meta["key"])
+                if not os.path.exists(path):
+                    continue
+                entry = SegmentEntry(meta["key"], path, meta["size"], meta["content_type"])
+                entry.intervals = meta["intervals"]
+                entry.last_access = meta.get("last_access", 0)
+                self.entries[entry.key] = entry
+            except Exception as e:
+                logger.warning(f"Skipping segment cache index {name}: {str(e)}")
+        logger.info(f"Segment cache loaded {len(self.entries)} tracks into {self.directory}")
+
+    def _save_meta(self, entry: SegmentEntry):
+        tmp = entry.path + ".json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry.meta(), f)
+        os.replace(tmp, entry.path + ".json")
+        entry.dirty = False
+
+    def _create(self, key: str, size: int, content_type: str) -> SegmentEntry:
+        entry = SegmentEntry(key, self._path(key), size, content_type)
+        with open(entry.path, "wb") as f:
+            f.truncate(size)  # sparse: blocks are only allocated as ranges arrive
+        self.entries[key] = entry
+        return entry
+
+    def _drop(self, entry: SegmentEntry):
+        self.entries.pop(entry.key, None)
+        for path in (entry.path, entry.path + ".json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        total = sum(e.cached_bytes for e in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for entry in sorted(self.entries.values(), key=lambda e: e.last_access):
+            if total <= self.max_bytes:
+                break
+            if entry.readers:
+                continue
+            total -= entry.cached_bytes
+            self._drop(entry)
+            self.evictions += 1
+
+    async def _upstream(self, url: str, rng) -> aiohttp.ClientResponse:
+        headers = {"User-Agent": USER_AGENT}
+        if rng:
+            headers["Range"] = format_range(rng)
+        try:
+            resp = await http_pool.session().get(url, headers=headers)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise UpstreamError(None, str(e) or type(e).__name__)
+        if resp.status not in (200, 206, 416):
+            resp.release()
+            raise UpstreamError(resp.status)
+        return resp
+
+    async def serve(self, key: str, url: str, range_header: Optional[str] = None, source: str = "unknown",
+                    media_type: str = "audio/mpeg", headers: Optional[Dict[str, str]] = None) -> Response:
+        """Serve `range_header` of track `key`, from disk where possible and `url` otherwise."""
+        if not self.enabled:
+            return await stream_proxy.open(url, range_header, source, media_type, headers)
+
+        rng = parse_range(range_header)
+        out_headers = {"Accept-Ranges": "bytes", "X-Segment-Cache": "miss", **(headers or {})}
+        entry = self.entries.get(key)
+        first = None
+
+        if entry is None:
+            # First contact: the upstream response tells us the total size
+            first = await self._upstream(url, rng)
+            first_start, _, size = parse_content_range(first.headers.get("Content-Range"))
+            if first.status == 416:
+                first.release()
+                out_headers["Content-Range"] = f"bytes */{size if size is not None else '*'}"
+                return Response(status_code=416, headers=out_headers)
+            if first.status == 200:
+                first_start = 0
+                length = first.headers.get("Content-Length")
+                size = int(length) if length and length.isdigit() else None
+            if size is None or first_start is None:
+                # Unknown length (chunked upstream), nothing we can address by range
+                first.release()
+                return await stream_proxy.open(url, range_header, source, media_type, headers)
+            content_type = first.headers.get("Content-Type", "")
+            if not content_type.startswith("audio/"):
+                content_type = media_type
+            # Another request may have created the entry while we waited
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self._create(key, size, content_type)
+            elif entry.size != size:
+                first.release()
+                return await stream_proxy.open(url, range_header, source, media_type, headers)
+            self.misses += 1
+        else:
+            out_headers["X-Segment-Cache"] = "hit"
+
+        try:
+            start, end = resolve_range(rng, entry.size) if rng else (0, entry.size - 1)
+        except RangeNotSatisfiable:
+            if first is not None:
+                first.release()
+            out_headers["Content-Range"] = f"bytes */{entry.size}"
+            return Response(status_code=416, headers=out_headers)
+
+        if first is not None:
+            # Our first request already covers the whole window
+            plan = [(start, end, False)]
+        else:
+            plan = entry.plan(start, end)
+            if all(cached for _, _, cached in plan):
+                self.full_hits += 1
+            elif any(cached for _, _, cached in plan):
+                self.partial_hits += 1
+                out_headers["X-Segment-Cache"] = "partial"
+            else:
+                self.misses += 1
+                out_headers["X-Segment-Cache"] = "miss"
+            # Open the first hole now so a refused URL still surfaces as UpstreamError
+            if not plan[0][2]:
+                first = await self._upstream(url, (plan[0][0], plan[0][1]))
+                if first.status == 416:
+                    first.release()
+                    raise UpstreamError(416, "upstream size changed")
+                first_start = plan[0][0] if first.status == 206 else 0
+
+        if rng:
+            status = 206
+            out_headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+        else:
+            status = 200
+        out_headers["Content-Length"] = str(end - start + 1)
+
+        stats = stream_proxy.stats_for(source)
+        stats.requests += 1
+        entry.readers += 1
+        entry.last_access = time.time()
+        span = start_span("segment_cache.body", key=key, cache=out_headers["X-Segment-Cache"],
+                          pieces=len(plan), **{"http.status_code": status})
+        opened = {"first": first, "first_start": first_start if first is not None else None, "reading": True}
+
+        def finish():
+            # Exactly once, whether the body ran to the end, failed or never started
+            if opened["reading"]:
+                opened["reading"] = False
+                entry.readers -= 1
+                span.end()
+
+        def cleanup():
+            if opened["first"] is not None:
+                opened["first"].release()
+                opened["first"] = None
+            finish()
+
+        return CleanupStreamingResponse(
+            self._iter_plan(entry, url, plan, opened, stats, span, finish),
+            cleanup=cleanup,
+            status_code=status,
+            media_type=entry.content_type,
+            headers=out_headers,
+        )
+
+    async def _iter_plan(self, entry: SegmentEntry, url: str, plan, opened: dict, stats, span,
+                         finish: Callable[[], None]):
+        fd = os.open(entry.path, os.O_RDWR)
+        started = time.time()
+        stats.active += 1
+        sent = {"cache": 0, "upstream": 0}
+        try:
+            for piece_start, piece_end, cached in plan:
+                if cached:
+                    pos = piece_start
+                    while pos <= piece_end:
+                        n = min(READ_CHUNK_SIZE, piece_end - pos + 1)
+                        chunk = await asyncio.to_thread(os.pread, fd, n, pos)
+                        if not chunk:
+                            raise IOError(f"short read from segment cache for {entry.key}")
+                        pos += len(chunk)
+                        self.bytes_from_cache += len(chunk)
+                        stats.bytes_served += len(chunk)
+                        sent["cache"] += len(chunk)
+                        yield chunk
+                    continue
+
+                resp, resp_start = opened["first"], opened["first_start"]
+                opened["first"] = None
+                if resp is None:
+                    resp = await self._upstream(url, (piece_start, piece_end))
+                    resp_start = piece_start if resp.status == 206 else 0
+                try:
+                    _, _, size = parse_content_range(resp.headers.get("Content-Range"))
+                    if resp.status == 416 or (size is not None and size != entry.size):
+                        # Different representation behind the URL now; start over next time
+                        self._drop(entry)
+                        raise UpstreamError(resp.status, f"upstream size changed for {entry.key}")
+                    piece_sent = 0
+                    async for chunk in self._tee(entry, fd, resp, resp_start, piece_start, piece_end):
+                        stats.bytes_served += len(chunk)
+                        sent["upstream"] += len(chunk)
+                        piece_sent += len(chunk)
+                        yield chunk
+                    if piece_sent != piece_end - piece_start + 1:
+                        # Content-Length is already promised; the unreceived rest stays a hole on disk
+                        raise UpstreamError(
+                            resp.status, f"short upstream body for {entry.key}: "
+                                         f"{piece_sent} of {piece_end - piece_start + 1} bytes"
+                        )
+                finally:
+                    resp.release()
+            stats.completed += 1
+        except Exception as e:
+            stats.errors += 1
+            span.error(e)
+            raise
+        finally:
+            stats.active -= 1
+            stats.seconds += time.time() - started
+            os.close(fd)
+            span.set(bytes_from_cache=sent["cache"], bytes_from_upstream=sent["upstream"])
+            finish()
+            if entry.dirty and entry.key in self.entries:
+                await asyncio.to_thread(self._save_meta, entry)
+                self._evict()
+
+    async def _tee(self, entry: SegmentEntry, fd: int, resp: aiohttp.ClientResponse,
+                   offset: int, emit_start: int, emit_end: int):
+        """Write every upstream byte to disk and yield the part inside [emit_start, emit_end]."""
+        async for chunk in resp.content.iter_chunked(stream_proxy.chunk_size):
+            chunk_start = offset
+            offset += len(chunk)
+            await asyncio.to_thread(os.pwrite, fd, chunk, chunk_start)
+            entry.add(chunk_start, offset)
+            self.bytes_from_upstream += len(chunk)
+            lo = max(emit_start, chunk_start) - chunk_start
+            hi = min(emit_end + 1, offset) - chunk_start
+            if hi > lo:
+                yield chunk[lo:hi] if (lo, hi) != (0, len(chunk)) else chunk
+            if offset > emit_end:
+                break
+
+    async def prefetch(self, key: str, url: str, length: int, source: str = "prefetch",
+                       media_type: str = "audio/mpeg") -> int:
+        """Make sure the first `length` bytes of `key` are on disk; returns bytes fetched."""
+        if not self.enabled or length <= 0:
+            return 0
+        entry = self.entries.get(key)
+        if entry is not None and all(cached for _, _, cached in entry.plan(0, min(length, entry.size) - 1)):
+            return 0
+        resp = await self.serve(key, url, f"bytes=0-{length - 1}", source=source, media_type=media_type)
+        if not isinstance(resp, CleanupStreamingResponse):
+            # Not cacheable by range (416, unknown size): nothing to keep
+            if isinstance(resp, ProxiedStreamResponse):
+                resp.upstream.release()
+            return 0
+        fetched = 0
+        try:
+            async for chunk in resp.body_iterator:
+                fetched += len(chunk)
+        finally:
+            resp.cleanup()
+        return fetched
+
+    def stats(self) -> dict:
+        served = self.bytes_from_cache + self.bytes_from_upstream
+        return {
+            "enabled": self.enabled,
+            "tracks": len(self.entries),
+            "cached_bytes": sum(e.cached_bytes for e in self.entries.values()),
+            "max_bytes": self.max_bytes,
+            "directory": self.directory,
+            "full_hits": self.full_hits,
+            "partial_hits": self.partial_hits,
+            "misses": self.misses,
+            "byte_hit_ratio": round(self.bytes_from_cache / served, 4) if served else 0.0,
+            "bytes_saved": self.bytes_from_cache,
+            "bytes_from_upstream": self.bytes_from_upstream,
+            "evictions": self.evictions,
+        }
+
+
+segment_cache = SegmentCache()
@@ -0,0 +1,219 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+from http_pool import http_pool
+from cache_backends import CacheBackend
+from search_cache import normalize_query
+from track_matcher import pick_best
+
+logger = logging.getLogger("VortexMusic")
+
+SC_API_URL = "https://api-v2.soundcloud.com"
+SC_CID_TTL = 3600.0
+# Refresh the client id this long before it is considered stale
+SC_CID_REFRESH_MARGIN = 300.0
+SC_SEARCH_TTL = float(os.getenv("SC_SEARCH_TTL", str(24 * 3600)))
+# Signed transcoding URLs last longer, but not reliably
+SC_TRANSCODING_TTL = 600.0
+SC_TIMEOUT = 5.0
+
+_CID_RE = re.compile(r'client_id\s*:\s*"([a-zA-Z0-9]{32})"')
+_ASSET_RE = re.compile(r'src="([^"]+/assets/[^"]+\.js)"')
+
+
+class SoundCloudAuthError(Exception):
+    pass
+
+
+def _as_candidate(track: dict) -> dict:
+    """SoundCloud track in the shape track_matcher scores (ytmusic result fields)."""
+    artist = (track.get("publisher_metadata") or {}).get("artist") or (track.get("user") or {}).get("username")
+    return {
+        "videoId": track.get("id"),
+        "title": track.get("title"),
+        "artists": [{"name": artist}] if artist else [],
+        "duration_seconds": (track.get("full_duration") or track.get("duration") or 0) / 1000 or None,
+        "track": track,
+    }
+
+
+def pick_transcoding(track: dict) -> Optional[dict]:
+    """Progressive MP3 when there is one (range-seekable through our proxy), else HLS."""
+    transcodings = (track.get("media") or {}).get("transcodings") or []
+
+    def rank(t):
+        fmt = t.get("format") or {}
+        progressive = fmt.get("protocol") == "progressive"
+        mp3 = "mpeg" in (fmt.get("mime_type") or "")
+        return (not progressive, not mp3, t.get("snipped", False))
+
+    usable = [t for t in transcodings if t.get("url") and not t.get("snipped")]
+    return min(usable, key=rank) if usable else None
+
+
+class SoundCloudClient:
+    """SoundCloud search + stream resolution for the extractor's last-resort fallback.
+
+    The public web client id is scraped off the request path: a background
+    task keeps it fresh (asset scripts fetched concurrently), and requests
+    only scrape themselves if that task hasn't produced one yet. Search
+    results and resolved transcodings are cached.
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None):
+        self.backend = backend
+        self._cid: Optional[str] = None
+        self._cid_expiry = 0.0
+        self._cid_fut: Optional[asyncio.Future] = None
+        self._transcodings: Dict[str, tuple] = {}
+        self.searches = 0
+        self.search_hits = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    async def client_id(self) -> Optional[str]:
+        if self._cid and self._cid_expiry > time.time():
+            return self._cid
+        if self.backend is not None:
+            shared = await self.backend.get("sc:cid")
+            if shared and shared.get("expiry", 0) > time.time():
+                self._cid, self._cid_expiry = shared["cid"], shared["expiry"]
+                return self._cid
+        return await self.refresh_client_id()
+
+    async def refresh_client_id(self) -> Optional[str]:
+        """Scrape a fresh client id; concurrent callers share one scrape."""
+        if self._cid_fut is None or self._cid_fut.done():
+            self._cid_fut = asyncio.ensure_future(self._scrape_client_id())
+        return await asyncio.shield(self._cid_fut)
+
+    async def _scrape_client_id(self) -> Optional[str]:
+        client = http_pool.client("soundcloud")
+        try:
+            r = await client.get("https://soundcloud.com", timeout=SC_TIMEOUT)
+            if r.status_code != 200:
+                raise RuntimeError(f"homepage returned {r.status_code}")
+            scripts = _ASSET_RE.findall(r.text)
+
+            async def scan(url):
+                sr = await client.get(url, timeout=SC_TIMEOUT)
+                match = _CID_RE.search(sr.text)
+                return match.group(1) if match else None
+
+            # The id lives in one of the last bundles; fetch them all at once
+            tasks = [asyncio.ensure_future(scan(url)) for url in reversed(scripts)]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    try:
+                        cid = await fut
+                    except Exception:
+                        continue
+                    if cid:
+                        self._cid, self._cid_expiry = cid, time.time() + SC_CID_TTL
+                        self.refreshes += 1
+                        if self.backend is not None:
+                            await self.backend.set("sc:cid", {"cid": cid, "expiry": self._cid_expiry}, SC_CID_TTL)
+                        return cid
+            finally:
+                for t in tasks:
+                    t.cancel()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"SoundCloud client id scrape failed: {str(e)}")
+        return None
+
+    async def run_refresh_loop(self):
+        """Keep a valid client id around so the fallback never scrapes on the request path."""
+        while True:
+            if self._cid_expiry - time.time() <= SC_CID_REFRESH_MARGIN:
+                await self.refresh_client_id()
+            wait = self._cid_expiry - time.time() - SC_CID_REFRESH_MARGIN
+            await asyncio.sleep(wait if wait > 0 else 60.0)
+
+    async def _api(self, path: str, params: dict) -> dict:
+        for attempt in range(2):
+            cid = await self.client_id()
+            if not cid:
+                raise SoundCloudAuthError("no client id")
+            resp = await http_pool.client("soundcloud").get(
+                f"{SC_API_URL}{path}" if path.startswith("/") else path,
+                params={**params, "client_id": cid}, timeout=SC_TIMEOUT
+            )
+            if resp.status_code in (401, 403) and attempt == 0:
+                # Rotated client id: scrape a new one and retry once
+                self._cid_expiry = 0.0
+                await self.refresh_client_id()
+                continue
+            if resp.status_code != 200:
+                raise RuntimeError(f"SoundCloud API returned {resp.status_code}")
+            return resp.json()
+        raise SoundCloudAuthError("client id rejected")
+
+    async def search(self, title: str, artist: Optional[str] = None, duration=None) -> Optional[dict]:
+        """Best matching full-length track for title/artist, cached per query."""
+        query = f"{title} {artist or ''}".strip()
+        key = f"sc:search:{hashlib.sha1(normalize_query(query).encode()).hexdigest()}"
+        self.searches += 1
+        tracks: Optional[List[dict]] = None
+        if self.backend is not None:
+            tracks = await self.backend.get(key)
+        if tracks is not None:
+            self.search_hits += 1
+        else:
+            data = await self._api("/search/tracks", {"q": query, "limit": 10})
+            tracks = [
+                {k: t.get(k) for k in ("id", "title", "user", "publisher_metadata", "duration",
+                                       "full_duration", "policy", "media", "track_authorization")}
+                for t in data.get("collection", [])
+                if t.get("policy") != "SNIP" and t.get("streamable", True)
+            ]
+            if self.backend is not None:
+                await self.backend.set(key, tracks, SC_SEARCH_TTL)
+        best = pick_best(title, artist or "", duration, [_as_candidate(t) for t in tracks])
+        return best["track"] if best else None
+
+    async def stream(self, track: dict) -> Optional[dict]:
+        """Playable URL for a track: {'url', 'bitrate', 'duration', 'protocol'}."""
+        transcoding = pick_transcoding(track)
+        if transcoding is None:
+            return None
+        cached = self._transcodings.get(transcoding["url"])
+        if cached and cached[1] > time.time():
+            url = cached[0]
+        else:
+            params = {}
+            if track.get("track_authorization"):
+                params["track_authorization"] = track["track_authorization"]
+            url = (await self._api(transcoding["url"], params)).get("url")
+            if not url:
+                return None
+            now = time.time()
+            if len(self._transcodings) > 1000:
+                self._transcodings = {k: v for k, v in self._transcodings.items() if v[1] > now}
+            self._transcodings[transcoding["url"]] = (url, now + SC_TRANSCODING_TTL)
+        fmt = transcoding.get("format") or {}
+        return {
+            "url": url,
+            "bitrate": 128,
+            "duration": round((track.get("full_duration") or track.get("duration") or 0) / 1000),
+            "protocol": fmt.get("protocol", "progressive"),
+        }
+
+    async def find_stream(self, title: str, artist: Optional[str] = None, duration=None) -> Optional[dict]:
+        track = await self.search(title, artist, duration)
+        return await self.stream(track) if track else None
+
+    def stats(self) -> dict:
+        return {
+            "client_id": bool(self._cid and self._cid_expiry > time.time()),
+            "client_id_ttl": max(0, round(self._cid_expiry - time.time())),
+            "refreshes": self.refreshes,
+            "searches": self.searches,
+            "search_hits": self.search_hits,
+            "errors": self.errors,
+        }
@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import urllib.parse
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from cache_backends import CacheBackend
+
+logger = logging.getLogger("VortexMusic")
+
+STREAM_CACHE_MAX_ENTRIES = int(os.getenv("STREAM_CACHE_MAX_ENTRIES", "2000"))
+STREAM_CACHE_MAX_BYTES = int(os.getenv("STREAM_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+STREAM_CACHE_TTL = float(os.getenv("STREAM_CACHE_TTL", "1800"))
+# Stop serving a signed URL this many seconds before the CDN rejects it
+STREAM_CACHE_EXPIRY_MARGIN = float(os.getenv("STREAM_CACHE_EXPIRY_MARGIN", "120"))
+# Fallback streams (a different recording, e.g. SoundCloud) are kept briefly and
+# only in this process, so the next play tries YouTube again
+STREAM_CACHE_FALLBACK_TTL = float(os.getenv("STREAM_CACHE_FALLBACK_TTL", "300"))
+
+
+def ttl_from_url(url: Optional[str], default: float = STREAM_CACHE_TTL) -> float:
+    """Derive a TTL from the `expire=` (YouTube) or `Expires=` (CloudFront) parameter of a signed URL."""
+    if not url:
+        return default
+    try:
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        expire = query.get("expire") or query.get("Expires") or query.get("expires")
+        if not expire:
+            return default
+        return float(expire[0]) - time.time() - STREAM_CACHE_EXPIRY_MARGIN
+    except (ValueError, TypeError):
+        return default
+
+
+def ttl_for(data: dict) -> float:
+    ttl = ttl_from_url(data.get("url"))
+    return min(ttl, STREAM_CACHE_FALLBACK_TTL) if data.get("fallback") else ttl
+
+
+class StreamCache:
+    """Bounded LRU cache of extracted stream info with single-flight loading.
+
+    Entries expire with the signed URL they hold, the cache is capped by both
+    entry count and approximate byte size, and concurrent misses for the same
+    key share one loader task instead of each running its own extraction.
+    With a shared `backend`, misses consult it before loading and loaded
+    values are written back, so other workers and restarts start warm.
+    """
+
+    def __init__(self, max_entries: int = STREAM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = STREAM_CACHE_MAX_BYTES,
+                 backend: Optional[CacheBackend] = None, namespace: str = "stream"):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.namespace = namespace
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.backend_hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not None
+
+    def get(self, key: str, count: bool = True) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            if count: self.misses += 1
+            return None
+        if entry["expiry"] <= time.time():
+            self._remove(key)
+            self.expirations += 1
+            if count: self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        if count: self.hits += 1
+        return entry["data"]
+
+    def set(self, key: str, data: dict, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = ttl_for(data)
+        if ttl <= 0:
+            # URL is already (nearly) expired, caching it would only serve 403s
+            return
+        if key in self._entries:
+            self._remove(key)
+        size = len(json.dumps(data, default=str))
+        self._entries[key] = {"data": data, "expiry": time.time() + ttl, "size": size}
+        self._bytes += size
+        self._evict()
+
+    async def put(self, key: str, data: dict):
+        """Store in memory and write through to the shared backend."""
+        self.set(key, data)
+        if self.backend is not None and not data.get("fallback"):
+            await self.backend.set(f"{self.namespace}:{key}", data, ttl_for(data))
+
+    async def invalidate(self, key: str):
+        """Drop a key everywhere, e.g. when the CDN starts refusing its URL."""
+        self.delete(key)
+        if self.backend is not None:
+            await self.backend.delete(f"{self.namespace}:{key}")
+
+    def expiry(self, key: str) -> Optional[float]:
+        entry = self._entries.get(key)
+        return entry["expiry"] if entry else None
+
+    def delete(self, key: str):
+        if key in self._entries:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry["size"]
+            self.evictions += 1
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        expired = [k for k, v in self._entries.items() if v["expiry"] <= now]
+        for k in expired:
+            self._remove(k)
+        self.expirations += len(expired)
+        return len(expired)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        """Return the cached value or run `loader` once for all concurrent callers."""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+        else:
+            # Run the loader as its own task so a cancelled caller (client
+            # disconnect) doesn't fail everybody else waiting on it.
+            fut = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = fut
+
+            def _done(f, key=key):
+                self._inflight.pop(key, None)
+                if not f.cancelled() and f.exception() is None and f.result():
+                    self.set(key, f.result())
+
+            fut.add_done_callback(_done)
+        return await asyncio.shield(fut)
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        backend_key = f"{self.namespace}:{key}"
+        if self.backend is not None:
+            data = await self.backend.get(backend_key)
+            if data:
+                self.backend_hits += 1
+                return data
+        data = await loader()
+        if data and self.backend is not None and not data.get("fallback"):
+            await self.backend.set(backend_key, data, ttl_for(data))
+        return data
+
+    async def run_expiry_loop(self, interval: float = 60.0):
+        """Background sweep so expired entries don't wait for a lookup to leave."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self.purge_expired()
+                if removed:
+                    logger.info(f"Stream cache expired {removed} entries")
+            except Exception as e:
+                logger.warning(f"Stream cache sweep failed: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "coalesced": self.coalesced,
+            "backend_hits": self.backend_hits,
+            "inflight": len(self._inflight),
+        }
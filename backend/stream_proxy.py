@@ -0,0 +1,279 @@
+import os
+import time
+import logging
+import urllib.parse
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from http_pool import http_pool
+from tracing import start_span
+
+logger = logging.getLogger("VortexMusic")
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(64 * 1024)))
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+# (start, end) with None for an open end; (None, n) is a suffix range "last n bytes"
+ByteRange = Tuple[Optional[int], Optional[int]]
+
+
+class RangeNotSatisfiable(Exception):
+    def __init__(self, size: Optional[int]):
+        super().__init__(f"range not satisfiable (size={size})")
+        self.size = size
+
+
+class UpstreamError(Exception):
+    """The upstream CDN refused or failed the request (expired URL, 403, ...)."""
+
+    def __init__(self, status: Optional[int], message: str = ""):
+        super().__init__(message or f"upstream returned {status}")
+        self.status = status
+
+
+_EXTENSION_TYPES = {".m4a": "audio/mp4", ".mp4": "audio/mp4", ".webm": "audio/webm", ".weba": "audio/webm",
+                    ".mp3": "audio/mpeg", ".ogg": "audio/ogg", ".opus": "audio/ogg", ".aac": "audio/aac"}
+
+
+def media_type_for(url: str, default: str = "audio/mpeg") -> str:
+    """Audio content type of a stream URL, from its `mime=` parameter or extension.
+
+    Used when the upstream's own Content-Type is missing or generic.
+    """
+    parsed = urllib.parse.urlparse(url or "")
+    mime = urllib.parse.parse_qs(parsed.query).get("mime")
+    if mime and mime[0].startswith(("audio/", "video/")):
+        # Audio-only renditions are often labelled video/webm or video/mp4
+        return "audio/" + mime[0].split("/", 1)[1].split(";")[0]
+    return _EXTENSION_TYPES.get(os.path.splitext(parsed.path)[1].lower(), default)
+
+
+def parse_range(header: Optional[str]) -> Optional[ByteRange]:
+    """Parse a single RFC 7233 `bytes=` range.
+
+    Returns None when there is no usable range (absent, another unit,
+    multiple ranges or invalid syntax); the caller then serves the whole
+    representation with 200, as the RFC allows.
+    """
+    if not header:
+        return None
+    unit, _, spec = header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            return None if suffix < 0 else (None, suffix)
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        return None
+    return (start, end)
+
+
+def resolve_range(rng: ByteRange, size: int) -> Tuple[int, int]:
+    """Turn a parsed range into inclusive offsets for a representation of `size` bytes."""
+    start, end = rng
+    if start is None:
+        if end == 0 or size == 0:
+            raise RangeNotSatisfiable(size)
+        return max(0, size - end), size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(size)
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def format_range(rng: ByteRange) -> str:
+    start, end = rng
+    if start is None:
+        return f"bytes=-{end}"
+    return f"bytes={start}-{'' if end is None else end}"
+
+
+def parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """`bytes 0-99/1234` -> (0, 99, 1234); unknown parts are None."""
+    if not value or not value.startswith("bytes "):
+        return None, None, None
+    span, _, total = value[6:].partition("/")
+    size = int(total) if total.isdigit() else None
+    if span == "*":
+        return None, None, size
+    first, _, last = span.partition("-")
+    try:
+        return int(first), int(last), size
+    except ValueError:
+        return None, None, size
+
+
+class SourceStats:
+    def __init__(self):
+        self.requests = 0
+        self.active = 0
+        self.completed = 0
+        self.errors = 0
+        self.bytes_served = 0
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "active": self.active,
+            "completed": self.completed,
+            "errors": self.errors,
+            "bytes_served": self.bytes_served,
+            "throughput_bps": round(self.bytes_served / self.seconds) if self.seconds else None,
+        }
+
+
+class ProxiedStreamResponse(StreamingResponse):
+    """StreamingResponse that always hands the upstream connection back to the pool,
+    even if the client disconnects before the body starts."""
+
+    def __init__(self, content, upstream: aiohttp.ClientResponse, **kwargs):
+        super().__init__(content, **kwargs)
+        self.upstream = upstream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.upstream.release()
+
+
+class StreamProxy:
+    """Range-correct audio proxy over the shared aiohttp pool.
+
+    The client's Range is forwarded upstream and the upstream status,
+    Content-Length and Content-Range are passed back, so seeking is a new
+    ranged request rather than a restarted download. Chunks are yielded as
+    aiohttp hands them over; StreamingResponse awaits each send, so a slow
+    client pauses the upstream read instead of buffering in memory.
+    """
+
+    def __init__(self, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._stats: Dict[str, SourceStats] = {}
+
+    def stats_for(self, source: str) -> SourceStats:
+        if source not in self._stats:
+            self._stats[source] = SourceStats()
+        return self._stats[source]
+
+    async def open(self, url: str, range_header: Optional[str] = None, source: str = "unknown",
+                   media_type: str = "audio/mpeg", headers: Optional[Dict[str, str]] = None) -> Response:
+        """Open `url` upstream and return a response ready to stream to the client.
+
+        Raises UpstreamError if the upstream refuses the request so callers
+        can re-resolve the URL (signed URLs expire).
+        """
+        stats = self.stats_for(source)
+        stats.requests += 1
+        rng = parse_range(range_header)
+        req_headers = {"User-Agent": USER_AGENT}
+        if rng:
+            req_headers["Range"] = format_range(rng)
+
+        try:
+            resp = await http_pool.session().get(url, headers=req_headers)
+        except (aiohttp.ClientError, TimeoutError) as e:
+            stats.errors += 1
+            raise UpstreamError(None, str(e) or type(e).__name__)
+
+        out_headers = {"Accept-Ranges": "bytes", **(headers or {})}
+        if resp.status == 416:
+            _, _, size = parse_content_range(resp.headers.get("Content-Range"))
+            resp.release()
+            out_headers["Content-Range"] = f"bytes */{size}" if size is not None else "bytes */*"
+            return Response(status_code=416, headers=out_headers)
+        if resp.status not in (200, 206):
+            stats.errors += 1
+            resp.release()
+            raise UpstreamError(resp.status)
+
+        content_type = resp.headers.get("Content-Type", "")
+        if not content_type.startswith("audio/"):
+            content_type = media_type
+
+        status = resp.status
+        skip, limit = 0, None
+        length = resp.headers.get("Content-Length")
+        if status == 206:
+            out_headers["Content-Range"] = resp.headers.get("Content-Range", "")
+        elif rng and length and length.isdigit():
+            # Upstream ignored our Range: cut the requested window out ourselves
+            size = int(length)
+            try:
+                start, end = resolve_range(rng, size)
+            except RangeNotSatisfiable:
+                resp.release()
+                out_headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=out_headers)
+            skip, limit = start, end - start + 1
+            status = 206
+            length = str(limit)
+            out_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        if length:
+            out_headers["Content-Length"] = length
+
+        body_span = start_span("stream_proxy.body", source=source, **{"http.status_code": status})
+        return ProxiedStreamResponse(
+            self._iter_body(resp, stats, body_span, skip, limit),
+            upstream=resp,
+            status_code=status,
+            media_type=content_type,
+            headers=out_headers,
+        )
+
+    async def _iter_body(self, resp: aiohttp.ClientResponse, stats: SourceStats, span,
+                         skip: int = 0, limit: Optional[int] = None):
+        stats.active += 1
+        start = time.time()
+        sent = 0
+        try:
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk = chunk[skip:]
+                    skip = 0
+                if limit is not None:
+                    if len(chunk) >= limit:
+                        chunk = chunk[:limit]
+                        limit = 0
+                    else:
+                        limit -= len(chunk)
+                stats.bytes_served += len(chunk)
+                sent += len(chunk)
+                yield chunk
+                if limit == 0:
+                    break
+            stats.completed += 1
+        except Exception as e:
+            stats.errors += 1
+            span.error(e)
+            logger.warning(f"Stream proxy interrupted: {str(e)}")
+            raise
+        finally:
+            stats.active -= 1
+            stats.seconds += time.time() - start
+            resp.release()
+            span.set(bytes=sent)
+            span.end()
+
+    def stats(self) -> dict:
+        return {
+            "chunk_size": self.chunk_size,
+            "sources": {name: s.as_dict() for name, s in self._stats.items()},
+        }
+
+
+stream_proxy = StreamProxy()
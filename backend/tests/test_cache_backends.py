@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import asyncio
+import subprocess
+
+from bench.stubs import RespStub
+from cache_backends import RedisBackend, SQLiteBackend
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_redis_get_set_ttl_delete():
+    async def scenario():
+        stub = RespStub()
+        url = await stub.start()
+        backend = RedisBackend(url)
+        try:
+            assert await backend.get("missing") is None
+            await backend.set("stream:a", {"url": "http://cdn/a", "n": 1}, 60)
+            assert await backend.get("stream:a") == {"url": "http://cdn/a", "n": 1}
+
+            await backend.set("short", "soon gone", 0.05)
+            assert await backend.get("short") == "soon gone"
+            await asyncio.sleep(0.1)
+            assert await backend.get("short") is None
+
+            await backend.delete("stream:a")
+            assert await backend.get("stream:a") is None
+            # A zero TTL is never written
+            await backend.set("never", 1, 0)
+            assert await backend.get("never") is None
+            assert backend.stats()["hits"] == 2
+            assert backend.stats()["errors"] == 0
+        finally:
+            await backend.close()
+            await stub.stop()
+    run(scenario())
+
+
+def test_redis_selects_database_and_authenticates():
+    async def scenario():
+        stub = RespStub(password="secret")
+        await stub.start()
+        port = stub.url.rsplit(":", 1)[1].split("/")[0]
+        db1 = RedisBackend(f"redis://:secret@127.0.0.1:{port}/1")
+        db2 = RedisBackend(f"redis://:secret@127.0.0.1:{port}/2")
+        try:
+            await db1.set("k", "one", 60)
+            await db2.set("k", "two", 60)
+            assert await db1.get("k") == "one"
+            assert await db2.get("k") == "two"
+        finally:
+            await db1.close()
+            await db2.close()
+            await stub.stop()
+    run(scenario())
+
+
+def test_redis_failed_auth_leaves_no_connection():
+    async def scenario():
+        stub = RespStub(password="secret")
+        await stub.start()
+        port = stub.url.rsplit(":", 1)[1].split("/")[0]
+        backend = RedisBackend(f"redis://:wrong@127.0.0.1:{port}/0")
+        try:
+            assert await backend.get("k") is None
+            assert backend.errors == 1
+            assert backend._writer is None
+            # The next command tries AUTH again instead of reusing the refused connection
+            assert await backend.get("k") is None
+            assert stub.commands.get("AUTH") == 2
+            assert "GET" not in stub.commands
+        finally:
+            await backend.close()
+            await stub.stop()
+    run(scenario())
+
+
+def _in_other_process(path: str, code: str) -> str:
+    script = (
+        "import asyncio, json\n"
+        "from cache_backends import SQLiteBackend\n"
+        f"backend = SQLiteBackend({path!r})\n"
+        "async def main():\n"
+        f"    {code}\n"
+        "print(json.dumps(asyncio.run(main())))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=30)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip()
+
+
+def test_sqlite_shared_between_processes(tmp_path):
+    path = str(tmp_path / "cache.db")
+    backend = SQLiteBackend(path)
+
+    # Written by another worker process, read here
+    _in_other_process(path, "return await backend.set('match:1', {'video_id': 'abc'}, 60)")
+    assert run(backend.get("match:1")) == {"video_id": "abc"}
+
+    # Written here, read by another process; TTLs hold across processes too
+    run(backend.set("search:q", [1, 2, 3], 60))
+    run(backend.set("stream:old", "x", 0.05))
+    time.sleep(0.1)
+    assert _in_other_process(path, "return await backend.get('search:q')") == "[1, 2, 3]"
+    assert _in_other_process(path, "return await backend.get('stream:old')") == "null"
+
+    # Deleted in one process, gone in the other
+    _in_other_process(path, "return await backend.delete('search:q')")
+    assert run(backend.get("search:q")) is None
+    assert run(backend.purge_expired()) == 1
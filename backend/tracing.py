@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger("VortexMusic")
+span_logger = logging.getLogger("VortexMusic.trace")
+
+# "" records nothing (trace ids are still issued), "log" writes one JSON line
+# per span, "otlp" posts OTLP/HTTP JSON batches to TRACE_OTLP_ENDPOINT
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "vortex-backend")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2.0"))
+TRACE_BATCH_SIZE = 512
+# Finished spans waiting for export; the oldest are dropped if the exporter falls behind
+TRACE_QUEUE_MAX = int(os.getenv("TRACE_QUEUE_MAX", "10000"))
+
+_KINDS = {"internal": 1, "server": 2, "client": 3}
+_current: ContextVar[Optional["Span"]] = ContextVar("vortex_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return f"{random.getrandbits(nbytes * 8):0{nbytes * 2}x}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span id, sampled) from a W3C `traceparent` header."""
+    parts = (value or "").strip().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    _, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if len(trace_id) != 32 or len(span_id) != 16 or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id.lower(), span_id.lower(), sampled
+
+
+class Span:
+    """One timed operation of a trace, in OpenTelemetry's data model.
+
+    Spans are cheap to create when tracing is off: they still carry ids
+    (so responses can name their trace) but are never queued for export.
+    """
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "recording",
+                 "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], recording: bool,
+                 attributes: Dict):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.recording = recording
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.status = "unset"
+        self.status_message = ""
+
+    def set(self, **attributes):
+        for key, value in attributes.items():
+            if value is not None:
+                self.attributes[key] = value
+
+    def error(self, error):
+        self.status = "error"
+        self.status_message = str(error) or type(error).__name__
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        if error is not None:
+            self.error(error)
+        self.end_ns = time.time_ns()
+        if self.recording:
+            exporter.submit(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.recording else '00'}"
+
+    def as_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(((self.end_ns or time.time_ns()) - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "status_message": self.status_message or None,
+            "attributes": self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[Span] = None,
+               traceparent: Optional[str] = None, **attributes) -> Span:
+    """Start a span without making it current (for work that ends in another callback).
+
+    The parent is `parent`, else the incoming `traceparent`, else the current span;
+    without any of them this starts a new trace, sampled at TRACE_SAMPLE_RATE.
+    """
+    parent = parent or current_span()
+    remote = parse_traceparent(traceparent) if parent is None else None
+    if parent is not None:
+        return Span(name, kind, parent.trace_id, parent.span_id, parent.recording, attributes)
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+        return Span(name, kind, trace_id, parent_id, bool(TRACE_EXPORT) and sampled, attributes)
+    recording = bool(TRACE_EXPORT) and random.random() < TRACE_SAMPLE_RATE
+    return Span(name, kind, _new_id(16), None, recording, attributes)
+
+
+@contextmanager
+def activate(span: Span, end: bool = True):
+    """Make `span` current for the block; exceptions mark it failed."""
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+            span.error(e)
+        else:
+            span.set(cancelled=True)
+        raise
+    finally:
+        _current.reset(token)
+        if end:
+            span.end()
+
+
+def span(name: str, kind: str = "internal", **attributes):
+    """`with span("name", key=value) as s:` times the block as a child of the current span."""
+    return activate(start_span(name, kind, **attributes))
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(s: Span) -> dict:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": _KINDS.get(s.kind, 1),
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.status_message} if s.status == "error" else {"code": 0},
+    }
+    if s.parent_id:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+class SpanExporter:
+    """Buffers finished spans and ships them in batches off the request path."""
+
+    def __init__(self, mode: str = TRACE_EXPORT, endpoint: str = TRACE_OTLP_ENDPOINT):
+        self.mode = mode
+        self.endpoint = endpoint
+        self._queue: deque = deque(maxlen=TRACE_QUEUE_MAX)
+        self._wake: Optional[asyncio.Event] = None
+        self.exported = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, span: Span):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(span)
+        if self._wake is not None and len(self._queue) >= TRACE_BATCH_SIZE:
+            self._wake.set()
+
+    def _batch(self) -> List[Span]:
+        batch = []
+        while self._queue and len(batch) < TRACE_BATCH_SIZE:
+            batch.append(self._queue.popleft())
+        return batch
+
+    async def flush(self, client: Optional[Callable[[], httpx.AsyncClient]] = None):
+        while self._queue:
+            batch = self._batch()
+            if self.mode == "log":
+                for s in batch:
+                    span_logger.info(json.dumps(s.as_dict(), default=str))
+            elif self.mode == "otlp" and client is not None:
+                body = {"resourceSpans": [{
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}
+                    ]},
+                    "scopeSpans": [{"scope": {"name": "vortex"}, "spans": [_otlp_span(s) for s in batch]}],
+                }]}
+                try:
+                    resp = await client().post(self.endpoint, json=body, timeout=5.0)
+                    if resp.status_code >= 400:
+                        raise RuntimeError(f"collector returned {resp.status_code}")
+                except Exception as e:
+                    self.errors += 1
+                    self.dropped += len(batch)
+                    logger.warning(f"Trace export of {len(batch)} spans failed: {str(e)}")
+                    continue
+            self.exported += len(batch)
+
+    async def run_export_loop(self, client: Optional[Callable[[], httpx.AsyncClient]] = None):
+        """Flush every TRACE_EXPORT_INTERVAL, or sooner once a full batch is waiting."""
+        self._wake = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=TRACE_EXPORT_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush(client)
+        finally:
+            # Shutdown: whatever is still buffered goes out in this final pass
+            await self.flush(client)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode or "off",
+            "sample_rate": TRACE_SAMPLE_RATE,
+            "queued": len(self._queue),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+exporter = SpanExporter()
@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache_backends import CacheBackend
+from search_cache import normalize_query
+from tracing import span as trace_span
+
+logger = logging.getLogger("VortexMusic")
+
+# Catalog ids rarely move to another video; re-check now and then anyway
+MATCH_TTL = float(os.getenv("MATCH_TTL", str(30 * 24 * 3600)))
+# "No acceptable YouTube version" is retried sooner, catalogs fill in
+MATCH_NEGATIVE_TTL = float(os.getenv("MATCH_NEGATIVE_TTL", str(6 * 3600)))
+MATCH_MIN_SCORE = float(os.getenv("MATCH_MIN_SCORE", "0.6"))
+MATCH_CANDIDATES = int(os.getenv("MATCH_CANDIDATES", "5"))
+MATCH_MEMORY_ENTRIES = 10000
+
+# "(feat. X)", "[From "Movie"]", "- Remastered 2011", ... carry no identity
+_NOISE = re.compile(r"[\(\[][^\)\]]*[\)\]]|\s-\s.*$|\bfeat\.?\s.*$|\bft\.?\s.*$")
+_ARTIST_SPLIT = re.compile(r"\s*(?:,|&|\band\b|\bx\b|\bfeat\.?|\bft\.?)\s*")
+
+
+def is_duration_match(meta_duration, stream_duration, log: bool = True):
+    """Verify if the audio duration matches the metadata within a reasonable threshold."""
+    if not meta_duration or not stream_duration:
+        return True # Can't verify, trust but trace
+
+    try:
+        # Convert both to float
+        m_dur = float(meta_duration)
+        s_dur = float(stream_duration)
+
+        # Threshold: 15% or 30 seconds, whichever is smaller
+        threshold = min(m_dur * 0.15, 30.0)
+        diff = abs(m_dur - s_dur)
+
+        if diff <= threshold:
+            return True
+        if log:
+            logger.warning(f"Duration mismatch: Meta={m_dur}s vs Stream={s_dur}s (Diff={diff}s)")
+        return False
+    except:
+        return True
+
+
+def clean_title(title: str) -> str:
+    return normalize_query(_NOISE.sub("", title or "")) or normalize_query(title)
+
+
+def split_artists(artists: str) -> List[str]:
+    return [a for a in (normalize_query(p) for p in _ARTIST_SPLIT.split(artists or "")) if a]
+
+
+def score_candidate(title: str, artist: str, candidate: dict) -> float:
+    """0..1 similarity of a ytmusic search result to the catalog track."""
+    want_title = clean_title(title)
+    got_title = clean_title(candidate.get("title") or "")
+    title_score = SequenceMatcher(None, want_title, got_title).ratio()
+    if want_title and (want_title in got_title or got_title in want_title):
+        title_score = max(title_score, 0.9)
+
+    want_artists = split_artists(artist)
+    got_artists = [normalize_query(a.get("name")) for a in candidate.get("artists") or [] if a.get("name")]
+    if not want_artists or not got_artists:
+        artist_score = 0.5
+    else:
+        artist_score = max(
+            SequenceMatcher(None, w, g).ratio() for w in want_artists for g in got_artists
+        )
+    return 0.65 * title_score + 0.35 * artist_score
+
+
+def pick_best(title: str, artist: str, duration, candidates: List[dict]) -> Optional[dict]:
+    """Best-scoring candidate above MATCH_MIN_SCORE whose duration fits."""
+    best, best_score = None, MATCH_MIN_SCORE
+    for candidate in candidates:
+        if not candidate.get("videoId"):
+            continue
+        if not is_duration_match(duration, candidate.get("duration_seconds"), log=False):
+            continue
+        score = score_candidate(title, artist, candidate)
+        if score >= best_score:
+            best, best_score = candidate, score
+    if best is not None:
+        best = {**best, "score": round(best_score, 3)}
+    return best
+
+
+class TrackMatcher:
+    """Persistent catalog id (Saavn/Deezer) -> YouTube videoId index.
+
+    The first lookup for a track searches YouTube Music, scores several
+    candidates by normalized title/artist similarity and duration, and
+    stores the winner (or the absence of one) in memory and in the shared
+    cache backend, so later plays skip the search entirely.
+    """
+
+    def __init__(self, search: Callable[[str], Awaitable[List[dict]]], backend: Optional[CacheBackend] = None):
+        self.search = search
+        self.backend = backend
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.matched = 0
+        self.unmatched = 0
+        self.errors = 0
+
+    def _remember(self, track_id: str, entry: dict):
+        self._entries[track_id] = entry
+        self._entries.move_to_end(track_id)
+        while len(self._entries) > MATCH_MEMORY_ENTRIES:
+            self._entries.popitem(last=False)
+
+    async def lookup(self, track_id: str) -> Optional[dict]:
+        """Cached mapping entry ({"video_id": str|None, ...}) or None if never looked up."""
+        entry = self._entries.get(track_id)
+        if entry is not None:
+            ttl = MATCH_TTL if entry["video_id"] else MATCH_NEGATIVE_TTL
+            if time.time() - entry["matched_at"] <= ttl:
+                self._entries.move_to_end(track_id)
+                return entry
+            del self._entries[track_id]
+        if self.backend is not None:
+            entry = await self.backend.get(f"match:{track_id}")
+            if entry:
+                self._remember(track_id, entry)
+                return entry
+        return None
+
+    async def match(self, track_id: str, title: Optional[str], artist: Optional[str],
+                    duration=None) -> Optional[str]:
+        """YouTube videoId for a catalog track, or None if there's no trustworthy match."""
+        with trace_span("match", track_id=track_id) as span:
+            entry = await self.lookup(track_id)
+            if entry is not None:
+                self.hits += 1
+                span.set(cached=True, video_id=entry["video_id"])
+                return entry["video_id"]
+            if not title:
+                return None
+            self.misses += 1
+
+            fut = self._inflight.get(track_id)
+            if fut is None:
+                fut = asyncio.ensure_future(self._match(track_id, title, artist or "", duration))
+                self._inflight[track_id] = fut
+                fut.add_done_callback(lambda f: self._inflight.pop(track_id, None))
+            video_id = await asyncio.shield(fut)
+            span.set(cached=False, video_id=video_id)
+            return video_id
+
+    async def _match(self, track_id: str, title: str, artist: str, duration) -> Optional[str]:
+        try:
+            candidates = await self.search(f"{title} {artist}".strip())
+        except Exception as e:
+            # Search outage: don't negative-cache, just answer "unknown" this time
+            self.errors += 1
+            logger.warning(f"Track match search failed for {track_id}: {str(e)}")
+            return None
+
+        best = pick_best(title, artist, duration, (candidates or [])[:MATCH_CANDIDATES])
+        entry = {
+            "video_id": best["videoId"] if best else None,
+            "score": best["score"] if best else None,
+            "matched_at": time.time(),
+        }
+        if best:
+            self.matched += 1
+        else:
+            self.unmatched += 1
+            logger.info(f"No YouTube match for {track_id} ({title} - {artist})")
+        self._remember(track_id, entry)
+        if self.backend is not None:
+            await self.backend.set(
+                f"match:{track_id}", entry, MATCH_TTL if best else MATCH_NEGATIVE_TTL
+            )
+        return entry["video_id"]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "matched": self.matched,
+            "unmatched": self.unmatched,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+        }
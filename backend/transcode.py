@@ -0,0 +1,376 @@
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional
+
+import aiohttp
+from fastapi import Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from http_pool import http_pool
+from segment_cache import CleanupStreamingResponse
+from stream_proxy import USER_AGENT, UpstreamError
+from tracing import start_span
+
+logger = logging.getLogger("VortexMusic")
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+TRANSCODE_DIR = os.getenv(
+    "TRANSCODE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcodes"),
+)
+TRANSCODE_CACHE_MAX_BYTES = int(os.getenv("TRANSCODE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# ffmpeg processes running at once; each one keeps roughly a core busy
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+# How long a request waits for a free worker before it gets the original instead
+TRANSCODE_QUEUE_TIMEOUT = float(os.getenv("TRANSCODE_QUEUE_TIMEOUT", "3"))
+TRANSCODE_CODEC = os.getenv("TRANSCODE_CODEC", "aac")
+TRANSCODE_BITRATES = (64, 96, 160, 320)
+TRANSCODE_NAMED = {"low": 64, "medium": 96, "high": 160, "max": 320}
+# quality=auto targets at most 1/headroom of the client's measured throughput
+TRANSCODE_HEADROOM = float(os.getenv("TRANSCODE_HEADROOM", "2.0"))
+TRANSCODE_AUTO_DEFAULT = int(os.getenv("TRANSCODE_AUTO_DEFAULT", "160"))
+READ_CHUNK_SIZE = 64 * 1024
+
+# codec -> (ffmpeg output args, content type, file extension)
+CODECS = {
+    "aac": (["-c:a", "aac", "-f", "adts"], "audio/aac", ".aac"),
+    "opus": (["-c:a", "libopus", "-f", "ogg"], "audio/ogg", ".opus"),
+}
+
+
+class TranscodeBusy(Exception):
+    """Every ffmpeg worker stayed busy for TRANSCODE_QUEUE_TIMEOUT."""
+
+
+def parse_quality(quality: Optional[str]) -> Optional[str]:
+    """Normalize the `quality` parameter: None (original), "auto" or a bitrate string."""
+    if quality is None or quality in ("", "original"):
+        return None
+    if quality == "auto":
+        return quality
+    if quality in TRANSCODE_NAMED:
+        return str(TRANSCODE_NAMED[quality])
+    if quality.isdigit() and int(quality) in TRANSCODE_BITRATES:
+        return quality
+    raise ValueError(f"quality must be original, auto, {', '.join(TRANSCODE_NAMED)} or one of {TRANSCODE_BITRATES}")
+
+
+class ThroughputTracker:
+    """Delivery rate per client, from how fast recent /stream bodies were consumed.
+
+    StreamingResponse awaits every send, so once a body is much larger
+    than the socket buffers, its duration is set by the slower of the
+    upstream and the client's link. Samples are smoothed with an EWMA.
+    """
+
+    MIN_SAMPLE_BYTES = 512 * 1024
+    MAX_CLIENTS = 10000
+
+    def __init__(self, alpha: float = 0.3, ttl: float = 1800.0):
+        self.alpha = alpha
+        self.ttl = ttl
+        # client -> (kbps, updated_at)
+        self._rates: Dict[str, tuple] = {}
+
+    def record(self, client: str, nbytes: int, seconds: float):
+        if nbytes < self.MIN_SAMPLE_BYTES or seconds <= 0:
+            return
+        kbps = nbytes * 8 / 1000 / seconds
+        previous = self.kbps(client)
+        self._rates[client] = (kbps if previous is None else previous + self.alpha * (kbps - previous), time.time())
+        if len(self._rates) > self.MAX_CLIENTS:
+            cutoff = time.time() - self.ttl
+            self._rates = {c: v for c, v in self._rates.items() if v[1] > cutoff}
+
+    def kbps(self, client: str) -> Optional[float]:
+        rate = self._rates.get(client)
+        if rate is None or time.time() - rate[1] > self.ttl:
+            return None
+        return rate[0]
+
+    def measure(self, client: str, body):
+        """Wrap a response body iterator, recording its delivery rate when it ends."""
+        async def metered():
+            sent, started = 0, None
+            try:
+                async for chunk in body:
+                    if started is None:
+                        started = time.perf_counter()
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                if started is not None:
+                    self.record(client, sent, time.perf_counter() - started)
+        return metered()
+
+    def meter(self, client: str, response: Response) -> Response:
+        if isinstance(response, StreamingResponse):
+            response.body_iterator = self.measure(client, response.body_iterator)
+        return response
+
+    def target_bitrate(self, client: str) -> int:
+        """Highest bitrate that leaves TRANSCODE_HEADROOM on the client's measured link."""
+        kbps = self.kbps(client)
+        if kbps is None:
+            return TRANSCODE_AUTO_DEFAULT
+        fitting = [b for b in TRANSCODE_BITRATES if b * TRANSCODE_HEADROOM <= kbps]
+        return fitting[-1] if fitting else TRANSCODE_BITRATES[0]
+
+    def stats(self) -> dict:
+        rates = [r for r, _ in self._rates.values()]
+        return {"clients": len(rates), "median_kbps": round(sorted(rates)[len(rates) // 2]) if rates else None}
+
+
+class _Job:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.part = path + ".part"
+        self.written = 0
+        self.done = False
+        self.error: Optional[str] = None
+        self.readers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._progress = asyncio.Event()
+
+    def notify(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    async def wait(self):
+        await self._progress.wait()
+
+
+class Transcoder:
+    """ffmpeg re-encoding of upstream audio to a target codec and bitrate.
+
+    At most TRANSCODE_WORKERS ffmpeg processes run at once. Output is
+    streamed to the client while it is written to disk; other requests
+    for the same rendition follow the same file, and finished files are
+    served (with Range support) from an LRU disk cache. A rendition
+    nobody is listening to any more is abandoned.
+    """
+
+    def __init__(self, directory: str = TRANSCODE_DIR, max_bytes: int = TRANSCODE_CACHE_MAX_BYTES,
+                 workers: int = TRANSCODE_WORKERS, ffmpeg: Optional[str] = FFMPEG_PATH):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ffmpeg = ffmpeg
+        self.workers = workers
+        self._slots = asyncio.Semaphore(workers)
+        self._jobs: Dict[str, _Job] = {}
+        # file name -> [size, last_access]
+        self._files: Dict[str, list] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.completed = 0
+        self.abandoned = 0
+        self.failures = 0
+        self.busy = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.ffmpeg)
+
+    def _load(self):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            self._files[name] = [st.st_size, st.st_mtime]
+            self._bytes += st.st_size
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        for name, (size, _) in sorted(self._files.items(), key=lambda kv: kv[1][1]):
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            del self._files[name]
+            self._bytes -= size
+            self.evictions += 1
+
+    async def _check_upstream(self, url: str):
+        """One-byte probe so a refused (expired) URL surfaces as UpstreamError before ffmpeg starts."""
+        try:
+            async with http_pool.session().get(
+                url, headers={"User-Agent": USER_AGENT, "Range": "bytes=0-0"}
+            ) as resp:
+                if resp.status not in (200, 206):
+                    raise UpstreamError(resp.status)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise UpstreamError(None, str(e) or type(e).__name__)
+
+    async def serve(self, key: str, url: str, codec: str, bitrate: int, source: str = "unknown",
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+        """`key`'s audio from `url` re-encoded as `codec` at `bitrate` kbps.
+
+        Raises TranscodeBusy when no worker frees up in time (callers serve
+        the original instead) and UpstreamError when the URL is refused.
+        """
+        args, media_type, ext = CODECS[codec]
+        name = hashlib.sha1(f"{key}:{codec}:{bitrate}".encode()).hexdigest() + ext
+        out_headers = {"X-Transcode": f"{codec}/{bitrate}", **(headers or {})}
+
+        if name in self._files and os.path.exists(self._path(name)):
+            self.hits += 1
+            self._files[name][1] = time.time()
+            out_headers["X-Transcode-Cache"] = "hit"
+            return FileResponse(self._path(name), media_type=media_type, headers=out_headers)
+
+        job = self._jobs.get(name)
+        if job is not None:
+            self.joined += 1
+        else:
+            self.misses += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=TRANSCODE_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.busy += 1
+                raise TranscodeBusy(f"all {self.workers} transcode workers busy")
+            try:
+                await self._check_upstream(url)
+            except BaseException:
+                self._slots.release()
+                raise
+            # Another request may have started the same rendition meanwhile
+            job = self._jobs.get(name)
+            if job is not None:
+                self._slots.release()
+                self.joined += 1
+            else:
+                job = _Job(name, self._path(name))
+                open(job.part, "wb").close()
+                self._jobs[name] = job
+                span = start_span("transcode", key=key, codec=codec, bitrate=bitrate, source=source)
+                job.task = asyncio.ensure_future(self._run(job, url, args, bitrate, span))
+
+        job.readers += 1
+        out_headers["X-Transcode-Cache"] = "miss"
+        # Length unknown until ffmpeg finishes: no Content-Length, no ranges
+        return CleanupStreamingResponse(
+            self._follow(job),
+            cleanup=lambda: self._detach(job),
+            media_type=media_type,
+            headers=out_headers,
+        )
+
+    async def _run(self, job: _Job, url: str, args, bitrate: int, span):
+        proc = None
+        fd = os.open(job.part, os.O_WRONLY)
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                self.ffmpeg, "-hide_banner", "-loglevel", "error",
+                "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "2",
+                "-user_agent", USER_AGENT, "-i", url,
+                "-vn", "-map", "0:a:0", *args[:2], "-b:a", f"{bitrate}k", *args[2:], "pipe:1",
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            while True:
+                chunk = await proc.stdout.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                os.write(fd, chunk)
+                job.written += len(chunk)
+                job.notify()
+            stderr = await proc.stderr.read()
+            if await proc.wait() != 0 or job.written == 0:
+                raise RuntimeError(stderr.decode(errors="ignore").strip()[-300:] or f"ffmpeg exited {proc.returncode}")
+            os.replace(job.part, job.path)
+            self._files[job.name] = [job.written, time.time()]
+            self._bytes += job.written
+            self.completed += 1
+            self._evict()
+        except asyncio.CancelledError:
+            self.abandoned += 1
+            job.error = "abandoned"
+            span.set(abandoned=True)
+            raise
+        except Exception as e:
+            self.failures += 1
+            job.error = str(e) or type(e).__name__
+            span.error(e)
+            logger.warning(f"Transcode failed for {job.name}: {job.error}")
+        finally:
+            if proc is not None and proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            os.close(fd)
+            if job.error and os.path.exists(job.part):
+                os.remove(job.part)
+            job.done = True
+            job.notify()
+            self._jobs.pop(job.name, None)
+            self._slots.release()
+            span.set(bytes=job.written)
+            span.end()
+
+    async def _follow(self, job: _Job):
+        """Yield the rendition as ffmpeg writes it (the file may be renamed under us; the fd stays valid)."""
+        try:
+            fd = os.open(job.part, os.O_RDONLY)
+        except FileNotFoundError:
+            if job.error:
+                raise RuntimeError(f"transcode failed: {job.error}")
+            fd = os.open(job.path, os.O_RDONLY)
+        pos = 0
+        try:
+            while True:
+                if pos < job.written:
+                    chunk = await asyncio.to_thread(os.pread, fd, min(READ_CHUNK_SIZE * 4, job.written - pos), pos)
+                    pos += len(chunk)
+                    yield chunk
+                elif job.done:
+                    if job.error:
+                        raise RuntimeError(f"transcode failed: {job.error}")
+                    break
+                else:
+                    await job.wait()
+        finally:
+            os.close(fd)
+
+    def _detach(self, job: _Job):
+        job.readers -= 1
+        if job.readers <= 0 and not job.done and job.task is not None:
+            # Nobody is listening any more (skip, seek): free the worker
+            job.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "running": len(self._jobs),
+            "cached_files": len(self._files),
+            "cached_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "joined": self.joined,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "failures": self.failures,
+            "busy": self.busy,
+            "evictions": self.evictions,
+        }
+
+
+transcoder = Transcoder()
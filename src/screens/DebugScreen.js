@@ -3,6 +3,7 @@ import { View, Text, ScrollView, TouchableOpacity, ActivityIndicator, Alert, Sty
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { useSelector } from 'react-redux';
 import { Bug, CheckCircle2, XCircle, RefreshCw, Terminal, Activity, Globe, Wifi } from 'lucide-react-native';
+import { backendHeaders } from '../services/deviceService';
 
 const StatusCard = ({ title, status, details, icon: Icon, color }) => (
     <View style={styles.card}>
@@ -37,7 +38,7 @@ export default function DebugScreen() {
         // 1. Test Ping
         try {
             const start = Date.now();
-            const res = await fetch(`${backendUrl}/ping`, { headers: { 'Bypass-Tunnel-Reminder': 'true' } });
+            const res = await fetch(`${backendUrl}/ping`, { headers: backendHeaders() });
             const end = Date.now();
             if (res.ok) {
                 const data = await res.json();
@@ -54,7 +55,7 @@ export default function DebugScreen() {
 
         // 2. Test YouTube Extraction
         try {
-            const res = await fetch(`${backendUrl}/test-youtube`, { headers: { 'Bypass-Tunnel-Reminder': 'true' } });
+            const res = await fetch(`${backendUrl}/test-youtube`, { headers: backendHeaders() });
             if (res.ok) {
                 const data = await res.json();
                 setYtStatus('ok');
@@ -9,6 +9,7 @@ import { playTrack } from '../services/audioService';
 import { getThumbnailUrl } from '../utils/imageUtils';
 import { fetchStreamWithRetry } from '../services/streamService';
 import { warmupManager } from '../services/warmupService';
+import { backendHeaders } from '../services/deviceService';
 
 const CategoryCard = ({ title, color, onPress }) => (
     <TouchableOpacity
@@ -43,7 +44,7 @@ const SongCard = ({ title, artist, image, onPress }) => (
     <TouchableOpacity className="mr-5 w-40" onPress={onPress}>
         <View className="w-40 h-40 bg-vortex-surface rounded-3xl overflow-hidden mb-3 shadow-2xl border border-white/5">
             <Image
-                source={{ uri: getThumbnailUrl({ thumbnail: image, title, artist }) }}
+                source={{ uri: getThumbnailUrl({ thumbnail: image, title, artist }, 320) }}
                 className="w-full h-full"
                 contentFit="cover"
                 transition={300}
@@ -106,7 +107,7 @@ export default function HomeScreen({ navigation }) {
     const fetchHomeContent = async () => {
         try {
             const response = await fetch(`${backendUrl}/home`, {
-                headers: { 'Bypass-Tunnel-Reminder': 'true' }
+                headers: backendHeaders()
             });
             const data = await response.json();
             setTrending(data.trending || []);
@@ -114,7 +115,7 @@ export default function HomeScreen({ navigation }) {
 
             const artistToSpotlight = data.trending?.[0]?.artist || "Arijit Singh";
             const artistRes = await fetch(`${backendUrl}/artist/${encodeURIComponent(artistToSpotlight)}`, {
-                headers: { 'Bypass-Tunnel-Reminder': 'true' }
+                headers: backendHeaders()
             });
             if (artistRes.ok) {
                 const artistData = await artistRes.json();
@@ -2,8 +2,18 @@ import React, { useState } from 'react';
 import { View, Text, TextInput, Pressable, Alert, ScrollView, StyleSheet, ActivityIndicator } from 'react-native';
 import { SafeAreaView } from 'react-native-safe-area-context';
 import { useDispatch, useSelector } from 'react-redux';
-import { setBackendUrl, setDiscoveryUrl } from '../store/settingsSlice';
+import { setBackendUrl, setDiscoveryUrl, setAudioQuality } from '../store/settingsSlice';
 import { Settings, Globe, Save, Zap, ChevronDown, ChevronUp, PlayCircle, CheckCircle2, XCircle, Bug } from 'lucide-react-native';
+import { backendHeaders } from '../services/deviceService';
+
+// Cycled by tapping the Audio Quality row; passed to /stream as `quality`
+const AUDIO_QUALITIES = [
+    { value: 'original', label: 'Original' },
+    { value: 'auto', label: 'Auto (by connection)' },
+    { value: 'high', label: 'High (160kbps)' },
+    { value: 'medium', label: 'Medium (96kbps)' },
+    { value: 'low', label: 'Data Saver (64kbps)' },
+];
 
 const StreamTester = ({ backendUrl }) => {
     const [videoId, setVideoId] = useState('');
@@ -22,7 +32,7 @@ const StreamTester = ({ backendUrl }) => {
             const testResults = {};
             for (const method of methods) {
                 const res = await fetch(`${backendUrl}/test/stream/${videoId}?method=${method}`, {
-                    headers: { 'Bypass-Tunnel-Reminder': 'true' }
+                    headers: backendHeaders()
                 });
                 testResults[method] = await res.json();
             }
@@ -142,7 +152,7 @@ export default function ProfileScreen() {
         try {
             const start = Date.now();
             const res = await fetch(`${settings.backendUrl}/health`, {
-                headers: { 'Bypass-Tunnel-Reminder': 'true' },
+                headers: backendHeaders(),
                 timeout: 10000
             });
             const end = Date.now();
@@ -181,10 +191,18 @@ export default function ProfileScreen() {
                 <View style={styles.card}>
                     <Text style={styles.cardTitle}>App Preferences</Text>
 
-                    <View style={styles.settingRow}>
+                    <Pressable
+                        style={styles.settingRow}
+                        onPress={() => {
+                            const index = AUDIO_QUALITIES.findIndex(q => q.value === (settings.audioQuality || 'original'));
+                            dispatch(setAudioQuality(AUDIO_QUALITIES[(index + 1) % AUDIO_QUALITIES.length].value));
+                        }}
+                    >
                         <Text style={styles.settingLabel}>Audio Quality</Text>
-                        <Text style={styles.settingValue}>High (320kbps)</Text>
-                    </View>
+                        <Text style={styles.settingValue}>
+                            {(AUDIO_QUALITIES.find(q => q.value === (settings.audioQuality || 'original')) || AUDIO_QUALITIES[0]).label}
+                        </Text>
+                    </Pressable>
 
                     <View style={styles.settingRow}>
                         <Text style={styles.settingLabel}>Backend Status</Text>
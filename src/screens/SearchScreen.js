@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { View, Text, TextInput, FlatList, TouchableOpacity, ActivityIndicator, StyleSheet } from 'react-native';
 import { Image } from 'expo-image';
 import { SafeAreaView } from 'react-native-safe-area-context';
@@ -10,6 +10,9 @@ import { useSelector } from 'react-redux';
 import { getThumbnailUrl } from '../utils/imageUtils';
 import { fetchStreamWithRetry } from '../services/streamService';
 import { warmupManager } from '../services/warmupService';
+import { streamSearch } from '../services/searchService';
+
+const TYPEAHEAD_DELAY_MS = 300;
 
 export default function SearchScreen({ navigation, route }) {
     const backendUrl = useSelector(state => state.settings.backendUrl);
@@ -29,22 +32,47 @@ export default function SearchScreen({ navigation, route }) {
         }
     }, [categoryQuery, directQuery]);
 
+    const activeSearch = useRef(null);
+    const lastSearched = useRef('');
+
+    useEffect(() => () => activeSearch.current?.abort(), []);
+
+    // Type-ahead: search once typing pauses
+    useEffect(() => {
+        const trimmed = query.trim();
+        if (trimmed.length < 2 || trimmed === lastSearched.current) return;
+        const timer = setTimeout(() => handleSearch(trimmed), TYPEAHEAD_DELAY_MS);
+        return () => clearTimeout(timer);
+    }, [query]);
+
     const handleSearch = async (overrideQuery) => {
-        const activeQuery = overrideQuery || query;
-        if (!activeQuery.trim()) return;
+        const activeQuery = (typeof overrideQuery === 'string' ? overrideQuery : query).trim();
+        if (!activeQuery) return;
+        lastSearched.current = activeQuery;
+
+        // A newer query replaces whatever is still streaming
+        activeSearch.current?.abort();
+        const search = streamSearch(backendUrl, activeQuery, (update) => {
+            if (activeSearch.current !== search) return;
+            // Show each provider's results as soon as they land
+            if (update.results?.length || update.done) {
+                setResults(update.results || []);
+                setLoading(false);
+            }
+            if (update.done && update.results?.length) {
+                warmupManager.warmUpTracks(update.results.slice(0, 5));
+            }
+        });
+        activeSearch.current = search;
         setLoading(true);
         try {
-            const response = await fetch(`${backendUrl}/search?q=${encodeURIComponent(activeQuery)}`, {
-                headers: { 'Bypass-Tunnel-Reminder': 'true' }
-            });
-            const data = await response.json();
-            setResults(data);
+            await search.done;
         } catch (error) {
             console.error('Search error:', error);
         } finally {
-            setLoading(false);
-            if (results && results.length > 0) {
-                warmupManager.warmUpTracks(results.slice(0, 5));
+            if (activeSearch.current === search) {
+                activeSearch.current = null;
+                setLoading(false);
             }
         }
     };
@@ -125,7 +153,7 @@ export default function SearchScreen({ navigation, route }) {
                             onPress={() => handlePlay(item, index, results)}
                         >
                             <View className="relative">
-                                <Image source={{ uri: getThumbnailUrl(item) }} className="w-16 h-16 rounded-lg" />
+                                <Image source={{ uri: getThumbnailUrl(item, 128) }} className="w-16 h-16 rounded-lg" />
                                 {item.source && (
                                     <View className="absolute -bottom-1 -right-1 bg-vortex-saffron px-1.5 py-0.5 rounded-md">
                                         <Text className="text-black text-[8px] font-bold uppercase">{item.source}</Text>
@@ -0,0 +1,19 @@
+/**
+ * One id per app launch, sent with every backend call so the backend can
+ * tell devices behind the same address apart (rate limits, search and
+ * queue state). <audio> can't send headers, so stream URLs carry it as
+ * ?device= instead. Image URLs don't: they must stay the same across
+ * launches to keep hitting the image caches.
+ */
+export const DEVICE_ID = `dev-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+
+export const backendHeaders = (extra = {}) => ({
+    'Bypass-Tunnel-Reminder': 'true',
+    'X-Device-Id': DEVICE_ID,
+    ...extra,
+});
+
+export const withDeviceParam = (url) => {
+    if (!url || url.includes('device=')) return url;
+    return `${url}${url.includes('?') ? '&' : '?'}device=${DEVICE_ID}`;
+};
@@ -0,0 +1,53 @@
+import { store } from '../store';
+import { DEVICE_ID, backendHeaders } from './deviceService';
+
+/**
+ * Posts the play queue to the backend so it can keep the upcoming tracks
+ * resolved (and pre-buffered) before the user gets to them.
+ */
+const SYNC_DEBOUNCE_MS = 1000;
+// Only the part of the queue the backend can use
+const SYNC_WINDOW = 10;
+
+let lastQueue = null;
+let lastIndex = -1;
+let timer = null;
+
+const syncQueue = async () => {
+    const state = store.getState();
+    const backendUrl = state.settings.backendUrl;
+    const { queue, currentIndex } = state.player;
+    if (!backendUrl || !queue || queue.length === 0) return;
+
+    const start = Math.max(0, currentIndex);
+    const tracks = queue.slice(start, start + SYNC_WINDOW)
+        .map(t => ({
+            id: t.videoId || t.id,
+            title: t.title,
+            artist: t.artist,
+            enc_url: t.enc_url || t.encrypted_media_url,
+        }))
+        .filter(t => t.id);
+
+    try {
+        await fetch(`${backendUrl}/queue`, {
+            method: 'POST',
+            headers: backendHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({ device_id: DEVICE_ID, tracks, position: 0 }),
+        });
+    } catch (error) {
+        console.log('Queue sync failed:', error.message);
+    }
+};
+
+/**
+ * Start watching the player queue; returns an unsubscribe function.
+ */
+export const startQueueSync = () => store.subscribe(() => {
+    const { queue, currentIndex } = store.getState().player;
+    if (queue === lastQueue && currentIndex === lastIndex) return;
+    lastQueue = queue;
+    lastIndex = currentIndex;
+    clearTimeout(timer);
+    timer = setTimeout(syncQueue, SYNC_DEBOUNCE_MS);
+});
@@ -0,0 +1,43 @@
+import { DEVICE_ID } from './deviceService';
+
+/**
+ * GET /search/stream and hand every NDJSON update to `onUpdate` as it arrives.
+ * Each update carries the merged ranking so far; the last one has `done: true`.
+ * Returns { done, abort }: `done` settles when the stream ends, `abort` stops it
+ * (the backend also drops an older stream when this device starts a newer one).
+ */
+export const streamSearch = (backendUrl, query, onUpdate) => {
+    const xhr = new XMLHttpRequest();
+    let consumed = 0;
+
+    const consume = () => {
+        const text = xhr.responseText || '';
+        const end = text.lastIndexOf('\n') + 1;
+        if (end <= consumed) return;
+        text.slice(consumed, end).split('\n').filter(Boolean).forEach((line) => {
+            try {
+                onUpdate(JSON.parse(line));
+            } catch (e) {
+                console.log('Bad search update:', e.message);
+            }
+        });
+        consumed = end;
+    };
+
+    const done = new Promise((resolve, reject) => {
+        xhr.open('GET', `${backendUrl}/search/stream?q=${encodeURIComponent(query)}`);
+        xhr.setRequestHeader('Bypass-Tunnel-Reminder', 'true');
+        xhr.setRequestHeader('X-Device-Id', DEVICE_ID);
+        xhr.onprogress = consume;
+        xhr.onload = () => {
+            consume();
+            if (xhr.status >= 200 && xhr.status < 300) resolve();
+            else reject(new Error(`Server responded with ${xhr.status}`));
+        };
+        xhr.onerror = () => reject(new Error('Network error'));
+        xhr.onabort = () => resolve();
+        xhr.send();
+    });
+
+    return { done, abort: () => xhr.abort() };
+};
@@ -1,4 +1,18 @@
 import { store } from '../store';
+import { warmupManager } from './warmupService';
+import { backendHeaders, withDeviceParam } from './deviceService';
+
+/**
+ * Ask the backend for the configured transcode quality (stream URLs are built server-side)
+ * and tag the URL with this device, since <audio> can't send headers.
+ */
+const withQuality = (streamData) => {
+    if (!streamData?.stream_url) return streamData;
+    const quality = store.getState().settings.audioQuality;
+    let streamUrl = withDeviceParam(streamData.stream_url);
+    if (quality && quality !== 'original') streamUrl = `${streamUrl}&quality=${quality}`;
+    return { ...streamData, stream_url: streamUrl };
+};
 
 /**
  * Service to handle stream URL fetching with retry logic and 202 status handling.............
@@ -11,11 +25,16 @@ export const fetchStreamWithRetry = async (item, retryAttempt = 0) => {
     if (!backendUrl) throw new Error('Backend URL not configured');
 
     const videoId = item.videoId || item.id;
+
+    // Already resolved by a batch warmup: the stream is cached server-side
+    const warmed = warmupManager.getResolved(videoId);
+    if (warmed) return withQuality(warmed);
+
     const url = `${backendUrl}/stream-info?id=${videoId}&title=${encodeURIComponent(item.title)}&artist=${encodeURIComponent(item.artist)}&duration_total=${item.duration || ''}`;
 
     try {
         const response = await fetch(url, {
-            headers: { 'Bypass-Tunnel-Reminder': 'true' }
+            headers: backendHeaders()
         });
 
         // Handle 202 Accepted (Processing/Waking Up)
@@ -34,7 +53,7 @@ export const fetchStreamWithRetry = async (item, retryAttempt = 0) => {
             throw new Error(errorData.detail || `Server responded with ${response.status}`);
         }
 
-        return await response.json();
+        return withQuality(await response.json());
     } catch (error) {
         console.log(`Stream fetch error (Attempt ${retryAttempt + 1}):`, error.message);
 
@@ -1,4 +1,8 @@
 import { store } from '../store';
+import { DEVICE_ID } from './deviceService';
+
+// Backend stream URLs stay valid well past this; the backend re-extracts if needed
+const RESOLVED_TTL_MS = 30 * 60 * 1000;
 
 /**
  * Service to manage backend warming for Render free tier.
@@ -6,11 +10,14 @@ import { store } from '../store';
 class WarmupManager {
     constructor() {
         this.warmedIds = new Set();
+        this.resolved = new Map();
         this.lastWarmup = 0;
     }
 
     /**
      * Proactively warm up a list of tracks.
+     * Tracks are resolved in list order (queue position first); each result
+     * streams back as it finishes and is kept for `getResolved`.
      * @param {Array} tracks - List of tracks to warm up.
      */
     async warmUpTracks(tracks) {
@@ -24,32 +31,86 @@ class WarmupManager {
         const now = Date.now();
         if (now - this.lastWarmup < 5 * 60 * 1000) return;
 
-        const idsToWarm = tracks
-            .map(t => t.videoId || t.id)
-            .filter(id => id && !this.warmedIds.has(id))
+        const toWarm = tracks
+            .filter(t => (t.videoId || t.id) && !this.warmedIds.has(t.videoId || t.id))
             .slice(0, 10);
 
-        if (idsToWarm.length === 0) return;
+        if (toWarm.length === 0) return;
 
+        console.log(`Warming up ${toWarm.length} tracks...`);
+        this.lastWarmup = now;
         try {
-            console.log(`Warming up ${idsToWarm.length} tracks...`);
-            const idsParam = idsToWarm.join(',');
-            await fetch(`${backendUrl}/warmup?ids=${idsParam}`, {
-                headers: { 'Bypass-Tunnel-Reminder': 'true' }
-            });
-
-            idsToWarm.forEach(id => this.warmedIds.add(id));
-            this.lastWarmup = now;
+            await this.resolveTracks(backendUrl, toWarm.map(t => ({
+                id: t.videoId || t.id,
+                title: t.title,
+                artist: t.artist,
+                enc_url: t.enc_url || t.encrypted_media_url,
+            })));
         } catch (error) {
             console.log('Warmup failed:', error.message);
         }
     }
 
+    /**
+     * POST /resolve and consume its NDJSON stream line by line.
+     */
+    resolveTracks(backendUrl, tracks) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            let consumed = 0;
+
+            const consume = () => {
+                const text = xhr.responseText || '';
+                const end = text.lastIndexOf('\n') + 1;
+                if (end <= consumed) return;
+                text.slice(consumed, end).split('\n').filter(Boolean).forEach((line) => {
+                    try {
+                        const record = JSON.parse(line);
+                        this.warmedIds.add(record.id);
+                        if (record.ok && record.result) {
+                            this.resolved.set(record.id, { info: record.result, at: Date.now() });
+                        }
+                    } catch (e) {
+                        console.log('Bad resolve record:', e.message);
+                    }
+                });
+                consumed = end;
+            };
+
+            xhr.open('POST', `${backendUrl}/resolve`);
+            xhr.setRequestHeader('Content-Type', 'application/json');
+            xhr.setRequestHeader('Bypass-Tunnel-Reminder', 'true');
+            xhr.setRequestHeader('X-Device-Id', DEVICE_ID);
+            xhr.onprogress = consume;
+            xhr.onload = () => {
+                consume();
+                if (xhr.status >= 200 && xhr.status < 300) resolve();
+                else reject(new Error(`Server responded with ${xhr.status}`));
+            };
+            xhr.onerror = () => reject(new Error('Network error'));
+            xhr.send(JSON.stringify({ tracks }));
+        });
+    }
+
+    /**
+     * Stream info resolved by a previous warmup, if still fresh.
+     */
+    getResolved(id) {
+        const entry = this.resolved.get(id);
+        if (!entry) return null;
+        if (Date.now() - entry.at > RESOLVED_TTL_MS) {
+            this.resolved.delete(id);
+            return null;
+        }
+        return entry.info;
+    }
+
     /**
      * Reset warmed IDs (e.g. on cache clear).
      */
     reset() {
         this.warmedIds.clear();
+        this.resolved.clear();
         this.lastWarmup = 0;
     }
 }
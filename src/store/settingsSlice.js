@@ -3,6 +3,8 @@ import { createSlice } from '@reduxjs/toolkit';
 const initialState = {
     backendUrl: 'https://yashufy.onrender.com', // Updated to latest live instance
     discoveryUrl: '',
+    // 'original' streams the source as is; anything else asks the backend to transcode
+    audioQuality: 'original',
 };
 
 const settingsSlice = createSlice({
@@ -15,8 +17,11 @@ const settingsSlice = createSlice({
         setDiscoveryUrl: (state, action) => {
             state.discoveryUrl = action.payload;
         },
+        setAudioQuality: (state, action) => {
+            state.audioQuality = action.payload;
+        },
     },
 });
 
-export const { setBackendUrl, setDiscoveryUrl } = settingsSlice.actions;
+export const { setBackendUrl, setDiscoveryUrl, setAudioQuality } = settingsSlice.actions;
 export default settingsSlice.reducer;
@@ -2,8 +2,10 @@ import { store } from '../store';
 
 /**
  * Utility for handling thumbnail URLs with multiple robust fallbacks.
+ * Pass `size` (px) for list thumbnails so the backend serves a small
+ * WebP/AVIF variant instead of the full artwork.
  */
-export const getThumbnailUrl = (song) => {
+export const getThumbnailUrl = (song, size) => {
     if (!song) return 'https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500';
 
     const state = store.getState();
@@ -24,9 +26,16 @@ export const getThumbnailUrl = (song) => {
     // Find the first valid URL
     const rawUrl = fallbacks.find(url => url && typeof url === 'string' && url.trim() !== '');
 
+    const variant = size ? `&w=${size}&h=${size}&format=auto` : '';
+
+    // Already routed through our proxy: just ask for the right variant
+    if (rawUrl && backendUrl && rawUrl.startsWith(`${backendUrl}/proxy-image?`)) {
+        return rawUrl.includes('&w=') ? rawUrl : `${rawUrl}${variant}`;
+    }
+
     // Proxy through backend if possible for maximum reliability
     if (rawUrl && backendUrl && !rawUrl.includes(backendUrl)) {
-        return `${backendUrl}/proxy-image?url=${encodeURIComponent(rawUrl)}`;
+        return `${backendUrl}/proxy-image?url=${encodeURIComponent(rawUrl)}${variant}`;
     }
 
     return rawUrl || 'https://images.unsplash.com/photo-1614613535308-eb5fbd3d2c17?w=500';